@@ -0,0 +1,65 @@
+"""
+Insert and load times of the quote store for multi-year, minute-level price data.
+
+Quotes are upserted in bulk into a fresh database, then upserted again to measure
+the cost of deduplication, and finally each token's history is loaded back, whole
+and as the window of the last 2000 quotes a simulation reads. Checking the
+coverage of every token, as done at startup, is timed last.
+
+    python -m benchmarks.bench_quotes --years 2 --tokens bitcoin ethereum dai
+"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+from palantir.db import drop_all, quote_coverage, read_quotes, upsert_quotes
+from palantir.types import Currency
+
+
+MINUTES_IN_A_YEAR = 365 * 24 * 60
+
+
+def make_quotes(minutes: int, seed: int):
+    timestamps = 1_500_000_000_000 + 60_000 * np.arange(minutes, dtype=np.int64)
+    prices = 1000.0 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0, 1e-3, minutes)))
+    return zip(timestamps.tolist(), prices.tolist())
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--tokens", nargs="+", default=["bitcoin", "ethereum", "dai"])
+    args = parser.parse_args()
+
+    minutes = int(args.years * MINUTES_IN_A_YEAR)
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'quotes.db')}"
+
+    print(f"{'token':>10} {'rows':>10} {'insert s':>10} {'re-upsert s':>12} {'load s':>8} {'last 2000 ms':>13}")
+    for seed, token in enumerate(args.tokens):
+        start = time.perf_counter()
+        upsert_quotes(Currency(token), Currency("usd"), make_quotes(minutes, seed), url)
+        inserted = time.perf_counter()
+        upsert_quotes(Currency(token), Currency("usd"), make_quotes(minutes, seed), url)
+        upserted = time.perf_counter()
+        timestamps, _ = read_quotes(Currency(token), url=url)
+        loaded = time.perf_counter()
+        read_quotes(Currency(token), last=2000, url=url)
+        end = time.perf_counter()
+
+        assert len(timestamps) == minutes
+        print(
+            f"{token:>10} {minutes:>10} {inserted - start:>10.2f} "
+            f"{upserted - inserted:>12.2f} {loaded - upserted:>8.2f} {(end - loaded) * 1e3:>13.2f}"
+        )
+
+    start = time.perf_counter()
+    quote_coverage([Currency(token) for token in args.tokens], url=url)
+    print(f"coverage of {len(args.tokens)} tokens: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    drop_all(url)
+
+
+if __name__ == "__main__":
+    main()
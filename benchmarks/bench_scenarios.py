@@ -0,0 +1,62 @@
+"""
+Throughput of the synthetic price-path generators and of the block bootstrap.
+
+Paths are generated in chunks, as a Monte Carlo run would, from a model calibrated on, or
+resampled from, a synthetic history so that no quote database is needed.
+
+    python -m benchmarks.bench_scenarios --paths 1000 --periods 10000 --chunk 100
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from palantir.scenarios import (
+    GBM,
+    JUMP_DIFFUSION,
+    REGIME_SWITCHING,
+    BlockBootstrap,
+    calibrate,
+    generate_paths,
+)
+from palantir.types import Currency
+
+
+CURRENCIES = [Currency("bitcoin"), Currency("ethereum"), Currency("dai")]
+
+
+def make_history(periods: int, generator: np.random.Generator) -> np.ndarray:
+    log_returns = generator.standard_t(3, (periods, len(CURRENCIES))) * np.array([0.01, 0.015, 0.0005])
+    return np.array([40000.0, 3000.0, 1.0]) * np.exp(np.cumsum(log_returns, axis=0))
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--paths", type=int, default=1000)
+    parser.add_argument("--periods", type=int, default=10000)
+    parser.add_argument("--chunk", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(args.seed)
+    history = make_history(20000, generator)
+    model = calibrate(CURRENCIES, history)
+    bootstrap = BlockBootstrap(CURRENCIES, history)
+
+    print(f"{'model':>18} {'seconds':>10} {'paths/s':>10} {'M prices/s':>12}")
+    for kind in [GBM, JUMP_DIFFUSION, REGIME_SWITCHING, "bootstrap"]:
+        start = time.perf_counter()
+        if kind == "bootstrap":
+            for _ in bootstrap.iter_paths(generator, args.paths, args.periods, args.chunk):
+                pass
+        else:
+            for first in range(0, args.paths, args.chunk):
+                generate_paths(model, kind, min(args.chunk, args.paths - first), args.periods, generator)
+        elapsed = time.perf_counter() - start
+
+        prices = args.paths * args.periods * len(CURRENCIES)
+        print(f"{kind:>18} {elapsed:>10.2f} {args.paths / elapsed:>10.1f} {prices / elapsed / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Per-tick cost of a simulation as the number of traders grows.
+
+With per-owner position lookups the cost of a tick should grow linearly with the
+number of traders, i.e. the time per trader per tick should stay flat. With --event-driven
+traders only run at the ticks they open or close a position, and with --pool the traders
+are a single vectorized `TraderPool`.
+
+    python -m benchmarks.bench_traders --traders 10 100 1000 --periods 50 [--event-driven | --pool]
+"""
+import math
+import random
+import time
+from argparse import ArgumentParser
+from typing import List
+
+import numpy as np
+
+from palantir.randomness import RandomStream
+from palantir.simulation import Simulation
+from palantir.trader import Trader
+from palantir.trader_pool import TraderPool
+from palantir.types import Account, Currency
+from tests.helpers import make_ithil
+
+
+TOKENS = [
+    Currency("bitcoin"),
+    Currency("dai"),
+    Currency("ethereum"),
+]
+
+
+INITIAL_PRICES = {
+    Currency("bitcoin"): 40000.0,
+    Currency("dai"): 1.0,
+    Currency("ethereum"): 3000.0,
+}
+
+
+def make_prices(token: Currency, periods: int) -> List[float]:
+    price = INITIAL_PRICES[token]
+    prices = []
+    for _ in range(periods):
+        prices.append(price)
+        price *= math.exp(random.gauss(0.0, 0.01))
+    return prices
+
+
+def build_simulation(
+    traders_number: int, periods: int, random_stream: RandomStream, event_driven: bool = False, pool: bool = False
+) -> Simulation:
+    ithil = make_ithil(
+        prices={token: make_prices(token, periods) for token in TOKENS},
+        vaults={token: 1e12 / INITIAL_PRICES[token] for token in TOKENS},
+    )
+    if pool:
+        trader_pool = TraderPool(
+            accounts=[Account(f"trader-{n}") for n in range(traders_number)],
+            ithil=ithil,
+            liquidity=np.full(len(TOKENS), 1e9),
+            open_position_probability=0.1,
+            close_position_probability=0.01,
+            draw_collateral_usd=lambda generator, traders: np.full(len(traders), 100.0),
+            draw_leverage=lambda generator, traders: generator.uniform(1.0, 10.0, len(traders)),
+            random_stream=random_stream,
+        )
+        return Simulation(clock=ithil.clock, ithil=ithil, traders=[], trader_pool=trader_pool)
+
+    traders = [
+        Trader(
+            account=Account(f"trader-{n}"),
+            open_position_probability=0.1,
+            close_position_probability=0.01,
+            ithil=ithil,
+            calculate_collateral_usd=lambda oracle, token: 100.0 / oracle.get_price(token),
+            calculate_leverage=lambda: random_stream.uniform(1.0, 10.0),
+            liquidity={token: 1e9 for token in TOKENS},
+            random_stream=random_stream,
+        )
+        for n in range(traders_number)
+    ]
+    return Simulation(clock=ithil.clock, ithil=ithil, traders=traders, event_driven=event_driven)
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--traders", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--periods", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--event-driven", action="store_true")
+    parser.add_argument("--pool", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'traders':>8} {'ms/tick':>10} {'us/trader/tick':>16} {'open positions':>16}")
+    for traders_number in args.traders:
+        random.seed(args.seed)
+        simulation = build_simulation(
+            traders_number, args.periods, RandomStream(args.seed), args.event_driven, args.pool
+        )
+
+        start = time.perf_counter()
+        simulation.run()
+        elapsed = time.perf_counter() - start
+
+        per_tick = elapsed / args.periods
+        print(
+            f"{traders_number:>8} {per_tick * 1e3:>10.3f} "
+            f"{per_tick / traders_number * 1e6:>16.2f} "
+            f"{len(simulation.ithil.active_positions):>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from palantir.constants import SECONDS_IN_A_DAY, SECONDS_IN_AN_HOUR
+from palantir.db import USD, quote_coverage, read_quotes
+from palantir.types import Currency, Timestamp
+
+
+# Grid intervals, in seconds
+FIVE_MINUTES = 5 * 60
+HOURLY = SECONDS_IN_AN_HOUR
+DAILY = SECONDS_IN_A_DAY
+
+FFILL = "ffill"
+LINEAR = "linear"
+
+
+class AlignedPrices:
+    """
+    Prices of several currencies resampled onto the same uniform grid of timestamps (in
+    milliseconds, as stored), so that a row refers to the same time for every currency.
+    `gaps` flags the prices that were filled in further than `max_gap` from any quote.
+    """
+    timestamps: np.ndarray
+    currencies: List[Currency]
+    prices: np.ndarray
+    gaps: np.ndarray
+
+    def __init__(self, timestamps: np.ndarray, currencies: Sequence[Currency], prices: np.ndarray, gaps: np.ndarray):
+        self.timestamps = timestamps
+        self.currencies = list(currencies)
+        self.prices = prices
+        self.gaps = gaps
+
+    @property
+    def periods(self) -> int:
+        return len(self.timestamps)
+
+    def log_gaps(self) -> None:
+        """
+        Warns about the currencies with filled in prices, which do not move in the gaps.
+        """
+        for currency, count in zip(self.currencies, self.gaps.sum(axis=0).tolist()):
+            if count:
+                logging.warning(f"{currency} has no quotes for {count} of the {self.periods} aligned prices")
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                timestamps=self.timestamps,
+                currencies=np.array(self.currencies),
+                prices=self.prices,
+                gaps=self.gaps,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "AlignedPrices":
+        with np.load(path) as data:
+            return cls(
+                timestamps=data["timestamps"],
+                currencies=[Currency(str(currency)) for currency in data["currencies"]],
+                prices=data["prices"],
+                gaps=data["gaps"],
+            )
+
+
+def make_grid(start: Timestamp, end: Timestamp, interval: int) -> np.ndarray:
+    """
+    Returns the timestamps in milliseconds every `interval` seconds from `start` to `end` included,
+    both in milliseconds.
+    """
+    return np.arange(start, end + 1, interval * 1000, dtype=np.int64)
+
+
+def resample(
+    timestamps: np.ndarray,
+    prices: np.ndarray,
+    grid: np.ndarray,
+    method: str = FFILL,
+    max_gap: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resamples prices quoted at sorted `timestamps` onto the `grid`, by carrying the last quote
+    forward or by interpolating linearly between quotes. Grid points before the first quote
+    take its price. Returns the prices and a mask of the points whose closest earlier quote,
+    or later quote before the first one, is more than `max_gap` milliseconds away.
+    """
+    assert len(timestamps) > 0, "Cannot resample an empty series"
+    assert method in (FFILL, LINEAR), f"Unknown resampling method {method}"
+
+    previous = np.searchsorted(timestamps, grid, side="right") - 1
+    before_first = previous < 0
+    previous = np.maximum(previous, 0)
+
+    if method == FFILL:
+        values = prices[previous]
+    else:
+        values = np.interp(grid, timestamps, prices)
+
+    distance = np.where(before_first, timestamps[0] - grid, grid - timestamps[previous])
+    gaps = distance > max_gap if max_gap is not None else np.zeros(len(grid), dtype=bool)
+
+    return values, gaps
+
+
+def align_quotes(
+    quotes: Dict[Currency, Tuple[np.ndarray, np.ndarray]],
+    grid: np.ndarray,
+    method: str = FFILL,
+    max_gap: Optional[int] = None,
+) -> AlignedPrices:
+    """
+    Resamples the (timestamps, prices) quotes of every currency onto the same grid.
+    """
+    currencies = list(quotes)
+    prices = np.empty((len(grid), len(currencies)), dtype=np.float64)
+    gaps = np.empty((len(grid), len(currencies)), dtype=bool)
+    for column, currency in enumerate(currencies):
+        timestamps, currency_prices = quotes[currency]
+        prices[:, column], gaps[:, column] = resample(timestamps, currency_prices, grid, method, max_gap)
+
+    return AlignedPrices(timestamps=grid, currencies=currencies, prices=prices, gaps=gaps)
+
+
+def load_aligned_prices(
+    tokens: Sequence[Currency],
+    periods: int,
+    interval: int = HOURLY,
+    method: str = FFILL,
+    vs_currency: Currency = USD,
+    url: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+) -> AlignedPrices:
+    """
+    Returns the last `periods` prices of every token on a grid every `interval` seconds,
+    ending at the latest time every token has a quote for. Gaps are quotes missing for
+    more than two intervals, and are logged.
+    If `cache_dir` is given the aligned prices are cached there, and they are read back as
+    long as the quotes stored for the tokens do not change: the cache key includes their
+    number, time range and sum of prices, so replaced prices invalidate it too.
+    """
+    coverage = quote_coverage(tokens, vs_currency, url)
+    assert all(coverage[token].count > 0 for token in tokens), "Every token needs quotes to be aligned"
+
+    step = interval * 1000
+    end = min(coverage[token].last for token in tokens) // step * step
+    start = end - (periods - 1) * step
+    max_gap = 2 * step
+
+    cache_path = None
+    if cache_dir is not None:
+        key = json.dumps(
+            [list(tokens), periods, interval, method, vs_currency, [list(coverage[token]) for token in tokens]]
+        )
+        cache_path = os.path.join(cache_dir, f"aligned-{hashlib.sha1(key.encode()).hexdigest()}.npz")
+        if os.path.exists(cache_path):
+            aligned = AlignedPrices.load(cache_path)
+            aligned.log_gaps()
+            return aligned
+
+    # Quotes up to a gap before the start are read too, so that the first points can be filled
+    quotes = {token: read_quotes(token, vs_currency, start=start - max_gap, end=end + 1, url=url) for token in tokens}
+    for token, (timestamps, _) in quotes.items():
+        if len(timestamps) == 0:
+            quotes[token] = read_quotes(token, vs_currency, last=1, url=url)
+
+    aligned = align_quotes(quotes, make_grid(start, end, interval), method, max_gap)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = f"{cache_path}.tmp"
+        aligned.save(temporary_path)
+        os.replace(temporary_path, cache_path)
+
+    aligned.log_gaps()
+    return aligned
@@ -12,3 +12,7 @@ class Clock:
     @property
     def time(self) -> int:
         return self._time
+
+    @property
+    def periods(self) -> int:
+        return self._periods
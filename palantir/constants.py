@@ -5,10 +5,17 @@ DESIRED_MAX_SLIPPAGE_PERCENT = 10
 
 # We model slippage as a normally distributed random variable with mean equal to the current price
 # and variance proportional to a percentage of the price as described by max desired slippage.
+# This draws from the global `random` state, simulations should use `randomness.GaussianSlippage`.
 GAUSS_RANDOM_SLIPPAGE = lambda price: gauss(
     price, price * DESIRED_MAX_SLIPPAGE_PERCENT / 100
 )
 
+# Swaps are executed exactly at the oracle price
+NO_SLIPPAGE = lambda price: price
+
+# A position can be liquidated once its losses exceed its collateral net of this fraction
+RISK_FACTOR_PERCENT = 30
+
 # We model fees as a 0% flat rate
 NULL_FEES = lambda amount: amount - amount * 0.0 / 100
 
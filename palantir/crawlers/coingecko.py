@@ -1,23 +1,190 @@
 # CoinGecko API crawler
 # https://www.coingecko.com/it/api/documentation
+import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Iterable, List, Tuple
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
 
 import requests
 
 from palantir.constants import SECONDS_IN_A_DAY
+from palantir.crawlers.http import TokenBucket, get_json, make_session
 from palantir.types import Currency, Price, Timestamp
 
 
-COINGEKO_BASE_URL = "https://api.coingecko.com/api/v3"
+# Can be overridden with the PALANTIR_COINGECKO_URL environment variable, e.g. to use a stub server
+COINGEKO_BASE_URL = os.environ.get("PALANTIR_COINGECKO_URL", "https://api.coingecko.com/api/v3")
 
+# Longest and shortest ranges for which the API returns hourly prices: shorter ranges are
+# served every 5 minutes, so they are extended back to MIN_DAYS_PER_API_CALL days
+DAYS_PER_API_CALL = 30
+MIN_DAYS_PER_API_CALL = 2
 
-def coin_ids() -> Iterable[str]:
-    response = requests.get(f"{COINGEKO_BASE_URL}/coins")
-    data = response.json()
-    for coin in data:
-        yield coin["id"]
+# Concurrent requests, and requests per second allowed with bursts of up to RATE_LIMIT_BURST,
+# which stay within the limits of the public API
+MAX_WORKERS = 4
+RATE_LIMIT_PER_SECOND = 0.5
+RATE_LIMIT_BURST = 5
+
+# The list of coins rarely changes, it is cached on disk and downloaded again once older than the TTL
+COIN_LIST_CACHE_PATH = os.environ.get("PALANTIR_COIN_LIST_CACHE", ".coingecko_coins.json")
+COIN_LIST_TTL_SECONDS = 7 * SECONDS_IN_A_DAY
+
+
+class ChartRequest(NamedTuple):
+    coin_id: Currency
+    vs_currency: Currency
+    from_timestamp: Timestamp
+    to_timestamp: Timestamp
+
+
+class CrawlError(Exception):
+    """
+    Raised once a crawl is over if some of its chunks could not be downloaded.
+    """
+
+    def __init__(self, failed: List[ChartRequest]):
+        super().__init__(f"{len(failed)} chunks could not be downloaded: {failed}")
+        self.failed = failed
+
+
+# Shared by every download of the process, so that connections are reused and the rate limit is global
+_session: Optional[requests.Session] = None
+_limiter = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+
+def session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = make_session(MAX_WORKERS)
+    return _session
+
+
+# Coin lists already read by this process, per cache path
+_coin_lists: Dict[str, Tuple[float, Dict[str, dict]]] = {}
+
+
+def coin_list(
+    base_url: Optional[str] = None,
+    cache_path: Optional[str] = None,
+    ttl: float = COIN_LIST_TTL_SECONDS,
+    now: Optional[float] = None,
+) -> Dict[str, dict]:
+    """
+    Returns the metadata (id, symbol and name) of every coin by id. The list is read from the
+    cache if it is younger than `ttl` seconds, and downloaded again otherwise. If it cannot be
+    downloaded an expired cache is used, so that a cached list is enough to work offline.
+    """
+    cache_path = cache_path or COIN_LIST_CACHE_PATH
+    now = time.time() if now is None else now
+
+    if cache_path not in _coin_lists and os.path.exists(cache_path):
+        with open(cache_path) as file:
+            cache = json.load(file)
+        _coin_lists[cache_path] = (cache["fetched_at"], {coin["id"]: coin for coin in cache["coins"]})
+
+    cached = _coin_lists.get(cache_path)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+
+    try:
+        # Few and short retries, so that working offline with an expired list is not much slower
+        coins = get_json(
+            session(), f"{base_url or COINGEKO_BASE_URL}/coins/list", limiter=_limiter, retries=1, backoff=0.5
+        )
+    except requests.RequestException as error:
+        if cached is None:
+            raise
+        logging.warning(f"Could not download the list of coins ({error}), using the one cached on {datetime.utcfromtimestamp(cached[0])}")
+        return cached[1]
+
+    temporary_path = f"{cache_path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({"fetched_at": now, "coins": coins}, file)
+    os.replace(temporary_path, cache_path)
+
+    _coin_lists[cache_path] = (now, {coin["id"]: coin for coin in coins})
+    return _coin_lists[cache_path][1]
+
+
+def coin_id_set(base_url: Optional[str] = None, cache_path: Optional[str] = None) -> FrozenSet[str]:
+    return frozenset(coin_list(base_url, cache_path))
+
+
+def coin_ids(base_url: Optional[str] = None) -> Iterable[str]:
+    return iter(coin_list(base_url))
+
+
+def chunk_ranges(from_timestamp: Timestamp, to_timestamp: Timestamp) -> List[Tuple[Timestamp, Timestamp]]:
+    """
+    Splits a range of timestamps in seconds into ranges the API can serve in one call, at
+    hourly granularity. Ranges shorter than MIN_DAYS_PER_API_CALL days start earlier, so
+    they overlap quotes which may already be stored.
+    """
+    step = DAYS_PER_API_CALL * SECONDS_IN_A_DAY
+    min_span = MIN_DAYS_PER_API_CALL * SECONDS_IN_A_DAY
+    return [
+        (min(start, end - min_span), end)
+        for start, end in (
+            (start, min(to_timestamp, start + step)) for start in range(from_timestamp, to_timestamp, step)
+        )
+    ]
+
+
+def fetch_chart(
+    request: ChartRequest, base_url: Optional[str] = None, limiter: Optional[TokenBucket] = None
+) -> List[Tuple[Timestamp, Price]]:
+    start, end = request.from_timestamp, request.to_timestamp
+    logging.info(
+        f"Downloading {request.coin_id} prices {datetime.utcfromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S')} => {datetime.utcfromtimestamp(end).strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+    data = get_json(
+        session(),
+        f"{base_url or COINGEKO_BASE_URL}/coins/{request.coin_id}/market_chart/range",
+        params={"vs_currency": request.vs_currency, "from": start, "to": end},
+        limiter=limiter if limiter is not None else _limiter,
+    )
+    return [(timestamp, price) for timestamp, price in data["prices"]]
+
+
+def crawl_market_charts(
+    chart_requests: Iterable[ChartRequest],
+    on_chunk: Callable[[ChartRequest, List[Tuple[Timestamp, Price]]], None],
+    max_workers: int = MAX_WORKERS,
+    base_url: Optional[str] = None,
+    limiter: Optional[TokenBucket] = None,
+) -> None:
+    """
+    Downloads the prices of every request, split in chunks which are downloaded concurrently
+    across requests. `on_chunk` is called in the calling thread with each chunk as soon as it
+    is downloaded, so that it can be persisted and an interrupted crawl loses at most the
+    chunks in flight. Chunks failing even after retries do not stop the others, they are
+    reported together with a `CrawlError` at the end.
+    """
+    chunks = [
+        ChartRequest(request.coin_id, request.vs_currency, start, end)
+        for request in chart_requests
+        for start, end in chunk_ranges(request.from_timestamp, request.to_timestamp)
+    ]
+
+    failed = []
+    with ThreadPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(fetch_chart, chunk, base_url, limiter): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                prices = future.result()
+            except requests.RequestException as error:
+                logging.error(f"Could not download {chunk}: {error}")
+                failed.append(chunk)
+                continue
+            on_chunk(chunk, prices)
+
+    if failed:
+        raise CrawlError(failed)
 
 
 def market_chart_range(
@@ -25,32 +192,18 @@ def market_chart_range(
     vs_currency: Currency,
     from_timestamp: Timestamp,
     to_timestamp: Timestamp,
+    base_url: Optional[str] = None,
 ) -> List[Tuple[Timestamp, Price]]:
-    days = int((to_timestamp - from_timestamp) / SECONDS_IN_A_DAY)
-    days_per_api_call = 30
-    periods = (
-        int(days / days_per_api_call) + 1
-    )  # Add an extra day to also download the rest
-    date_ranges = [
-        (
-            from_timestamp + (n * days_per_api_call * SECONDS_IN_A_DAY),
-            from_timestamp + ((n + 1) * days_per_api_call * SECONDS_IN_A_DAY),
-        )
-        for n in range(periods)
-    ]
-
+    """
+    Downloads the prices of a coin between two timestamps in seconds. The returned prices are
+    sorted by timestamp, which is in milliseconds as in every CoinGecko response.
+    """
     prices = {}  # We write everything in a dict to avoid duplicate price samples
-    for start, end in date_ranges:
-        logging.info(
-            f"Downloading {coin_id} prices {datetime.utcfromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S')} => {datetime.utcfromtimestamp(end).strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        response = requests.get(
-            f"{COINGEKO_BASE_URL}/coins/{coin_id}/market_chart/range?vs_currency={vs_currency}&from={start}&to={end}"
-        )
-        data = response.json()
-        prices.update({timestamp: price for timestamp, price in data["prices"]})
+    crawl_market_charts(
+        [ChartRequest(coin_id, vs_currency, from_timestamp, to_timestamp)],
+        lambda _chunk, chunk_prices: prices.update(chunk_prices),
+        base_url=base_url,
+    )
 
     # Sort everything by ascending timestamp before returning
-    return sorted(
-        [(timestamp, price) for timestamp, price in prices.items()], key=lambda x: x[0]
-    )
+    return sorted(prices.items())
@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Statuses worth retrying: rate limited, or the server failed for a reason unrelated to the request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by threads: requests take a token each, tokens are added at `rate`
+    per second up to `capacity`, which is the largest burst allowed.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes a token, waiting for one to be available if needed.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            # Tokens are taken in advance, so that waiting threads are served in turn
+            self._tokens -= 1.0
+            wait = -self._tokens / self.rate if self._tokens < 0.0 else 0.0
+        if wait > 0.0:
+            self.sleep(wait)
+
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    """
+    Returns a session whose connections are kept alive and reused by up to `pool_size` threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """
+    Seconds to wait before retrying as asked by the server, only the delay-seconds form is supported.
+    """
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def get_json(
+    session: requests.Session,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    limiter: Optional[TokenBucket] = None,
+    retries: int = 5,
+    backoff: float = 1.0,
+    timeout: float = 30.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    """
+    GETs a JSON document, retrying connection errors, timeouts and the statuses in
+    `RETRY_STATUSES` up to `retries` times. Retries wait as long as the server asks with
+    Retry-After, or else a random delay up to an exponentially growing bound (full jitter),
+    so that concurrent clients do not retry in lockstep.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if attempt == retries:
+                raise
+            logging.warning(f"GET {url} failed ({error}), retrying")
+            sleep(random.uniform(0.0, backoff * 2 ** attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            response.raise_for_status()
+            return response.json()
+
+        delay = retry_after(response)
+        logging.warning(f"GET {url} returned {response.status_code}, retrying")
+        sleep(delay if delay is not None else random.uniform(0.0, backoff * 2 ** attempt))
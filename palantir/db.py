@@ -1,20 +1,56 @@
-from sqlalchemy import create_engine
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Insert, Select
 from sqlalchemy.orm import sessionmaker
 
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import (
     Column,
     Float,
+    Index,
     Integer,
     String,
 )
 
+from palantir.types import Currency, Price, Timestamp
+
+
+# Can be overridden with the PALANTIR_DB_URL environment variable
+DEFAULT_DB_URL = "sqlite:///quotes.db"
+
+
+# Rows sent to the database in a single executemany
+UPSERT_BATCH_SIZE = 50000
+
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE, which quotes are upserted with
+UPSERT_INSERTS = {
+    "sqlite": sqlite_insert,
+    "postgresql": postgresql_insert,
+}
+
+
+USD = Currency("usd")
+
+
+QUOTES_DTYPE = np.dtype([("timestamp", np.int64), ("price", np.float64)])
+
 
 Base = declarative_base()
 
 
 class Quote(Base):
     __tablename__ = "quotes"
+    __table_args__ = (
+        # Quotes are deduplicated on this key, which also serves every query by coin and time
+        Index("ix_quotes_coin_vs_currency_timestamp", "coin", "vs_currency", "timestamp", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     coin = Column(String)
@@ -23,23 +59,201 @@ class Quote(Base):
     price = Column(Float)
 
 
-def init_db():
+quotes = Quote.__table__
+
+
+_engines: Dict[str, Engine] = {}
+
+
+def db_url(url: Optional[str] = None) -> str:
+    return url or os.environ.get("PALANTIR_DB_URL", DEFAULT_DB_URL)
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # Readers are not blocked by writers, and commits do not wait for a full sync to disk
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def get_engine(url: Optional[str] = None) -> Engine:
     """
-    Connect to the db and if necessary initialise the schema.
+    Returns the engine of the database, created and migrated only once per process and url.
     """
-    engine = create_engine("sqlite:///quotes.db", echo=False)
+    url = db_url(url)
+    if url not in _engines:
+        engine = create_engine(url, echo=False)
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+
+        Base.metadata.create_all(engine)
+        _deduplicate_quotes(engine)
+        _engines[url] = engine
+
+    return _engines[url]
 
-    Base.metadata.create_all(engine)
 
-    Session = sessionmaker(bind=engine)
+def _deduplicate_quotes(engine: Engine) -> None:
+    """
+    Databases created before quotes were unique per (coin, vs_currency, timestamp) lack the
+    index, which can only be created once duplicates, if any, are removed.
+    """
+    index = next(iter(quotes.indexes))
+    with engine.begin() as connection:
+        if index.name in {existing["name"] for existing in inspect(connection).get_indexes(quotes.name)}:
+            return
+
+        first_ids = (
+            select(func.min(quotes.c.id))
+            .group_by(quotes.c.coin, quotes.c.vs_currency, quotes.c.timestamp)
+            .scalar_subquery()
+        )
+        connection.execute(quotes.delete().where(quotes.c.id.not_in(first_ids)))
+        index.create(connection)
+
+
+def init_db(url: Optional[str] = None):
+    """
+    Connect to the db and if necessary initialise the schema.
+    """
+    Session = sessionmaker(bind=get_engine(url))
     session = Session()
 
     return session
 
 
-def drop_all():
+def drop_all(url: Optional[str] = None):
     """
     Delete all structures in this database.
     """
-    engine = create_engine("sqlite:///quotes.db", echo=False)
+    url = db_url(url)
+    engine = _engines.pop(url, None) or create_engine(url, echo=False)
     Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def upsert_quotes(
+    coin: Currency,
+    vs_currency: Currency,
+    rows: Iterable[Tuple[Timestamp, Price]],
+    url: Optional[str] = None,
+) -> int:
+    """
+    Inserts (timestamp, price) quotes of a coin in bulk, replacing the price of quotes
+    already stored for the same timestamp. Returns the number of rows written.
+    """
+    engine = get_engine(url)
+    statement = upsert_statement(engine.dialect.name)
+
+    written = 0
+    batch = []
+    with engine.begin() as connection:
+        for timestamp, price in rows:
+            batch.append({"coin": coin, "vs_currency": vs_currency, "timestamp": int(timestamp), "price": float(price)})
+            if len(batch) == UPSERT_BATCH_SIZE:
+                connection.execute(statement, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            connection.execute(statement, batch)
+            written += len(batch)
+
+    return written
+
+
+def upsert_statement(dialect: str) -> Insert:
+    """
+    Returns the statement inserting quotes, or replacing the price of the quote already
+    stored for their timestamp, in the given SQL dialect.
+    """
+    assert (
+        dialect in UPSERT_INSERTS
+    ), f"Quotes cannot be upserted into {dialect} databases, only into {', '.join(UPSERT_INSERTS)} ones"
+
+    statement = UPSERT_INSERTS[dialect](quotes)
+    return statement.on_conflict_do_update(
+        index_elements=[quotes.c.coin, quotes.c.vs_currency, quotes.c.timestamp],
+        set_={"price": statement.excluded.price},
+    )
+
+
+def _fetch_all(statement: Select, url: Optional[str] = None) -> List[tuple]:
+    """
+    Runs a Core statement on a raw DB-API cursor, building plain tuples instead of
+    SQLAlchemy rows, which are several times slower to build for large results.
+    """
+    engine = get_engine(url)
+    # Lists in IN clauses are expanded into one parameter per item when compiling
+    compiled = statement.compile(engine, compile_kwargs={"render_postcompile": True})
+    parameters = [compiled.params[name] for name in compiled.positiontup]
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(str(compiled), parameters)
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def read_quotes(
+    coin: Currency,
+    vs_currency: Currency = USD,
+    last: Optional[int] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    url: Optional[str] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the timestamps and prices of the quotes of a coin in [start, end), or only the
+    `last` ones, in ascending order of timestamp. The window is applied by the database,
+    walking the (coin, vs_currency, timestamp) index backwards for the last quotes.
+    """
+    statement = select(quotes.c.timestamp, quotes.c.price).where(
+        quotes.c.coin == coin, quotes.c.vs_currency == vs_currency
+    )
+    if start is not None:
+        statement = statement.where(quotes.c.timestamp >= start)
+    if end is not None:
+        statement = statement.where(quotes.c.timestamp < end)
+
+    if last is None:
+        rows = np.array(_fetch_all(statement.order_by(quotes.c.timestamp), url), dtype=QUOTES_DTYPE)
+    else:
+        rows = np.array(
+            _fetch_all(statement.order_by(quotes.c.timestamp.desc()).limit(last), url), dtype=QUOTES_DTYPE
+        )[::-1]
+
+    return np.ascontiguousarray(rows["timestamp"]), np.ascontiguousarray(rows["price"])
+
+
+class QuoteCoverage(NamedTuple):
+    count: int
+    first: Optional[Timestamp]
+    last: Optional[Timestamp]
+    # Changes when stored prices are replaced too, e.g. to tell whether data derived from them is stale
+    price_sum: Optional[float] = None
+
+
+def quote_coverage(
+    coins: Sequence[Currency], vs_currency: Currency = USD, url: Optional[str] = None
+) -> Dict[Currency, QuoteCoverage]:
+    """
+    Returns how many quotes are stored for each coin, their time range and the sum of their
+    prices, with a single query.
+    """
+    rows = _fetch_all(
+        select(
+            quotes.c.coin,
+            func.count(),
+            func.min(quotes.c.timestamp),
+            func.max(quotes.c.timestamp),
+            func.sum(quotes.c.price),
+        )
+        .where(quotes.c.coin.in_(list(coins)), quotes.c.vs_currency == vs_currency)
+        .group_by(quotes.c.coin),
+        url,
+    )
+    coverage = {coin: QuoteCoverage(*coverage) for coin, *coverage in rows}
+    return {coin: coverage.get(coin, QuoteCoverage(0, None, None)) for coin in coins}
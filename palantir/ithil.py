@@ -1,10 +1,16 @@
-import logging
 from collections import defaultdict
-from typing import Callable, Dict, Optional, Tuple
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
 
 from palantir.clock import Clock
+from palantir.constants import NO_SLIPPAGE, RISK_FACTOR_PERCENT
+from palantir.journal import PositionJournal, Waterfall
+from palantir.liquidation import LiquidationPriceIndex, PositionBook
 from palantir.metrics import Metric, MetricsLogger
 from palantir.oracle import PriceOracle
+from palantir.trace import NULL_TRACER, Event, EventType, Tracer
 from palantir.types import (
     Account,
     Currency,
@@ -18,14 +24,18 @@ def default_governance_liquidity():
     return 0.0
 
 
+EMPTY_POSITIONS: Mapping[PositionId, Position] = MappingProxyType({})
+
+
 class Ithil:
     clock: Clock
+    closed_positions: Dict[PositionId, float]
     insurance_pool: Dict[Currency, float]
     metrics_logger: MetricsLogger
     positions_id: PositionId
     positions: Dict[PositionId, Position]
-    closed_positions: Dict[PositionId, float]
     price_oracle: PriceOracle
+    tracer: Tracer
     vaults: Dict[Currency, float]
 
     def __init__(
@@ -40,6 +50,8 @@ class Ithil:
         price_oracle: PriceOracle,
         split_fees: Callable[[float], Tuple[float, float]],
         vaults: Dict[Currency, float],
+        tracer: Tracer = NULL_TRACER,
+        journal: Optional[PositionJournal] = None,
     ):
         """
         - apply_slippage: returns a new price by applying a slippage to the input price.
@@ -55,6 +67,8 @@ class Ithil:
         - price_oracle: provides current price information on a currency relative to USD.
         - split_fees: returns the original fees split into (governance_fees, insurance_fees).
         - valults: amount of liquidity available per currency in the vaults.
+        - tracer: receives the events of positions, nothing is traced by default.
+        - journal: if given, records the whole lifecycle of every position, see `PositionJournal`.
         """
         self.apply_slippage = apply_slippage
         self.calculate_fees = calculate_fees
@@ -69,8 +83,19 @@ class Ithil:
         self.positions_id = PositionId(0)
         self.price_oracle = price_oracle
         self.split_fees = split_fees
+        self.tracer = tracer
+        self.journal = journal
         self.vaults = vaults
 
+        # Open positions are indexed as they are opened and closed so that lookups never
+        # need to scan the whole history of positions.
+        self._active_positions: Dict[PositionId, Position] = {}
+        self._positions_by_owner: Dict[Account, Dict[PositionId, Position]] = {}
+        self._positions_by_owed_token: Dict[Currency, Dict[PositionId, Position]] = {}
+        self._positions_by_held_token: Dict[Currency, Dict[PositionId, Position]] = {}
+        self._book = PositionBook(price_oracle.currencies)
+        self._liquidation_price_index = LiquidationPriceIndex()
+
     def open_position(
         self,
         trader: Account,
@@ -85,9 +110,49 @@ class Ithil:
             src_token, dst_token, principal
         )
 
+        return self._open_position(trader, src_token, dst_token, collateral_token, collateral, principal, amount)
+
+    def open_positions(
+        self,
+        traders: Sequence[Account],
+        src_tokens: Sequence[Currency],
+        dst_tokens: Sequence[Currency],
+        collateral_tokens: Sequence[Currency],
+        collaterals: np.ndarray,
+        principals: np.ndarray,
+        max_slippage_percent: float,
+    ) -> List[Optional[PositionId]]:
+        """
+        Opens a batch of positions, one per item of the arguments, as `open_position` would
+        one after the other. The swaps of the whole batch are priced, and slipped, at once.
+        Returns the id of each position, or None if it could not be opened.
+        """
+        collaterals = np.asarray(collaterals, dtype=np.float64)
+        principals = np.asarray(principals, dtype=np.float64)
+        amounts = principals * self._swap_rates(src_tokens, dst_tokens)
+
+        orders = zip(
+            traders, src_tokens, dst_tokens, collateral_tokens, collaterals.tolist(), principals.tolist(), amounts.tolist()
+        )
+        return [self._open_position(*order) for order in orders]
+
+    def _open_position(
+        self,
+        trader: Account,
+        src_token: Currency,
+        dst_token: Currency,
+        collateral_token: Currency,
+        collateral: float,
+        principal: float,
+        amount: float,
+    ) -> Optional[PositionId]:
         if self.vaults[src_token] < principal:
             self.metrics_logger.log(Metric.TRADE_FAILED)
             self.metrics_logger.log(Metric.INSUFFICIENT_LIQUIDITY)
+            if self.tracer.failed:
+                self.tracer.emit(
+                    Event(EventType.FAILED, self.clock.time, -1, trader, src_token, dst_token, principal)
+                )
             return
 
         interest_rate = self.calculate_interest_rate(src_token, dst_token, collateral, principal)
@@ -108,16 +173,57 @@ class Ithil:
         )
 
         self.positions[position_id] = position
+        self._index_position(position)
         self.positions_id = PositionId(self.positions_id + 1)
         self.vaults[src_token] -= principal
 
-        logging.info(f"OpenPosition\t => {position}")
         self.metrics_logger.log(Metric.POSITION_OPENED, 1.0)
+        if self.tracer.opened:
+            self.tracer.emit(self._event(EventType.OPENED, position, principal))
+        if self.journal is not None:
+            self.journal.opened(self.clock.time, position, amount / principal)
 
         return position_id
 
     def close_position(self, position_id: PositionId, liquidation_fee=0.0) -> Tuple[float, float]:
-        position = self.active_positions[position_id]
+        position = self._active_positions[position_id]
+        trader_pl, liquidation_pl = self._close_position(position, liquidation_fee, EventType.CLOSED)
+        if self.tracer.closed:
+            self.tracer.emit(self._event(EventType.CLOSED, position, trader_pl))
+        return trader_pl, liquidation_pl
+
+    def close_positions(self, position_ids: Sequence[PositionId]) -> List[Tuple[float, float]]:
+        """
+        Closes a batch of open positions, as `close_position` would one after the other.
+        The swaps of the whole batch are priced, and slipped, at once.
+        Returns the trader's and the liquidator's P&L of each position.
+        """
+        positions = [self._active_positions[position_id] for position_id in position_ids]
+        allowances = np.fromiter((position.allowance for position in positions), dtype=np.float64, count=len(positions))
+        amounts = allowances * self._swap_rates(
+            [position.held_token for position in positions], [position.owed_token for position in positions]
+        )
+
+        results = []
+        for position, amount in zip(positions, amounts.tolist()):
+            trader_pl, liquidation_pl = self._close_position(position, 0.0, EventType.CLOSED, amount)
+            if self.tracer.closed:
+                self.tracer.emit(self._event(EventType.CLOSED, position, trader_pl))
+            results.append((trader_pl, liquidation_pl))
+        return results
+
+    def _close_position(
+        self,
+        position: Position,
+        liquidation_fee: float,
+        event_type: EventType,
+        amount: Optional[float] = None,
+    ) -> Tuple[float, float]:
+        """
+        - amount: the held tokens of the position already swapped into owed tokens, if the
+        swap was priced beforehand with the rest of a batch.
+        """
+        position_id = PositionId(position.id)
 
         fees = self.calculate_fees(position)
         governance_fees, insurance_fees = self.split_fees(fees)
@@ -125,9 +231,10 @@ class Ithil:
 
         interest = self.calculate_interest(position)
 
-        amount = self._swap(
-            position.held_token, position.owed_token, position.allowance
-        )
+        if amount is None:
+            amount = self._swap(
+                position.held_token, position.owed_token, position.allowance
+            )
         assert amount > 0.0, "Swap returned negative or null amount"
 
         total_position_liquidity = amount + position.collateral
@@ -172,10 +279,28 @@ class Ithil:
         self.insurance_pool[position.owed_token] += insurance_fees_amount  # The insurance fees are added to the IP
         self.governance_pool[position.owed_token] += governance_fees_amount  # The governance fees are sent to the token holders
 
-        if liquidation_fee == 0.0:
-            logging.info(f"ClosePosition\t => {position}")
+        if self.journal is not None:
+            self.journal.closed(
+                event_type,
+                self.clock.time,
+                position,
+                amount / position.allowance,
+                Waterfall(
+                    amount=amount,
+                    liquidity_pool_amount=liquidity_pool_amount,
+                    insurance_amount=insurance_amount,
+                    interest_amount=interest_amount,
+                    insurance_fees_amount=insurance_fees_amount,
+                    governance_fees_amount=governance_fees_amount,
+                    liquidation_fee_from_collateral=liquidation_fee_from_collateral,
+                    liquidation_fee_from_insurance=liquidation_fee_from_insurance,
+                    liquidation_pl=liquidation_pl,
+                    trader_pl=trader_pl,
+                ),
+            )
 
         self.closed_positions[position_id] = self.clock.time
+        self._unindex_position(position)
 
         self.metrics_logger.log(Metric.POSITION_CLOSED, 1.0)
 
@@ -183,20 +308,59 @@ class Ithil:
 
     @property
     def active_positions(self) -> Dict[PositionId, Position]:
-        return {
-            position_id: position
-            for position_id, position in self.positions.items()
-            if position_id not in self.closed_positions
-        }
+        """
+        Snapshot of the open positions, which callers can iterate while closing positions.
+        """
+        return dict(self._active_positions)
+
+    @property
+    def active_positions_view(self) -> Mapping[PositionId, Position]:
+        """
+        Read-only live view of the open positions, updated as positions are opened and closed,
+        for lookups in hot paths. It must not be iterated while positions are opened or closed.
+        """
+        return MappingProxyType(self._active_positions)
+
+    def positions_by_owner(self, owner: Account) -> Mapping[PositionId, Position]:
+        return MappingProxyType(self._positions_by_owner.get(owner, EMPTY_POSITIONS))
+
+    def positions_by_owed_token(self, token: Currency) -> Mapping[PositionId, Position]:
+        return MappingProxyType(self._positions_by_owed_token.get(token, EMPTY_POSITIONS))
+
+    def positions_by_held_token(self, token: Currency) -> Mapping[PositionId, Position]:
+        return MappingProxyType(self._positions_by_held_token.get(token, EMPTY_POSITIONS))
+
+    def _index_position(self, position: Position) -> None:
+        position_id = PositionId(position.id)
+        self._active_positions[position_id] = position
+        self._positions_by_owner.setdefault(position.owner, {})[position_id] = position
+        self._positions_by_owed_token.setdefault(position.owed_token, {})[position_id] = position
+        self._positions_by_held_token.setdefault(position.held_token, {})[position_id] = position
+        fees = self.calculate_fees(position)
+        self._book.add(position, fees)
+        self._liquidation_price_index.add(position, fees)
+
+    def _unindex_position(self, position: Position) -> None:
+        position_id = PositionId(position.id)
+        del self._active_positions[position_id]
+        self._book.remove(position_id)
+        self._liquidation_price_index.remove(position)
+        for index, key in (
+            (self._positions_by_owner, position.owner),
+            (self._positions_by_owed_token, position.owed_token),
+            (self._positions_by_held_token, position.held_token),
+        ):
+            positions = index[key]
+            del positions[position_id]
+            if not positions:
+                del index[key]
 
     def can_liquidate_position(self, position_id: PositionId) -> bool:
-        active_positions = self.active_positions
+        position = self._active_positions.get(position_id)
 
-        if position_id not in active_positions:
+        if position is None:
             return False
 
-        position = active_positions[position_id]
-
         fees = self.calculate_fees(position)
 
         current_value_in_owed_tokens = self._swap(
@@ -208,9 +372,36 @@ class Ithil:
         # XXX here we assume a fixed risk factor of 30%
         return (
             position.principal - current_value_in_owed_tokens
-            > position.collateral - (30 * position.collateral / 100) - fees
+            > position.collateral - (RISK_FACTOR_PERCENT * position.collateral / 100) - fees
         )
 
+    def liquidatable_positions(self) -> List[PositionId]:
+        """
+        Returns the open positions that can be liquidated, in the order they were opened.
+        Without slippage only the positions whose liquidation price has been crossed are
+        checked, and the result is exactly the same as calling `can_liquidate_position` on
+        each open position. With slippage every open position is checked at once.
+        """
+        if len(self._book) == 0:
+            return []
+
+        cross_rates = self.price_oracle.cross_rates()
+
+        if self.apply_slippage is NO_SLIPPAGE:
+            candidates = [
+                position_id
+                for held_token, owed_token in self._liquidation_price_index.pairs
+                for position_id in self._liquidation_price_index.candidates(
+                    (held_token, owed_token),
+                    self.price_oracle.get_rate(held_token, owed_token),
+                )
+            ]
+            return sorted(self._book.liquidatable(candidates, cross_rates))
+
+        mask = self._book.liquidation_mask(cross_rates, self._apply_slippage_to_rates())
+
+        return [PositionId(int(position_id)) for position_id in np.sort(self._book.position_ids[mask])]
+
     def calculate_interest(self, position: Position) -> float:
         """
         Returns interest amount in the same currency as the
@@ -232,20 +423,64 @@ class Ithil:
         the same currency as the position's collateral.
         """
         if self.can_liquidate_position(position_id):
-            position = self.active_positions[position_id]
-            liquidation_fee = self.calculate_liquidation_fee(position)
-            trader_pl, liquidation_pl = self.close_position(position_id, liquidation_fee)
-            logging.info(f"LiquidatePosition\t => {position}")
-            return trader_pl, liquidation_pl
+            return self._liquidate_position(position_id)
         else:
             return 0.0, 0.0
 
+    def liquidate_positions(self) -> Dict[PositionId, Tuple[float, float]]:
+        """
+        Performs a margin call on every liquidatable open position, returns the trader's
+        and the liquidator's P&L of each liquidated position.
+        """
+        return {
+            position_id: self._liquidate_position(position_id)
+            for position_id in self.liquidatable_positions()
+        }
+
+    def _liquidate_position(self, position_id: PositionId) -> Tuple[float, float]:
+        position = self._active_positions[position_id]
+        liquidation_fee = self.calculate_liquidation_fee(position)
+        trader_pl, liquidation_pl = self._close_position(position, liquidation_fee, EventType.LIQUIDATED)
+        if self.tracer.liquidated:
+            self.tracer.emit(self._event(EventType.LIQUIDATED, position, trader_pl))
+        return trader_pl, liquidation_pl
+
+    def _event(self, event_type: EventType, position: Position, amount: float) -> Event:
+        return Event(
+            event_type,
+            self.clock.time,
+            position.id,
+            position.owner,
+            position.owed_token,
+            position.held_token,
+            amount,
+        )
+
+    def _apply_slippage_to_rates(self) -> Callable[[np.ndarray], np.ndarray]:
+        # Slippage models such as GaussianSlippage can slip a whole array of rates at once
+        apply_many = getattr(self.apply_slippage, "apply_many", None)
+        if apply_many is not None:
+            return apply_many
+
+        def apply_slippage(rates: np.ndarray) -> np.ndarray:
+            return np.fromiter(map(self.apply_slippage, rates), dtype=np.float64, count=len(rates))
+
+        return apply_slippage
+
+    def _swap_rates(self, src_tokens: Sequence[Currency], dst_tokens: Sequence[Currency]) -> np.ndarray:
+        """
+        Returns the slipped exchange rates of a batch of swaps.
+        """
+        rates = self.price_oracle.cross_rates()[
+            self.price_oracle.columns(src_tokens), self.price_oracle.columns(dst_tokens)
+        ]
+        if self.apply_slippage is NO_SLIPPAGE or len(rates) == 0:
+            return rates
+        return self._apply_slippage_to_rates()(rates)
+
     def _swap(
         self, src_token: Currency, dst_token: Currency, src_token_amount: float
     ) -> float:
-        src_token_price = self.price_oracle.get_price(src_token)
-        dst_token_price = self.price_oracle.get_price(dst_token)
-
-        price = src_token_price / dst_token_price
+        price = self.price_oracle.get_rate(src_token, dst_token)
 
         return src_token_amount * self.apply_slippage(price)
@@ -0,0 +1,147 @@
+import struct
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from palantir.trace import EventType, RecordFile, RecordFormat, read_records, register_format
+from palantir.types import Position, Timestamp
+
+
+# A journal is a binary event file, see `trace.HEADER`, whose records have this layout:
+#
+#   offset  field                              type
+#        0  type (EventType.OPENED, CLOSED or LIQUIDATED)  u1
+#        1  time                               i8
+#        9  position_id                        i8
+#       17  owner                              u4  index in the symbols
+#       21  owed_token                         u4  index in the symbols
+#       25  held_token                         u4  index in the symbols
+#       29  collateral_token                   u4  index in the symbols
+#       33  collateral                         f8
+#       41  principal                          f8
+#       49  allowance                          f8
+#       57  interest_rate                      f8
+#       65  created_at                         i8
+#       73  price                              f8  held tokens per owed token when opened,
+#                                                  owed tokens per held token when closed
+#       81  amount                             f8  owed tokens the allowance was swapped for
+#       89  liquidity_pool_amount              f8  principal returned to the vault
+#       97  insurance_amount                   f8  losses covered by the insurance pool
+#      105  interest_amount                    f8
+#      113  insurance_fees_amount              f8
+#      121  governance_fees_amount             f8
+#      129  liquidation_fee_from_collateral    f8
+#      137  liquidation_fee_from_insurance     f8
+#      145  liquidation_pl                     f8
+#      153  trader_pl                          f8
+#
+# Amounts are in the position's owed token, and the close fields of opened records are NaN.
+MAGIC = b"PALJRNL\0"
+VERSION = 1
+RECORD = struct.Struct("<BqqIIIIddddqddddddddddd")
+RECORD_DTYPE = np.dtype(
+    [
+        ("type", "u1"),
+        ("time", "<i8"),
+        ("position_id", "<i8"),
+        ("owner", "<u4"),
+        ("owed_token", "<u4"),
+        ("held_token", "<u4"),
+        ("collateral_token", "<u4"),
+        ("collateral", "<f8"),
+        ("principal", "<f8"),
+        ("allowance", "<f8"),
+        ("interest_rate", "<f8"),
+        ("created_at", "<i8"),
+        ("price", "<f8"),
+        ("amount", "<f8"),
+        ("liquidity_pool_amount", "<f8"),
+        ("insurance_amount", "<f8"),
+        ("interest_amount", "<f8"),
+        ("insurance_fees_amount", "<f8"),
+        ("governance_fees_amount", "<f8"),
+        ("liquidation_fee_from_collateral", "<f8"),
+        ("liquidation_fee_from_insurance", "<f8"),
+        ("liquidation_pl", "<f8"),
+        ("trader_pl", "<f8"),
+    ]
+)
+JOURNAL_FORMAT = register_format(RecordFormat(MAGIC, VERSION, RECORD, RECORD_DTYPE))
+
+
+class Waterfall(NamedTuple):
+    """
+    Where the liquidity of a closed position went, in the order it is paid out.
+    """
+    amount: float
+    liquidity_pool_amount: float
+    insurance_amount: float
+    interest_amount: float
+    insurance_fees_amount: float
+    governance_fees_amount: float
+    liquidation_fee_from_collateral: float
+    liquidation_fee_from_insurance: float
+    liquidation_pl: float
+    trader_pl: float
+
+
+NO_WATERFALL = Waterfall(*[float("nan")] * len(Waterfall._fields))
+
+
+class PositionJournal:
+    """
+    Append-only binary journal of opened, closed and liquidated positions, see the layout above.
+    Opening an existing journal appends to it, see `RecordFile`. Records are buffered, call
+    `flush` or `close` before reading a journal that is still being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = RecordFile(path, JOURNAL_FORMAT)
+
+    def __enter__(self) -> "PositionJournal":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def opened(self, time: Timestamp, position: Position, price: float) -> None:
+        self._write(EventType.OPENED, time, position, price, NO_WATERFALL)
+
+    def closed(self, event_type: EventType, time: Timestamp, position: Position, price: float, waterfall: Waterfall) -> None:
+        self._write(event_type, time, position, price, waterfall)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _write(self, event_type: EventType, time: Timestamp, position: Position, price: float, waterfall: Waterfall) -> None:
+        self._file.write(
+            event_type,
+            time,
+            position.id,
+            self._file.symbol(position.owner),
+            self._file.symbol(position.owed_token),
+            self._file.symbol(position.held_token),
+            self._file.symbol(position.collateral_token),
+            position.collateral,
+            position.principal,
+            position.allowance,
+            position.interest_rate,
+            position.created_at,
+            price,
+            *waterfall,
+        )
+
+
+def read_journal(path: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Memory-maps the records of a journal into a read-only structured array, see `RECORD_DTYPE`,
+    and returns it with the symbols its owner and token fields refer to. Journals can also be
+    read with `trace.read_records`, and turned into events with `trace.trace_events`.
+    """
+    records, symbols = read_records(path)
+    assert records.dtype == RECORD_DTYPE, f"{path} is not a position journal"
+    return records, symbols
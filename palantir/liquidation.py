@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from palantir.constants import RISK_FACTOR_PERCENT
+from palantir.types import Currency, Position, PositionId
+
+
+COLUMNS = [
+    ("_ids", np.int64),
+    ("_principal", np.float64),
+    ("_collateral", np.float64),
+    ("_allowance", np.float64),
+    ("_fees", np.float64),
+    ("_held", np.intp),
+    ("_owed", np.intp),
+]
+
+
+class PositionBook:
+    """
+    Columnar copy of the open positions, used to check all of them for liquidation
+    in a single vectorized pass.
+    Positions occupy the first `len(book)` slots of each column; closing a position
+    moves the last one into its slot, so columns never have holes.
+    Fees are calculated once, when the position is added.
+    """
+    tokens: List[Currency]
+
+    def __init__(self, tokens: Sequence[Currency], capacity: int = 1024):
+        """
+        - tokens: every currency positions can be opened on, exchange rates passed to the
+        liquidation checks must be in the same order.
+        """
+        self.tokens = list(tokens)
+        self._token_index: Dict[Currency, int] = {token: index for index, token in enumerate(self.tokens)}
+        self._slots: Dict[PositionId, int] = {}
+        self._size = 0
+        self._allocate(capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, position_id: PositionId) -> bool:
+        return position_id in self._slots
+
+    @property
+    def position_ids(self) -> np.ndarray:
+        return self._ids[: self._size]
+
+    def add(self, position: Position, fees: float) -> None:
+        if self._size == len(self._ids):
+            self._allocate(2 * len(self._ids))
+
+        slot = self._size
+        self._ids[slot] = position.id
+        self._principal[slot] = position.principal
+        self._collateral[slot] = position.collateral
+        self._allowance[slot] = position.allowance
+        self._fees[slot] = fees
+        self._held[slot] = self._token_index[position.held_token]
+        self._owed[slot] = self._token_index[position.owed_token]
+        self._slots[PositionId(position.id)] = slot
+        self._size += 1
+
+    def remove(self, position_id: PositionId) -> None:
+        slot = self._slots.pop(position_id)
+        last = self._size - 1
+        if slot != last:
+            for column in self._columns():
+                column[slot] = column[last]
+            self._slots[PositionId(int(self._ids[slot]))] = slot
+        self._size = last
+
+    def liquidation_mask(
+        self,
+        cross_rates: np.ndarray,
+        apply_slippage: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Returns a boolean mask over `position_ids` of the positions that can be liquidated.
+        - cross_rates: current exchange rates between currencies, where cross_rates[i, j] is
+        the price of `tokens[i]` in units of `tokens[j]`.
+        - apply_slippage: applied to the array of held/owed exchange rates, if any.
+        The arithmetic mirrors `Ithil.can_liquidate_position` operation by operation,
+        so that both agree exactly.
+        """
+        return self._liquidation_mask(slice(0, self._size), cross_rates, apply_slippage)
+
+    def liquidatable(self, position_ids: Iterable[PositionId], cross_rates: np.ndarray) -> List[PositionId]:
+        """
+        Returns the subset of `position_ids` that can be liquidated, without slippage.
+        """
+        slots = np.fromiter((self._slots[position_id] for position_id in position_ids), dtype=np.intp)
+        if len(slots) == 0:
+            return []
+
+        mask = self._liquidation_mask(slots, cross_rates)
+
+        return [PositionId(int(position_id)) for position_id in self._ids[slots[mask]]]
+
+    def _liquidation_mask(
+        self,
+        slots,
+        cross_rates: np.ndarray,
+        apply_slippage: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> np.ndarray:
+        rates = cross_rates[self._held[slots], self._owed[slots]]
+        if apply_slippage is not None:
+            rates = apply_slippage(rates)
+
+        current_value_in_owed_tokens = self._allowance[slots] * rates
+        collateral = self._collateral[slots]
+
+        return (
+            self._principal[slots] - current_value_in_owed_tokens
+            > collateral - (RISK_FACTOR_PERCENT * collateral / 100) - self._fees[slots]
+        )
+
+    def _columns(self) -> List[np.ndarray]:
+        return [getattr(self, name) for name, _ in COLUMNS]
+
+    def _allocate(self, capacity: int) -> None:
+        for name, dtype in COLUMNS:
+            column = np.empty(capacity, dtype=dtype)
+            if hasattr(self, name):
+                column[: self._size] = getattr(self, name)[: self._size]
+            setattr(self, name, column)
+
+
+# Relative error allowed on liquidation prices, large enough to absorb rounding
+LIQUIDATION_PRICE_TOLERANCE = 1e-9
+
+
+class LiquidationPriceIndex:
+    """
+    Without slippage a position can be liquidated as soon as the held/owed exchange rate
+    falls below a fixed liquidation price, determined by its principal, collateral,
+    allowance and fees.
+    Liquidation prices are kept sorted per (held_token, owed_token) pair, so that the
+    positions whose liquidation price has been crossed are found in O(log n) per pair.
+    Stored prices are rounded up by a small tolerance: candidates must be confirmed with
+    the exact check, but a position that is not a candidate can never be liquidated.
+    """
+
+    def __init__(self):
+        self._prices: Dict[Tuple[Currency, Currency], List[float]] = {}
+        self._position_ids: Dict[Tuple[Currency, Currency], List[PositionId]] = {}
+        self._liquidation_prices: Dict[PositionId, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._liquidation_prices)
+
+    @property
+    def pairs(self) -> List[Tuple[Currency, Currency]]:
+        """
+        The (held_token, owed_token) pairs with at least one open position.
+        """
+        return list(self._prices.keys())
+
+    def add(self, position: Position, fees: float) -> None:
+        pair = (position.held_token, position.owed_token)
+        position_id = PositionId(position.id)
+        liquidation_price = self.liquidation_price(position, fees)
+
+        prices = self._prices.setdefault(pair, [])
+        position_ids = self._position_ids.setdefault(pair, [])
+        index = bisect_left(prices, liquidation_price)
+        prices.insert(index, liquidation_price)
+        position_ids.insert(index, position_id)
+        self._liquidation_prices[position_id] = liquidation_price
+
+    def remove(self, position: Position) -> None:
+        pair = (position.held_token, position.owed_token)
+        position_id = PositionId(position.id)
+        liquidation_price = self._liquidation_prices.pop(position_id)
+
+        prices = self._prices[pair]
+        position_ids = self._position_ids[pair]
+        index = bisect_left(prices, liquidation_price)
+        while position_ids[index] != position_id:
+            index += 1
+        del prices[index]
+        del position_ids[index]
+
+        if not prices:
+            del self._prices[pair]
+            del self._position_ids[pair]
+
+    def candidates(self, pair: Tuple[Currency, Currency], rate: float) -> List[PositionId]:
+        """
+        Returns the positions on `pair` whose liquidation price is at or above the
+        current held/owed exchange rate.
+        """
+        prices = self._prices.get(pair)
+        if prices is None:
+            return []
+
+        return self._position_ids[pair][bisect_left(prices, rate):]
+
+    @staticmethod
+    def liquidation_price(position: Position, fees: float) -> float:
+        """
+        The held/owed exchange rate below which the position can be liquidated, rounded up.
+        """
+        collateral_threshold = position.collateral - (RISK_FACTOR_PERCENT * position.collateral / 100) - fees
+        if position.allowance <= 0.0:
+            return float("inf")
+
+        liquidation_price = (position.principal - collateral_threshold) / position.allowance
+        tolerance = LIQUIDATION_PRICE_TOLERANCE * (
+            abs(position.principal) + abs(collateral_threshold)
+        ) / position.allowance
+
+        return liquidation_price + tolerance
@@ -1,17 +1,21 @@
 import logging
+import os
 import sys
-from random import gauss, uniform
-from typing import Tuple
+from functools import partial
+from typing import List, Optional, Tuple, Union
 
 from argparse import ArgumentParser
 
+import numpy as np
+
 from palantir.crawlers.coingecko import (
-    coin_ids,
+    coin_id_set,
 )
 from palantir.clock import Clock
 from palantir.ithil import Ithil
 from palantir.metrics import (
     Metric,
+    Metrics,
     MetricsAggregator,
     MetricsAggregatorSum,
     MetricsLogger,
@@ -19,23 +23,28 @@ from palantir.metrics import (
 )
 from palantir.oracle import PriceOracle
 from palantir.palantir import Palantir
+from palantir.randomness import GaussianSlippage, RandomStream
+from palantir.scenarios import JUMP_DIFFUSION, BlockBootstrap, MarketModel, calibrate_from_db, generate_paths
+from palantir.shared import SharedPrices, SharedPricesHandle, attach_prices
 from palantir.simulation import Simulation
+from palantir.store import ResultStore
+from palantir.trace import EventType, LoggingSink, Tracer
 from palantir.trader import Trader
+from palantir.trader_pool import TraderPool
 from palantir.types import Account, Currency, Position
 from palantir.util import (
     download_price_data,
     init_price_db,
     make_trader_names,
-    read_quotes_from_db,
 )
 
 
-def setup_logger() -> None:
+def setup_logger(level: int = logging.INFO) -> None:
     root = logging.getLogger()
-    root.setLevel(logging.INFO)
+    root.setLevel(level)
 
     handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(logging.INFO)
+    handler.setLevel(level)
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
@@ -56,10 +65,10 @@ def run_crawler():
     )
     args = parser.parse_args()
 
-    valid_coin_ids = list(coin_ids())
-    valid_coin_ids_msg = f"Coin should be one of {valid_coin_ids}"
-
     token = args.token
+    valid_coin_ids = coin_id_set()
+    valid_coin_ids_msg = f"{token} is not a CoinGecko coin id"
+
     assert token in valid_coin_ids, valid_coin_ids_msg
 
     days = args.days
@@ -75,14 +84,32 @@ TOKENS = [
 ]
 
 
-db = init_price_db(TOKENS, HOURS)
+DESIRED_MAX_SLIPPAGE_PERCENT = 1.0
+SEED = None  # Set to an integer to make simulations reproducible
+RESULTS_PATH = "results"  # Every completed simulation is stored here as soon as it finishes
+PRICES_CACHE_PATH = ".palantir_cache"  # Aligned prices are cached here until new quotes are stored
+SIMULATIONS_NUMBER = 1
+
+# Price paths of the simulations: HISTORY replays the stored prices in every simulation, while
+# BOOTSTRAP resamples blocks of MEAN_BLOCK_HOURS hours on average of them into a new path for each.
+# SYNTHETIC generates a path for each from the SYNTHETIC_MODEL of the market model saved in
+# MARKET_MODEL_PATH, without network nor quote db; the model is calibrated on the stored prices
+# and saved there the first time.
+HISTORY = "history"
+BOOTSTRAP = "bootstrap"
+SYNTHETIC = "synthetic"
+PRICE_SCENARIO = BOOTSTRAP
+MEAN_BLOCK_HOURS = 24.0
+SYNTHETIC_MODEL = JUMP_DIFFUSION
+MARKET_MODEL_PATH = "market_model.npz"
 
+# Traders only run at the ticks they open or close a position, instead of drawing at every tick
+EVENT_DRIVEN_TRADERS = True
 
-def slippage(price: float) -> float:
-    # We model slippage as a normally distributed random variable with mean equal to the current price
-    # and variance proportional to a percentage of the price as described by max desired slippage.
-    DESIRED_MAX_SLIPPAGE_PERCENT = 1.0
-    return gauss(price, price * DESIRED_MAX_SLIPPAGE_PERCENT / 100.0)
+# Traders are a single vectorized TraderPool instead of Trader objects, for large populations
+TRADER_POOL = False
+LOG_LEVEL = logging.INFO
+TRACE_EVENTS: Tuple[EventType, ...] = ()  # Events of positions to log, e.g. (EventType.LIQUIDATED,)
 
 
 def calculate_fees(position: Position) -> float:
@@ -106,27 +133,51 @@ def split_fees(fees: float) -> Tuple[float, float]:
     return (fees / 2.0, fees / 2.0)
 
 
-def calculate_collateral_usd(price_oracle: PriceOracle, token: Currency) -> float:
-    return (abs(gauss(mu=3000, sigma=5000)) + 100.0) / price_oracle.get_price(token)
+def calculate_collateral_usd(random_stream: RandomStream, price_oracle: PriceOracle, token: Currency) -> float:
+    return (abs(random_stream.gauss(mu=3000, sigma=5000)) + 100.0) / price_oracle.get_price(token)
+
+
+def calculate_leverage(random_stream: RandomStream) -> float:
+    return random_stream.uniform(1.0, 10.0)
+
+
+def draw_collateral_usd(generator: np.random.Generator, traders: np.ndarray) -> np.ndarray:
+    return np.abs(generator.normal(3000, 5000, len(traders))) + 100.0
+
+
+def draw_leverage(generator: np.random.Generator, traders: np.ndarray) -> np.ndarray:
+    return generator.uniform(1.0, 10.0, len(traders))
+
+
+# Historical prices shared by the workers, or the model of synthetic prices
+PriceSource = Union[SharedPricesHandle, MarketModel]
+
+
+def build_price_oracle(clock: Clock, prices: PriceSource, random_stream: RandomStream) -> PriceOracle:
+    if isinstance(prices, MarketModel):
+        path = generate_paths(prices, SYNTHETIC_MODEL, 1, HOURS, random_stream.generator)[0]
+        return PriceOracle.from_matrix(clock=clock, currencies=prices.currencies, prices=path)
 
+    if PRICE_SCENARIO == HISTORY:
+        return PriceOracle.from_shared(clock=clock, handle=prices)
 
-def calculate_leverage() -> float:
-    return uniform(1.0, 10.0)
+    # Only the path of this simulation is generated, from the history shared by every worker
+    bootstrap = BlockBootstrap(prices.currencies, attach_prices(prices), MEAN_BLOCK_HOURS)
+    return PriceOracle.from_matrix(
+        clock=clock, currencies=prices.currencies, prices=bootstrap.path(random_stream.generator, HOURS)
+    )
 
 
-def build_simulation():
+def build_simulation(prices: PriceSource, random_stream: RandomStream) -> Simulation:
     TRADERS_NUMBER = 10
     TRADER_NAMES = make_trader_names(TRADERS_NUMBER)
 
     clock = Clock(HOURS)
 
     metrics_logger = MetricsLogger(clock)
-    price_oracle = PriceOracle(
-        clock=clock,
-        quotes={token: read_quotes_from_db(db, token, HOURS) for token in TOKENS},
-    )
+    price_oracle = build_price_oracle(clock, prices, random_stream)
     ithil = Ithil(
-        apply_slippage=slippage,
+        apply_slippage=GaussianSlippage(random_stream, DESIRED_MAX_SLIPPAGE_PERCENT),
         calculate_fees=calculate_fees,
         calculate_interest_rate=calculate_interest_rate,
         calculate_liquidation_fee=calculate_liquidation_fee,
@@ -144,40 +195,98 @@ def build_simulation():
             Currency("dai"): 750000.0,
             Currency("ethereum"): 300.0,
         },
+        tracer=Tracer([LoggingSink()], enabled=TRACE_EVENTS),
     )
-    simulation = Simulation(
-        clock=clock,
-        ithil=ithil,
-        traders=[
+    liquidity = {
+        Currency("bitcoin"): 0.0,
+        Currency("dai"): 1000.0,
+        Currency("ethereum"): 1.0,
+    }
+    traders = []
+    trader_pool = None
+    if TRADER_POOL:
+        trader_pool = TraderPool(
+            accounts=[Account(trader_name) for trader_name in TRADER_NAMES],
+            ithil=ithil,
+            liquidity=np.array([liquidity[token] for token in sorted(liquidity)]),
+            open_position_probability=0.1,
+            close_position_probability=0.1,
+            draw_collateral_usd=draw_collateral_usd,
+            draw_leverage=draw_leverage,
+            random_stream=random_stream,
+        )
+    else:
+        traders = [
             Trader(
                 account=Account(trader_name),
                 open_position_probability=0.1,
                 close_position_probability=0.1,
                 ithil=ithil,
-                calculate_collateral_usd=calculate_collateral_usd,
-                calculate_leverage=calculate_leverage,
-                liquidity={
-                    Currency("bitcoin"): 0.0,
-                    Currency("dai"): 1000.0,
-                    Currency("ethereum"): 1.0,
-                },
+                calculate_collateral_usd=partial(calculate_collateral_usd, random_stream),
+                calculate_leverage=partial(calculate_leverage, random_stream),
+                liquidity=dict(liquidity),
+                random_stream=random_stream,
             )
             for trader_name in TRADER_NAMES
-        ],
+        ]
+
+    simulation = Simulation(
+        clock=clock,
+        ithil=ithil,
+        traders=traders,
+        event_driven=EVENT_DRIVEN_TRADERS,
+        trader_pool=trader_pool,
     )
 
     return simulation
 
 
-def run_simulation():
-    setup_logger()
+def load_market_model() -> MarketModel:
+    if not os.path.exists(MARKET_MODEL_PATH):
+        db = init_price_db(TOKENS, HOURS)
+        calibrate_from_db(TOKENS, HOURS, url=db, cache_dir=PRICES_CACHE_PATH).save(MARKET_MODEL_PATH)
+        logging.info(f"Saved the market model calibrated on the stored prices in {MARKET_MODEL_PATH}")
+    return MarketModel.load(MARKET_MODEL_PATH)
 
-    palantir = Palantir(
-        simulation_factory=build_simulation,
-        simulations_number=1,
+
+def run_simulation():
+    setup_logger(LOG_LEVEL)
+
+    # The seed is fixed here, rather than in Palantir, so that the stored run can be reproduced
+    seed = np.random.SeedSequence(SEED)
+    store = ResultStore(RESULTS_PATH)
+    run_id = store.create_run(
+        seed=seed,
+        params={
+            "tokens": TOKENS,
+            "hours": HOURS,
+            "max_slippage_percent": DESIRED_MAX_SLIPPAGE_PERCENT,
+            "price_scenario": PRICE_SCENARIO,
+            "mean_block_hours": MEAN_BLOCK_HOURS,
+            "synthetic_model": SYNTHETIC_MODEL,
+        },
+        simulations_number=SIMULATIONS_NUMBER,
+        periods=HOURS,
     )
+    logging.info(f"Storing run {run_id} in {RESULTS_PATH}")
+
+    def run(prices: PriceSource) -> List[Optional[Metrics]]:
+        palantir = Palantir(
+            simulation_factory=partial(build_simulation, prices),
+            simulations_number=SIMULATIONS_NUMBER,
+            seed=seed,
+        )
+        return palantir.run(on_result=store.writer(run_id))
+
+    if PRICE_SCENARIO == SYNTHETIC:
+        simulations_metrics = run(load_market_model())
+    else:
+        # Prices are read once and shared with every worker
+        db = init_price_db(TOKENS, HOURS)
+        prices = PriceOracle.from_db(clock=Clock(HOURS), db=db, tokens=TOKENS, hours=HOURS, cache_dir=PRICES_CACHE_PATH)
+        with SharedPrices(prices.currencies, prices.prices) as shared_prices:
+            simulations_metrics = run(shared_prices.handle)
 
-    simulations_metrics = palantir.run()
     metrics = simulations_metrics[0]
 
     opened_positions = make_timeseries(metrics, Metric.POSITION_OPENED, MetricsAggregatorSum(), HOURS)
@@ -1,5 +1,7 @@
 from enum import Enum
-from typing import Dict, List, NewType
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
 
 from palantir.clock import Clock
 from palantir.types import Timestamp
@@ -15,55 +17,187 @@ class Metric(Enum):
     VAULT_LIQUIDITY_DAI = "vault_liquidity_dai"
 
 
-Metrics = NewType("Metrics", Dict[Metric, Dict[Timestamp, List[float]]])
+METRIC_INDEX: Dict[Metric, int] = {metric: index for index, metric in enumerate(Metric)}
+
+
+class Metrics:
+    """
+    Summary of the samples logged during a simulation: for every metric and every tick
+    the sum, count, min and max of its samples, stored as (metrics x periods) arrays.
+    Raw samples are only available for the metrics a `MetricsLogger` was asked to keep.
+    """
+    sums: np.ndarray
+    counts: np.ndarray
+    mins: np.ndarray
+    maxs: np.ndarray
+    samples: Dict[Metric, Dict[Timestamp, List[float]]]
+
+    def __init__(
+        self,
+        sums: np.ndarray,
+        counts: np.ndarray,
+        mins: np.ndarray,
+        maxs: np.ndarray,
+        samples: Optional[Dict[Metric, Dict[Timestamp, List[float]]]] = None,
+    ):
+        self.sums = sums
+        self.counts = counts
+        self.mins = mins
+        self.maxs = maxs
+        self.samples = samples if samples is not None else {}
+
+    @classmethod
+    def empty(cls, periods: int) -> "Metrics":
+        shape = (len(METRIC_INDEX), periods)
+        return cls(
+            sums=np.zeros(shape),
+            counts=np.zeros(shape, dtype=np.int64),
+            mins=np.full(shape, np.inf),
+            maxs=np.full(shape, -np.inf),
+        )
+
+    @property
+    def periods(self) -> int:
+        return self.sums.shape[1]
+
+    def __contains__(self, metric: Metric) -> bool:
+        return bool(self.counts[METRIC_INDEX[metric]].any())
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, Metrics)
+            and np.array_equal(self.sums, other.sums)
+            and np.array_equal(self.counts, other.counts)
+            and np.array_equal(self.mins, other.mins)
+            and np.array_equal(self.maxs, other.maxs)
+            and self.samples == other.samples
+        )
+
+    def __repr__(self) -> str:
+        return f"Metrics({', '.join(f'{metric.value}={self.counts[METRIC_INDEX[metric]].sum()}' for metric in Metric)})"
+
+    def sum(self, metric: Metric) -> np.ndarray:
+        return self.sums[METRIC_INDEX[metric]]
+
+    def count(self, metric: Metric) -> np.ndarray:
+        return self.counts[METRIC_INDEX[metric]]
+
+    def min(self, metric: Metric) -> np.ndarray:
+        return self.mins[METRIC_INDEX[metric]]
+
+    def max(self, metric: Metric) -> np.ndarray:
+        return self.maxs[METRIC_INDEX[metric]]
 
 
 class MetricsAggregator:
     def aggregate(self, samples: List[float]) -> float:
         ...
 
+    def timeseries(self, metrics: Metrics, metric: Metric) -> np.ndarray:
+        """
+        Aggregates the samples of every tick, ticks without samples are 0.0.
+        Aggregators that can be computed from the per-tick summaries override this to do it
+        for every tick at once, the others aggregate the raw samples, which must have been kept.
+        """
+        timeseries = np.zeros(metrics.periods)
+        if metric not in metrics:
+            return timeseries
+
+        assert metric in metrics.samples, (
+            f"{type(self).__name__} aggregates raw samples, which were not kept for {metric.value}: "
+            f"log it with MetricsLogger(keep_samples=[{metric}])"
+        )
+        for t, samples in metrics.samples[metric].items():
+            timeseries[t] = self.aggregate(samples)
+        return timeseries
+
 
 class MetricsAggregatorSum(MetricsAggregator):
     def aggregate(self, samples: List[float]) -> float:
         return sum(samples)
 
+    def timeseries(self, metrics: Metrics, metric: Metric) -> np.ndarray:
+        return metrics.sum(metric)
+
 
 class MetricsAggregatorAvg(MetricsAggregator):
     def aggregate(self, samples: List[float]) -> float:
         return sum(samples) / len(samples)
 
+    def timeseries(self, metrics: Metrics, metric: Metric) -> np.ndarray:
+        counts = metrics.count(metric)
+        return np.divide(metrics.sum(metric), counts, out=np.zeros(metrics.periods), where=counts > 0)
+
 
 class MetricsAggregatorMax(MetricsAggregator):
     def aggregate(self, samples: List[float]) -> float:
         return max(samples)
 
+    def timeseries(self, metrics: Metrics, metric: Metric) -> np.ndarray:
+        return np.where(metrics.count(metric) > 0, metrics.max(metric), 0.0)
+
 
 class MetricsAggregatorMin(MetricsAggregator):
-    def aggregare(self, samples: List[float]) -> float:
+    def aggregate(self, samples: List[float]) -> float:
         return min(samples)
 
+    def timeseries(self, metrics: Metrics, metric: Metric) -> np.ndarray:
+        return np.where(metrics.count(metric) > 0, metrics.min(metric), 0.0)
+
 
-def make_timeseries(metrics: Metrics, metric: Metric, aggregator: MetricsAggregator, periods: int) -> List[float]:
-    return [
-        aggregator.aggregate(metrics[metric][t])
-        if metric in metrics and t in metrics[metric] else 0.0
-        for t in range(periods)
-    ]
+def make_timeseries(metrics: Metrics, metric: Metric, aggregator: MetricsAggregator, periods: int) -> np.ndarray:
+    """
+    Returns exactly `periods` values, zero-padded after the end of the simulation.
+    """
+    timeseries = np.zeros(periods)
+    values = aggregator.timeseries(metrics, metric)[:periods]
+    timeseries[: len(values)] = values
+    return timeseries
 
 
 class MetricsLogger:
+    """
+    Keeps running per-tick sum, count, min and max of every metric in lists preallocated
+    to the clock's periods, which is cheaper than NumPy for one sample at a time; they
+    are turned into `Metrics` arrays once, when `metrics` is read.
+    Raw samples are only kept for the metrics in `keep_samples`.
+    """
     clock: Clock
-    metrics: Metrics
 
-    def __init__(self, clock: Clock):
+    def __init__(self, clock: Clock, keep_samples: Iterable[Metric] = ()):
         self.clock = clock
-        self.metrics = Metrics({})
+        self.keep_samples = set(keep_samples)
+
+        periods = clock.periods
+        self._sums: Dict[Metric, List[float]] = {metric: [0.0] * periods for metric in Metric}
+        self._counts: Dict[Metric, List[int]] = {metric: [0] * periods for metric in Metric}
+        self._mins: Dict[Metric, List[float]] = {metric: [np.inf] * periods for metric in Metric}
+        self._maxs: Dict[Metric, List[float]] = {metric: [-np.inf] * periods for metric in Metric}
+        self._samples: Dict[Metric, Dict[Timestamp, List[float]]] = {metric: {} for metric in self.keep_samples}
+
+    @property
+    def metrics(self) -> Metrics:
+        return Metrics(
+            sums=np.array([self._sums[metric] for metric in Metric], dtype=np.float64),
+            counts=np.array([self._counts[metric] for metric in Metric], dtype=np.int64),
+            mins=np.array([self._mins[metric] for metric in Metric], dtype=np.float64),
+            maxs=np.array([self._maxs[metric] for metric in Metric], dtype=np.float64),
+            samples={metric: {t: list(samples) for t, samples in self._samples[metric].items()} for metric in self._samples},
+        )
 
     def log(self, metric: Metric, sample: float=1.0) -> None:
-        if metric not in self.metrics:
-            self.metrics[metric] = {}
+        t = self.clock.time
+
+        self._sums[metric][t] += sample
+        self._counts[metric][t] += 1
+
+        mins = self._mins[metric]
+        if sample < mins[t]:
+            mins[t] = sample
 
-        if self.clock.time not in self.metrics[metric]:
-            self.metrics[metric][self.clock.time] = []
+        maxs = self._maxs[metric]
+        if sample > maxs[t]:
+            maxs[t] = sample
 
-        self.metrics[metric][self.clock.time].append(sample)
+        if metric in self.keep_samples:
+            self._samples[metric].setdefault(t, []).append(sample)
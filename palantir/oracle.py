@@ -1,13 +1,26 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Union
 
+import numpy as np
+
+from palantir.alignment import HOURLY, AlignedPrices, load_aligned_prices
 from palantir.clock import Clock
 from palantir.db import Quote
+from palantir.shared import SharedPricesHandle, attach_prices
 from palantir.types import Currency, Price
 
 
 class PriceOracle:
+    """
+    Provides the USD price of every currency at the current time of the clock.
+    Prices are stored in a single contiguous float64 matrix with one row per tick and
+    one column per currency, so reading one price, a few prices or a whole row never
+    copies data, and pickling the oracle serializes one buffer.
+    Oracles on aligned quotes keep their `gaps`, the mask of the prices filled in without quotes.
+    """
     clock: Clock
-    quotes: Dict[Currency, List[Quote]] = {}
+    currencies: List[Currency]
+    prices: np.ndarray
+    gaps: Optional[np.ndarray]
 
     def __init__(self, clock: Clock, quotes: Dict[Currency, List[Quote]]) -> None:
         quote_periods = [len(prices) for prices in quotes.values()]
@@ -16,8 +29,166 @@ class PriceOracle:
             len(set(quote_periods)) == 1
         ), "All price quote series must have the same length"
 
-        self.clock = clock
-        self.quotes = quotes
+        self._init(
+            clock=clock,
+            currencies=list(quotes.keys()),
+            prices=np.array(
+                [[quote.price for quote in token_quotes] for token_quotes in quotes.values()],
+                dtype=np.float64,
+            ).T,
+        )
+
+    @classmethod
+    def from_matrix(cls, clock: Clock, currencies: Sequence[Currency], prices: np.ndarray) -> "PriceOracle":
+        """
+        Builds an oracle on a (periods x currencies) price matrix, without copying it
+        when it already is a C-contiguous float64 array.
+        """
+        oracle = cls.__new__(cls)
+        oracle._init(clock=clock, currencies=list(currencies), prices=prices)
+        return oracle
+
+    @classmethod
+    def from_arrays(cls, clock: Clock, prices: Dict[Currency, Sequence[float]]) -> "PriceOracle":
+        price_periods = [len(token_prices) for token_prices in prices.values()]
+
+        assert (
+            len(set(price_periods)) == 1
+        ), "All price series must have the same length"
+
+        return cls.from_matrix(
+            clock=clock,
+            currencies=list(prices.keys()),
+            prices=np.column_stack([np.asarray(token_prices, dtype=np.float64) for token_prices in prices.values()]),
+        )
+
+    @classmethod
+    def from_db(
+        cls,
+        clock: Clock,
+        db: Optional[str],
+        tokens: Sequence[Currency],
+        hours: int,
+        cache_dir: Optional[str] = None,
+    ) -> "PriceOracle":
+        """
+        Builds an oracle on the last `hours` hourly prices of each token stored in the db at
+        url `db`, the default quote db if None. Quotes are aligned on the same hourly grid,
+        and the aligned prices are cached in `cache_dir` if given, see `load_aligned_prices`.
+        """
+        return cls.from_aligned(
+            clock=clock,
+            aligned=load_aligned_prices(tokens, hours, interval=HOURLY, url=db, cache_dir=cache_dir),
+        )
+
+    @classmethod
+    def from_aligned(cls, clock: Clock, aligned: AlignedPrices) -> "PriceOracle":
+        oracle = cls.from_matrix(clock=clock, currencies=aligned.currencies, prices=aligned.prices)
+        oracle.gaps = aligned.gaps
+        return oracle
+
+    @classmethod
+    def from_file(
+        cls,
+        clock: Clock,
+        path: str,
+        currencies: Optional[Sequence[Currency]] = None,
+        mmap_mode: Optional[str] = None,
+    ) -> "PriceOracle":
+        """
+        Loads prices saved with `save` (a .npz archive), or a raw (periods x currencies)
+        .npy matrix, in which case `currencies` must be given and the matrix can be memory
+        mapped with `mmap_mode`.
+        """
+        data = np.load(path, mmap_mode=mmap_mode)
+
+        if isinstance(data, np.ndarray):
+            assert currencies is not None, "Currencies are required to load a raw price matrix"
+            return cls.from_matrix(clock=clock, currencies=currencies, prices=data)
+
+        with data:
+            return cls.from_matrix(
+                clock=clock,
+                currencies=[Currency(str(currency)) for currency in data["currencies"]],
+                prices=data["prices"],
+            )
+
+    @classmethod
+    def from_shared(cls, clock: Clock, handle: SharedPricesHandle) -> "PriceOracle":
+        """
+        Builds an oracle on prices shared by another process through `shared.SharedPrices`,
+        without copying them.
+        """
+        return cls.from_matrix(clock=clock, currencies=handle.currencies, prices=attach_prices(handle))
+
+    def save(self, path: str) -> None:
+        np.savez(path, currencies=np.array(self.currencies), prices=self.prices)
+
+    @property
+    def periods(self) -> int:
+        return self.prices.shape[0]
+
+    def column(self, token: Currency) -> int:
+        return self._columns[token]
+
+    def columns(self, tokens: Sequence[Currency]) -> np.ndarray:
+        return np.array([self._columns[token] for token in tokens], dtype=np.intp)
 
     def get_price(self, token: Currency) -> Price:
-        return self.quotes[token][self.clock.time].price
+        return self.prices.item(self.clock.time, self._columns[token])
+
+    def get_prices(
+        self,
+        tokens: Union[Sequence[Currency], np.ndarray],
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Returns the current prices of `tokens`, given either as currencies or as column
+        indexes from `columns`; the latter, together with `out`, avoids any allocation.
+        """
+        if not isinstance(tokens, np.ndarray):
+            tokens = self.columns(tokens)
+        return np.take(self.prices[self.clock.time], tokens, out=out)
+
+    def get_rate(self, src_token: Currency, dst_token: Currency) -> float:
+        """
+        Returns the current price of `src_token` in units of `dst_token`.
+        """
+        return self.cross_rates().item(self._columns[src_token], self._columns[dst_token])
+
+    def cross_rates(self) -> np.ndarray:
+        """
+        Returns the current (currencies x currencies) matrix of exchange rates, where
+        rates[i, j] is the price of currency i in units of currency j.
+        The matrix is computed once per tick, the first time it is needed.
+        """
+        if self._cross_rates_time != self.clock.time:
+            prices = self.prices[self.clock.time]
+            np.divide(prices[:, np.newaxis], prices[np.newaxis, :], out=self._cross_rates)
+            self._cross_rates_time = self.clock.time
+        return self._cross_rates
+
+    def prices_at(self, time: int) -> np.ndarray:
+        """
+        Returns a read-only view of the prices of every currency at `time`, ordered as `currencies`.
+        """
+        return self.prices[time]
+
+    def _init(self, clock: Clock, currencies: List[Currency], prices: np.ndarray) -> None:
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+
+        assert prices.ndim == 2 and prices.shape[1] == len(
+            currencies
+        ), "Prices must be a (periods x currencies) matrix"
+
+        if prices.flags.writeable:
+            prices = prices.view()
+            prices.flags.writeable = False
+
+        self.clock = clock
+        self.currencies = currencies
+        self.prices = prices
+        self.gaps = None
+        self._columns: Dict[Currency, int] = {currency: column for column, currency in enumerate(currencies)}
+        self._cross_rates = np.empty((len(currencies), len(currencies)), dtype=np.float64)
+        self._cross_rates_time = -1
@@ -1,25 +1,155 @@
+import math
+import os
+from itertools import islice
 from multiprocess import Pool
-from typing import Callable, List
+from typing import Callable, Collection, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 from palantir.metrics import Metrics
+from palantir.randomness import RandomStream, Seed, spawn_seeds
+from palantir.reducers import MetricsReducer
 from palantir.simulation import Simulation
 
 
-def run_simulation(simulation: Simulation) -> Metrics:
+SimulationFactory = Callable[[RandomStream], Simulation]
+ReducerFactory = Callable[[], MetricsReducer]
+
+
+# Spawn key of the seeds of reducers, derived from the seed of a simulation they reduce, beyond
+# the keys of the children the simulation itself could spawn
+REDUCER_SPAWN_KEY = 2 ** 32 - 1
+
+
+# Set once per worker process by the pool initializer, so that the factories are not sent with every task
+_simulation_factory: Optional[SimulationFactory] = None
+_reducer_factory: Optional[ReducerFactory] = None
+
+
+def _init_worker(simulation_factory: SimulationFactory, reducer_factory: Optional[ReducerFactory] = None) -> None:
+    global _simulation_factory, _reducer_factory
+    _simulation_factory = simulation_factory
+    _reducer_factory = reducer_factory
+
+
+def _run_task(task: Tuple[int, np.random.SeedSequence]) -> Tuple[int, Metrics]:
+    index, seed = task
+    return index, run_simulation(_simulation_factory, seed)
+
+
+def _reduce_task(seeds: List[np.random.SeedSequence]) -> MetricsReducer:
+    return reduce_simulations(_simulation_factory, _reducer_factory(), seeds)
+
+
+def run_simulation(simulation_factory: SimulationFactory, seed: np.random.SeedSequence) -> Metrics:
+    simulation = simulation_factory(RandomStream(seed))
     return simulation.run()
 
 
+def reducer_seed(seed: np.random.SeedSequence) -> np.random.SeedSequence:
+    return np.random.SeedSequence(seed.entropy, spawn_key=(*seed.spawn_key, REDUCER_SPAWN_KEY))
+
+
+def reduce_simulations(
+    simulation_factory: SimulationFactory, reducer: MetricsReducer, seeds: List[np.random.SeedSequence]
+) -> MetricsReducer:
+    """
+    Adds the metrics of the simulations of the given seeds to the reducer, whose quantile
+    sketches are seeded from the first of them, so that every batch draws differently.
+    """
+    if seeds:
+        reducer.reseed(reducer_seed(seeds[0]))
+    for seed in seeds:
+        reducer.add(run_simulation(simulation_factory, seed))
+    return reducer
+
+
 class Palantir:
 
     def __init__(
         self,
-        simulation_factory: Callable[[], Simulation],
+        simulation_factory: SimulationFactory,
         simulations_number: int,
+        seed: Seed = None,
+        workers: Optional[int] = None,
+        chunksize: int = 1,
     ):
+        """
+        - simulation_factory: builds a simulation drawing all of its randomness from the given stream.
+        It is called inside the worker processes, so it should be cheap to pickle.
+        - simulations_number: number of independent simulations to run.
+        - seed: makes the whole run reproducible, each simulation gets its own stream spawned from it.
+        - workers: number of worker processes, defaults to the number of CPUs. With 0 workers
+        simulations are run one after the other in the current process.
+        - chunksize: number of simulations sent to a worker at once.
+        """
         self.simulation_factory = simulation_factory
         self.simulations_number = simulations_number
+        self.seed = seed
+        self.workers = workers
+        self.chunksize = chunksize
+
+    def run(
+        self, on_result: Optional[Callable[[int, Metrics], None]] = None, skip: Collection[int] = ()
+    ) -> List[Optional[Metrics]]:
+        """
+        Runs all simulations and returns their metrics, ordered by simulation index.
+        Skipped simulations are left as None.
+        """
+        results: List[Optional[Metrics]] = [None] * self.simulations_number
+        for index, metrics in self.run_iter(on_result, skip):
+            results[index] = metrics
+        return results
+
+    def run_iter(
+        self, on_result: Optional[Callable[[int, Metrics], None]] = None, skip: Collection[int] = ()
+    ) -> Iterator[Tuple[int, Metrics]]:
+        """
+        Yields (simulation index, metrics) as soon as each simulation completes, in completion
+        order, after calling `on_result` with them if given.
+        Simulations are built inside the workers and only their seeds are sent to them.
+        The simulations in `skip` are not run, e.g. to resume a run whose results were stored,
+        and the others get the same seeds they would get in a full run.
+        """
+        tasks = (
+            (index, seed)
+            for index, seed in enumerate(spawn_seeds(self.seed, self.simulations_number))
+            if index not in skip
+        )
+
+        if self.workers == 0:
+            for index, seed in tasks:
+                metrics = run_simulation(self.simulation_factory, seed)
+                if on_result is not None:
+                    on_result(index, metrics)
+                yield index, metrics
+            return
+
+        with Pool(self.workers, initializer=_init_worker, initargs=(self.simulation_factory,)) as pool:
+            for index, metrics in pool.imap_unordered(_run_task, tasks, chunksize=self.chunksize):
+                if on_result is not None:
+                    on_result(index, metrics)
+                yield index, metrics
+
+    def reduce(self, reducer_factory: ReducerFactory) -> MetricsReducer:
+        """
+        Runs all simulations and folds their metrics into a single summary, see `MetricsReducer`.
+        Each worker reduces a whole batch of simulations locally and only sends back its
+        summary, so memory and traffic do not grow with the number of simulations.
+        `reducer_factory` builds an empty reducer and is sent once to every worker.
+        """
+        seeds = spawn_seeds(self.seed, self.simulations_number)
+
+        if self.workers == 0:
+            return reduce_simulations(self.simulation_factory, reducer_factory(), list(seeds))
+
+        # A few batches per worker keep them all busy until the end without many summaries to merge
+        workers = self.workers or os.cpu_count() or 1
+        batch_size = max(self.chunksize, math.ceil(self.simulations_number / (4 * workers)))
+        batches = iter(lambda: list(islice(seeds, batch_size)), [])
 
-    def run(self) -> List[Metrics]:
-        simulations = [self.simulation_factory() for _ in range(self.simulations_number)]
-        with Pool(12) as pool:
-            return pool.map(run_simulation, simulations)
+        result = reducer_factory()
+        with Pool(workers, initializer=_init_worker, initargs=(self.simulation_factory, reducer_factory)) as pool:
+            for reducer in pool.imap_unordered(_reduce_task, batches):
+                result.merge(reducer)
+        return result
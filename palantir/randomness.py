@@ -0,0 +1,124 @@
+import math
+from typing import Iterator, List, Sequence, TypeVar, Union
+
+import numpy as np
+
+from palantir.types import Price
+
+
+T = TypeVar("T")
+
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+class RandomStream:
+    """
+    Source of random numbers for a single simulation, backed by a NumPy generator.
+    Normal and uniform samples are drawn in large blocks and handed out one at a time,
+    which is much cheaper than one generator call per sample.
+    Streams created from the same seed produce the same samples, and streams spawned
+    from one another are statistically independent, also across forked processes.
+    """
+    generator: np.random.Generator
+    seed_sequence: np.random.SeedSequence
+
+    def __init__(self, seed: Seed = None, block_size: int = 4096):
+        self.seed_sequence = (
+            seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        )
+        self.generator = np.random.default_rng(self.seed_sequence)
+        self.block_size = block_size
+        self._normals: List[float] = []
+        self._normals_index = 0
+        self._uniforms: List[float] = []
+        self._uniforms_index = 0
+
+    def spawn(self, n: int) -> List["RandomStream"]:
+        """
+        Returns `n` new independent streams derived from this stream's seed.
+        """
+        return [
+            RandomStream(seed_sequence, self.block_size)
+            for seed_sequence in self.seed_sequence.spawn(n)
+        ]
+
+    def random(self) -> float:
+        """
+        Returns a sample from the uniform distribution over [0, 1).
+        """
+        if self._uniforms_index == len(self._uniforms):
+            self._uniforms = self.generator.random(self.block_size).tolist()
+            self._uniforms_index = 0
+
+        sample = self._uniforms[self._uniforms_index]
+        self._uniforms_index += 1
+        return sample
+
+    def uniform(self, low: float = 0.0, high: float = 1.0) -> float:
+        return low + (high - low) * self.random()
+
+    def gauss(self, mu: float = 0.0, sigma: float = 1.0) -> float:
+        if self._normals_index == len(self._normals):
+            self._normals = self.generator.standard_normal(self.block_size).tolist()
+            self._normals_index = 0
+
+        sample = self._normals[self._normals_index]
+        self._normals_index += 1
+        return mu + sigma * sample
+
+    def geometric(self, probability: float) -> int:
+        """
+        Returns the number of trials up to and including the first success, when every trial
+        succeeds with `probability`, by inverting the geometric distribution.
+        """
+        assert 0.0 < probability <= 1.0, "The probability of success must be in (0, 1]"
+        if probability == 1.0:
+            return 1
+        return int(math.log1p(-self.random()) / math.log1p(-probability)) + 1
+
+    def choice(self, population: Sequence[T]) -> T:
+        return population[int(self.random() * len(population))]
+
+    def uniforms(self, n: int) -> np.ndarray:
+        return self.generator.random(n)
+
+    def normals(self, n: int) -> np.ndarray:
+        return self.generator.standard_normal(n)
+
+
+class GaussianSlippage:
+    """
+    We model slippage as a normally distributed random variable with mean equal to the current price
+    and variance proportional to a percentage of the price as described by max desired slippage.
+    """
+
+    def __init__(self, random_stream: RandomStream, max_slippage_percent: float):
+        self.random_stream = random_stream
+        self.max_slippage_percent = max_slippage_percent
+
+    def __call__(self, price: Price) -> Price:
+        return self.random_stream.gauss(price, price * self.max_slippage_percent / 100.0)
+
+    def apply_many(self, prices: np.ndarray) -> np.ndarray:
+        """
+        Applies an independent slippage to each price of the array at once.
+        """
+        return prices + prices * self.max_slippage_percent / 100.0 * self.random_stream.normals(len(prices))
+
+
+def make_random_streams(seed: Seed, n: int) -> List[RandomStream]:
+    """
+    Returns `n` independent and reproducible streams, one per simulation.
+    """
+    return RandomStream(seed).spawn(n)
+
+
+def spawn_seeds(seed: Seed, n: int) -> Iterator[np.random.SeedSequence]:
+    """
+    Lazily yields the seeds of the streams returned by `make_random_streams`, which are
+    much cheaper than streams to send to other processes.
+    """
+    seed_sequence = RandomStream(seed).seed_sequence
+    for _ in range(n):
+        yield seed_sequence.spawn(1)[0]
@@ -0,0 +1,206 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from palantir.metrics import (
+    METRIC_INDEX,
+    Metric,
+    Metrics,
+    MetricsAggregator,
+    MetricsAggregatorSum,
+)
+from palantir.randomness import Seed
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch over many columns at once, in the spirit of KLL.
+    Every added value is an array of the sketch's shape, and each column keeps its own
+    approximate distribution. Values are buffered in levels of at most `k` items; a full
+    level is sorted and every other item is promoted to the next level, where it counts
+    twice as much. Memory is O(k log(n / k)) items per column whatever the number of values n.
+    Which half of a level is promoted is drawn from `seed`: sketches to be merged should be
+    seeded differently, or their errors are correlated.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], k: int = 64, seed: Seed = 0):
+        self.shape = shape
+        self.k = k
+        self._buffers: List[List[np.ndarray]] = []
+        self.reseed(seed)
+
+    @property
+    def count(self) -> int:
+        """
+        Total weight of the values in the sketch, i.e. the number of values added.
+        """
+        return sum(len(self._items(level)) << level for level in range(len(self._buffers)))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._items(level).nbytes for level in range(len(self._buffers)))
+
+    def reseed(self, seed: Seed) -> None:
+        self._generator = np.random.default_rng(seed)
+
+    def add(self, values: np.ndarray) -> None:
+        self._push(0, values[np.newaxis])
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        for level in range(len(other._buffers)):
+            items = other._items(level)
+            if len(items):
+                self._push(level, items)
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        Returns the approximate `q` quantile of every column.
+        """
+        items = [self._items(level) for level in range(len(self._buffers))]
+        values = np.concatenate([level_items for level_items in items if len(level_items)])
+        weights = np.concatenate(
+            [np.full(len(level_items), 1 << level) for level, level_items in enumerate(items) if len(level_items)]
+        )
+
+        order = np.argsort(values, axis=0)
+        sorted_values = np.take_along_axis(values, order, axis=0)
+        cumulative_weights = np.cumsum(weights[order], axis=0)
+
+        rank = q * cumulative_weights[-1]
+        index = np.minimum((cumulative_weights < rank).sum(axis=0), len(values) - 1)
+
+        return np.take_along_axis(sorted_values, index[np.newaxis], axis=0)[0]
+
+    def _items(self, level: int) -> np.ndarray:
+        buffer = self._buffers[level]
+        if len(buffer) > 1:
+            self._buffers[level] = buffer = [np.concatenate(buffer)]
+        return buffer[0] if buffer else np.empty((0,) + self.shape)
+
+    def _push(self, level: int, items: np.ndarray) -> None:
+        while len(self._buffers) <= level:
+            self._buffers.append([])
+        self._buffers[level].append(items)
+
+        if sum(len(buffered) for buffered in self._buffers[level]) >= self.k:
+            full = np.sort(self._items(level), axis=0)
+            self._buffers[level] = []
+            if len(full) % 2:
+                # Keep one item at this level, so that the promoted items have an even count
+                self._buffers[level] = [full[-1:]]
+                full = full[:-1]
+            offset = int(self._generator.integers(2))
+            self._push(level + 1, full[offset::2])
+
+
+class MetricsReducer:
+    """
+    Folds the metrics of many simulations into a mergeable summary of constant size:
+    for every metric and tick, the mean and variance (Welford) across simulations, the
+    min and max, and a quantile sketch for percentile bands.
+    Each simulation contributes one timeseries per metric, aggregated with the metric's
+    aggregator (sums by default).
+    """
+    count: int
+    mean: np.ndarray
+    m2: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+    def __init__(
+        self,
+        periods: int,
+        aggregators: Optional[Dict[Metric, MetricsAggregator]] = None,
+        quantile_metrics: Optional[Iterable[Metric]] = None,
+        sketch_size: int = 64,
+        seed: Seed = 0,
+    ):
+        """
+        - periods: number of ticks of every simulation.
+        - aggregators: how the samples of a tick are aggregated, per metric.
+        - quantile_metrics: metrics to keep quantile sketches for, all of them by default.
+        - sketch_size: size of the quantile sketches' levels, larger is more accurate.
+        - seed: seeds the quantile sketches, see `reseed`.
+        """
+        self.periods = periods
+        self.aggregators = aggregators if aggregators is not None else {}
+        self.quantile_metrics = list(quantile_metrics) if quantile_metrics is not None else list(Metric)
+
+        shape = (len(METRIC_INDEX), periods)
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.sketch = QuantileSketch((len(self.quantile_metrics), periods), k=sketch_size, seed=seed)
+
+    def reseed(self, seed: Seed) -> "MetricsReducer":
+        """
+        Seeds the quantile sketches, e.g. from the simulations being reduced, so that the
+        reducers of different workers make independent errors.
+        """
+        self.sketch.reseed(seed)
+        return self
+
+    def add(self, metrics: Metrics) -> "MetricsReducer":
+        values = np.stack(
+            [
+                self.aggregators.get(metric, MetricsAggregatorSum()).timeseries(metrics, metric)[: self.periods]
+                for metric in Metric
+            ]
+        )
+
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+        np.minimum(self.minimum, values, out=self.minimum)
+        np.maximum(self.maximum, values, out=self.maximum)
+        self.sketch.add(values[[METRIC_INDEX[metric] for metric in self.quantile_metrics]])
+
+        return self
+
+    def merge(self, other: "MetricsReducer") -> "MetricsReducer":
+        if other.count == 0:
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.sketch.merge(other.sketch)
+
+        return self
+
+    def average(self, metric: Metric) -> np.ndarray:
+        return self.mean[METRIC_INDEX[metric]]
+
+    def variance(self, metric: Metric) -> np.ndarray:
+        """
+        Sample variance across simulations of every tick.
+        """
+        if self.count < 2:
+            return np.zeros(self.periods)
+        return self.m2[METRIC_INDEX[metric]] / (self.count - 1)
+
+    def std(self, metric: Metric) -> np.ndarray:
+        return np.sqrt(self.variance(metric))
+
+    def min(self, metric: Metric) -> np.ndarray:
+        return self.minimum[METRIC_INDEX[metric]]
+
+    def max(self, metric: Metric) -> np.ndarray:
+        return self.maximum[METRIC_INDEX[metric]]
+
+    def quantile(self, metric: Metric, q: float) -> np.ndarray:
+        return self.sketch.quantile(q)[self.quantile_metrics.index(metric)]
+
+    def percentile_bands(self, metric: Metric, percentiles: Sequence[float] = (5, 25, 50, 75, 95)) -> np.ndarray:
+        """
+        Returns a (percentiles x periods) array of approximate percentiles across simulations.
+        """
+        return np.stack([self.quantile(metric, percentile / 100.0) for percentile in percentiles])
@@ -0,0 +1,296 @@
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from palantir.alignment import HOURLY, load_aligned_prices
+from palantir.types import Currency
+
+
+GBM = "gbm"
+JUMP_DIFFUSION = "jump_diffusion"
+REGIME_SWITCHING = "regime_switching"
+
+CALM, TURBULENT = 0, 1
+
+
+@dataclass
+class MarketModel:
+    """
+    Parameters of the price models, per currency and per tick of the calibration data.
+    Drifts and volatilities are those of log returns, and `correlation` is the correlation of
+    the log returns of ticks without jumps. Jumps happen `jump_intensity` times per tick on
+    average, with normally distributed log sizes. Regimes have their own drifts and
+    volatilities (regimes x currencies) and switch according to `regime_transitions`.
+    """
+    currencies: List[Currency]
+    initial_prices: np.ndarray
+    drift: np.ndarray
+    volatility: np.ndarray
+    correlation: np.ndarray
+    jump_intensity: np.ndarray
+    jump_mean: np.ndarray
+    jump_std: np.ndarray
+    regime_drift: np.ndarray
+    regime_volatility: np.ndarray
+    regime_transitions: np.ndarray
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            np.savez(file, **{**self.__dict__, "currencies": np.array(self.currencies)})
+
+    @classmethod
+    def load(cls, path: str) -> "MarketModel":
+        with np.load(path) as data:
+            fields = {name: data[name] for name in data.files}
+        fields["currencies"] = [Currency(str(currency)) for currency in fields["currencies"]]
+        return cls(**fields)
+
+
+def calibrate(
+    currencies: Sequence[Currency],
+    prices: np.ndarray,
+    jump_threshold: float = 4.0,
+    regime_window: int = 24,
+    gaps: Optional[np.ndarray] = None,
+) -> MarketModel:
+    """
+    Calibrates the models on a (periods x currencies) matrix of aligned prices.
+    Log returns further than `jump_threshold` standard deviations from their mean are jumps,
+    the others make the diffusion. Ticks are turbulent when the volatility of the market over
+    the last `regime_window` ticks is above its median, and calm otherwise.
+    Returns from or to the prices flagged in `gaps`, which were filled in without quotes, are
+    left out, as their null returns would understate the volatility.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    log_returns = np.diff(np.log(prices), axis=0)
+    assert len(log_returns) > regime_window, "Not enough prices to calibrate the models"
+
+    quoted = np.ones(log_returns.shape, dtype=bool) if gaps is None else ~(gaps[1:] | gaps[:-1])
+    assert (quoted.sum(axis=0) > 1).all(), "Not enough quoted prices to calibrate the models"
+    log_returns = np.where(quoted, log_returns, np.nan)
+
+    standardized = (log_returns - np.nanmean(log_returns, axis=0)) / _nonzero(np.nanstd(log_returns, axis=0))
+    jumps = np.abs(np.nan_to_num(standardized)) > jump_threshold
+    diffusion = np.where(jumps, np.nan, log_returns)
+
+    jump_returns = np.where(jumps, log_returns, np.nan)
+    jump_counts = jumps.sum(axis=0)
+    has_jumps = jump_counts > 0
+    jump_mean = np.zeros(len(currencies))
+    jump_std = np.zeros(len(currencies))
+    jump_mean[has_jumps] = np.nanmean(jump_returns[:, has_jumps], axis=0)
+    jump_std[has_jumps] = np.nanstd(jump_returns[:, has_jumps], axis=0)
+
+    # Market volatility is the average squared standardized return of the recent ticks
+    squared = np.where(quoted, standardized ** 2, 0.0).sum(axis=1) / np.maximum(quoted.sum(axis=1), 1)
+    turbulence = np.convolve(squared, np.ones(regime_window) / regime_window, mode="same")
+    regimes = (turbulence > np.median(turbulence)).astype(np.int64)
+    regime_drift = np.stack([np.nanmean(diffusion[regimes == regime], axis=0) for regime in (CALM, TURBULENT)])
+    regime_volatility = np.stack([np.nanstd(diffusion[regimes == regime], axis=0) for regime in (CALM, TURBULENT)])
+
+    # One pseudo-count per transition, so that no regime is absorbing
+    transitions = np.ones((2, 2))
+    np.add.at(transitions, (regimes[:-1], regimes[1:]), 1.0)
+
+    return MarketModel(
+        currencies=list(currencies),
+        initial_prices=prices[-1].copy(),
+        drift=np.nanmean(diffusion, axis=0),
+        volatility=np.nanstd(diffusion, axis=0),
+        correlation=_correlation(log_returns[~jumps.any(axis=1) & quoted.all(axis=1)]),
+        jump_intensity=jump_counts / quoted.sum(axis=0),
+        jump_mean=jump_mean,
+        jump_std=jump_std,
+        regime_drift=regime_drift,
+        regime_volatility=regime_volatility,
+        regime_transitions=transitions / transitions.sum(axis=1, keepdims=True),
+    )
+
+
+def calibrate_from_db(
+    tokens: Sequence[Currency],
+    hours: int,
+    url: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+) -> MarketModel:
+    """
+    Calibrates the models on the last `hours` hourly prices of the tokens stored in the db,
+    leaving out the returns of the prices filled in without quotes.
+    """
+    aligned = load_aligned_prices(tokens, hours, interval=HOURLY, url=url, cache_dir=cache_dir)
+    return calibrate(aligned.currencies, aligned.prices, gaps=aligned.gaps)
+
+
+def _nonzero(values: np.ndarray) -> np.ndarray:
+    return np.where(values > 0.0, values, 1.0)
+
+
+def _correlation(log_returns: np.ndarray) -> np.ndarray:
+    if log_returns.shape[1] == 1:
+        return np.ones((1, 1))
+    correlation = np.corrcoef(log_returns, rowvar=False)
+    # Constant series have no correlation, and the estimate must be positive definite
+    correlation = np.nan_to_num(correlation)
+    np.fill_diagonal(correlation, 1.0)
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    correlation = eigenvectors @ np.diag(np.maximum(eigenvalues, 1e-10)) @ eigenvectors.T
+    scale = np.sqrt(np.diag(correlation))
+    return correlation / np.outer(scale, scale)
+
+
+def correlated_normals(model: MarketModel, generator: np.random.Generator, shape: tuple) -> np.ndarray:
+    """
+    Returns standard normals of shape (*shape, currencies) correlated across currencies.
+    """
+    cholesky = np.linalg.cholesky(model.correlation)
+    return generator.standard_normal((*shape, len(model.currencies))) @ cholesky.T
+
+
+def gbm_log_returns(model: MarketModel, generator: np.random.Generator, paths: int, steps: int) -> np.ndarray:
+    return model.drift + model.volatility * correlated_normals(model, generator, (paths, steps))
+
+
+def jump_diffusion_log_returns(
+    model: MarketModel, generator: np.random.Generator, paths: int, steps: int
+) -> np.ndarray:
+    """
+    Merton jump-diffusion: correlated diffusion plus a Poisson number of independent jumps.
+    """
+    shape = (paths, steps, len(model.currencies))
+    jumps = generator.poisson(model.jump_intensity, shape)
+    jump_sizes = jumps * model.jump_mean + np.sqrt(jumps) * model.jump_std * generator.standard_normal(shape)
+    return gbm_log_returns(model, generator, paths, steps) + jump_sizes
+
+
+def regime_switching_log_returns(
+    model: MarketModel, generator: np.random.Generator, paths: int, steps: int
+) -> np.ndarray:
+    """
+    Every path switches between calm and turbulent regimes along a Markov chain, starting from
+    its stationary distribution, and draws correlated returns with the drift and volatility of
+    its current regime.
+    """
+    stay = np.diag(model.regime_transitions)
+    stationary = (1.0 - stay[TURBULENT]) / (2.0 - stay[CALM] - stay[TURBULENT])
+
+    regimes = np.empty((paths, steps), dtype=np.int64)
+    regimes[:, :1] = (generator.random(paths) >= stationary)[:, None]  # Also without steps
+    uniforms = generator.random((paths, steps))
+    for step in range(1, steps):
+        previous = regimes[:, step - 1]
+        regimes[:, step] = np.where(uniforms[:, step] < stay[previous], previous, 1 - previous)
+
+    normals = correlated_normals(model, generator, (paths, steps))
+    return model.regime_drift[regimes] + model.regime_volatility[regimes] * normals
+
+
+LOG_RETURNS = {
+    GBM: gbm_log_returns,
+    JUMP_DIFFUSION: jump_diffusion_log_returns,
+    REGIME_SWITCHING: regime_switching_log_returns,
+}
+
+
+def generate_paths(
+    model: MarketModel,
+    kind: str,
+    paths: int,
+    periods: int,
+    generator: np.random.Generator,
+    dtype: np.dtype = np.float64,
+) -> np.ndarray:
+    """
+    Returns (paths x periods x currencies) prices starting from the model's initial prices.
+    Each `paths[i]` is a C-contiguous price matrix that `PriceOracle.from_matrix` uses without
+    copying when `dtype` is float64. Paths of a single period are just the initial prices.
+    """
+    assert periods >= 1, f"Paths need at least one period, got {periods}"
+    log_returns = LOG_RETURNS[kind](model, generator, paths, periods - 1)
+
+    log_prices = np.empty((paths, periods, len(model.currencies)), dtype=dtype)
+    log_prices[:, 0] = np.log(model.initial_prices)
+    np.cumsum(log_returns, axis=1, out=log_returns)
+    log_prices[:, 1:] = log_prices[:, :1] + log_returns
+
+    prices = np.exp(log_prices, out=log_prices)
+    prices[:, 0] = model.initial_prices  # Exactly, without the rounding of exp(log(price))
+    return prices
+
+
+class BlockBootstrap:
+    """
+    Stationary bootstrap (Politis and Romano) of historical prices: new paths are made of blocks
+    of consecutive historical log returns, starting at random ticks and with geometrically
+    distributed lengths of `mean_block_length` ticks on average, wrapping around the end of the
+    history. Blocks keep the autocorrelation and volatility clustering of the history, and
+    whole rows of returns are drawn, which keeps the correlation across currencies.
+    """
+    currencies: List[Currency]
+    log_returns: np.ndarray
+    initial_prices: np.ndarray
+
+    def __init__(
+        self,
+        currencies: Sequence[Currency],
+        prices: np.ndarray,
+        mean_block_length: float = 24.0,
+        initial_prices: Optional[np.ndarray] = None,
+    ):
+        """
+        - prices: (periods x currencies) aligned historical prices.
+        - initial_prices: the first prices of every path, the first historical prices by default.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        self.currencies = list(currencies)
+        self.log_returns = np.diff(np.log(prices), axis=0)
+        self.mean_block_length = mean_block_length
+        self.initial_prices = (
+            prices[0].copy() if initial_prices is None else np.asarray(initial_prices, dtype=np.float64)
+        )
+
+    def indices(self, generator: np.random.Generator, paths: int, steps: int) -> np.ndarray:
+        """
+        Returns the (paths x steps) indices of the historical returns making each path.
+        """
+        history = len(self.log_returns)
+        new_block = generator.random((paths, steps)) < 1.0 / self.mean_block_length
+        new_block[:, :1] = True  # Also without steps, for paths of a single period
+
+        # Every step is the start of its block plus its offset in the block
+        blocks = np.flatnonzero(new_block)
+        block_starts = generator.integers(0, history, len(blocks))
+        block_of_step = np.cumsum(new_block.ravel()) - 1
+        offsets = np.arange(paths * steps) - blocks[block_of_step]
+
+        return ((block_starts[block_of_step] + offsets) % history).reshape(paths, steps)
+
+    def generate(self, generator: np.random.Generator, paths: int, periods: int) -> np.ndarray:
+        """
+        Returns (paths x periods x currencies) prices, see `generate_paths`.
+        """
+        assert periods >= 1, f"Paths need at least one period, got {periods}"
+        log_returns = self.log_returns[self.indices(generator, paths, periods - 1)]
+
+        prices = np.empty((paths, periods, len(self.currencies)), dtype=np.float64)
+        prices[:, 0] = self.initial_prices
+        np.cumsum(log_returns, axis=1, out=log_returns)
+        np.exp(log_returns, out=log_returns)
+        np.multiply(self.initial_prices, log_returns, out=prices[:, 1:])
+        return prices
+
+    def path(self, generator: np.random.Generator, periods: int) -> np.ndarray:
+        """
+        Returns a single (periods x currencies) path, e.g. for the oracle of one simulation.
+        """
+        return self.generate(generator, 1, periods)[0]
+
+    def iter_paths(
+        self, generator: np.random.Generator, paths: int, periods: int, chunk_size: int = 100
+    ) -> Iterator[np.ndarray]:
+        """
+        Lazily yields `paths` paths generated `chunk_size` at a time, so that only one chunk
+        is ever in memory.
+        """
+        for first in range(0, paths, chunk_size):
+            yield from self.generate(generator, min(chunk_size, paths - first), periods)
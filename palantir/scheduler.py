@@ -0,0 +1,76 @@
+import heapq
+from typing import List, Sequence, Tuple
+
+from palantir.clock import Clock
+from palantir.ithil import Ithil
+from palantir.trader import Trader
+from palantir.types import PositionId
+
+
+# Within a tick a trader first opens and then closes, as in `Trader.trade`
+OPEN, CLOSE = 0, 1
+
+
+class EventScheduler:
+    """
+    Runs the traders of a simulation only at the ticks they act, instead of drawing whether
+    to open or to close at every tick. The next tick a trader opens a position, and the tick
+    each position is closed, are drawn from the geometric distribution of the number of ticks
+    up to the first success, which is what drawing at every tick with the same probability
+    amounts to. Events are kept in a heap ordered by (tick, trader, kind, position), so that
+    due events run in the same order as traders trading in turn. Positions liquidated before
+    their close event are skipped when the event comes up.
+    """
+    clock: Clock
+    ithil: Ithil
+    traders: Sequence[Trader]
+
+    def __init__(self, clock: Clock, ithil: Ithil, traders: Sequence[Trader]):
+        self.clock = clock
+        self.ithil = ithil
+        self.traders = traders
+        self._queue: List[Tuple[int, int, int, PositionId]] = []
+
+        # The first draw happens at the current tick, i.e. after zero ticks
+        for index, trader in enumerate(traders):
+            self._schedule_open(index, clock.time - 1)
+            for position_id in trader.active_positions:
+                self._schedule_close(index, position_id, clock.time - 1)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def run_due(self) -> None:
+        """
+        Runs the events of the current tick, including the closes due at the same tick as
+        the opening of their position.
+        """
+        now = self.clock.time
+        queue = self._queue
+        while queue and queue[0][0] <= now:
+            _, index, kind, position_id = heapq.heappop(queue)
+            trader = self.traders[index]
+            if kind == OPEN:
+                opened_id = trader.open_position()
+                self._schedule_open(index, now)
+                if opened_id is not None:
+                    self._schedule_close(index, opened_id, now - 1)
+            elif position_id in self.ithil.active_positions_view:
+                trader.close_position(position_id)
+
+    def _schedule_open(self, index: int, after: int) -> None:
+        trader = self.traders[index]
+        if trader.open_position_probability > 0.0:
+            delay = trader.random_stream.geometric(trader.open_position_probability)
+            self._push(after + delay, index, OPEN, PositionId(-1))
+
+    def _schedule_close(self, index: int, position_id: PositionId, after: int) -> None:
+        trader = self.traders[index]
+        if trader.close_position_probability > 0.0:
+            delay = trader.random_stream.geometric(trader.close_position_probability)
+            self._push(after + delay, index, CLOSE, position_id)
+
+    def _push(self, time: int, index: int, kind: int, position_id: PositionId) -> None:
+        # Events after the end of the simulation would never run
+        if time < self.clock.periods:
+            heapq.heappush(self._queue, (time, index, kind, position_id))
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from palantir.types import Currency
+
+
+@dataclass(frozen=True)
+class SharedPricesHandle:
+    """
+    Everything a worker process needs to attach to shared prices, cheap to pickle.
+    """
+    name: str
+    periods: int
+    currencies: Tuple[Currency, ...]
+
+
+class SharedPrices:
+    """
+    A (periods x currencies) price matrix copied once into a shared memory block, so
+    that worker processes can build oracles on it without copying or unpickling prices.
+    Use it as a context manager: the block is released when the context exits, after
+    the workers using it are done.
+    """
+    handle: SharedPricesHandle
+
+    def __init__(self, currencies: Sequence[Currency], prices: np.ndarray):
+        prices = np.asarray(prices, dtype=np.float64)
+        assert prices.ndim == 2 and prices.shape[1] == len(
+            currencies
+        ), "Prices must be a (periods x currencies) matrix"
+
+        self._shared_memory = SharedMemory(create=True, size=max(prices.nbytes, 1))
+        np.ndarray(prices.shape, dtype=np.float64, buffer=self._shared_memory.buf)[:] = prices
+
+        self.handle = SharedPricesHandle(
+            name=self._shared_memory.name,
+            periods=prices.shape[0],
+            currencies=tuple(currencies),
+        )
+
+    def __enter__(self) -> "SharedPrices":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def release(self) -> None:
+        _attached.pop(self.handle.name, None)
+        try:
+            self._shared_memory.close()
+        except BufferError:
+            pass  # Oracles in this process still use the prices, the memory is freed with them
+        self._shared_memory.unlink()
+
+
+# Shared memory blocks attached by this process, kept open for as long as the process lives
+_attached: Dict[str, Tuple[SharedMemory, np.ndarray]] = {}
+
+
+def attach_prices(handle: SharedPricesHandle) -> np.ndarray:
+    """
+    Returns a read-only, zero-copy view of the shared prices, attaching to the shared
+    memory block only the first time it is needed in each process.
+    """
+    if handle.name not in _attached:
+        shared_memory = SharedMemory(name=handle.name)
+        prices = np.ndarray(
+            (handle.periods, len(handle.currencies)), dtype=np.float64, buffer=shared_memory.buf
+        )
+        prices.flags.writeable = False
+        _attached[handle.name] = (shared_memory, prices)
+
+    return _attached[handle.name][1]
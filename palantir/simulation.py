@@ -1,15 +1,22 @@
-import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from palantir.clock import Clock
 from palantir.ithil import Ithil
 from palantir.metrics import Metric, Metrics
 from palantir.oracle import PriceOracle
+from palantir.scheduler import EventScheduler
 from palantir.trader import Trader
+from palantir.trader_pool import TraderPool
 from palantir.types import Account, Currency
 
 
 class Simulation:
+    """
+    Runs the traders and the liquidations tick by tick until the clock ends.
+    With `event_driven` traders only run at the ticks they open or close a position, see
+    `EventScheduler`, which is much cheaper for many traders trading rarely.
+    A `trader_pool` trades after the traders, and is the way to simulate large populations.
+    """
     clock: Clock
     ithil: Ithil
     traders: List[Trader]
@@ -19,22 +26,36 @@ class Simulation:
         clock: Clock,
         ithil: Ithil,
         traders: List[Trader],
+        event_driven: bool = False,
+        trader_pool: Optional[TraderPool] = None,
     ):
         self.clock = clock
         self.ithil = ithil
         self.traders = traders
+        self._traders_by_account: Dict[Account, Trader] = {
+            trader.account: trader for trader in traders
+        }
+        self.scheduler: Optional[EventScheduler] = EventScheduler(clock, ithil, traders) if event_driven else None
+        self.trader_pool = trader_pool
 
     def run(self) -> Metrics:
         while True:
-            logging.info(f"TIME: {self.clock._time}")
-            logging.info(f"POSITIONS: {self.ithil.active_positions}")
-            for trader in self.traders:
-                trader.trade()
-                for position_id in trader.active_positions:
-                    if self.ithil.can_liquidate_position(position_id):
-                        position = self.ithil.positions[position_id]
-                        trader_pl, liquidator_pl = self.ithil.liquidate_position(position_id)
-                        trader.liquidity[position.owed_token] += trader_pl
+            if self.scheduler is not None:
+                self.scheduler.run_due()
+            else:
+                for trader in self.traders:
+                    trader.trade()
+            if self.trader_pool is not None:
+                self.trader_pool.trade()
+
+            # All open positions are checked for liquidation at once, after every trader has traded
+            for position_id, (trader_pl, _) in self.ithil.liquidate_positions().items():
+                position = self.ithil.positions[position_id]
+                trader = self._traders_by_account.get(position.owner)
+                if trader is not None:
+                    trader.liquidity[position.owed_token] += trader_pl
+                elif self.trader_pool is not None:
+                    self.trader_pool.liquidated(position, trader_pl)
 
             self.ithil.metrics_logger.log(
                 Metric.INSURANCE_POOL_LIQUIDITY_DAI,
@@ -0,0 +1,259 @@
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set
+
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    func,
+    inspect,
+    select,
+)
+
+from palantir.metrics import Metric, Metrics, MetricsAggregator, MetricsAggregatorSum
+from palantir.randomness import Seed
+from palantir.types import Timestamp
+
+
+RunId = str
+
+
+metadata = MetaData()
+
+
+runs = Table(
+    "runs",
+    metadata,
+    Column("run_id", String, primary_key=True),
+    Column("seed", String),
+    Column("params", String),
+    Column("simulations_number", Integer),
+    Column("periods", Integer),
+    # The rest of the seed sequence, as a JSON list, and its pool size
+    Column("spawn_key", String),
+    Column("pool_size", Integer),
+)
+
+
+simulations = Table(
+    "simulations",
+    metadata,
+    Column("run_id", String, primary_key=True),
+    Column("simulation", Integer, primary_key=True),
+    Column("path", String),
+    Column("summary", String),
+    Column("created_at", Float),
+)
+
+
+# Pool size of a `SeedSequence` by default, which runs stored without theirs were created with
+DEFAULT_POOL_SIZE = 4
+
+# Layout of a simulation's file: a (4 x metrics x periods) float64 array
+SUMS, COUNTS, MINS, MAXS = range(4)
+
+# Raw samples, when kept, are in a .npz file aside, with the ticks and the values of the samples
+# of every metric as "<metric>.ticks" and "<metric>.values" arrays
+SAMPLES_SUFFIX = ".samples.npz"
+
+
+class ResultStore:
+    """
+    Local store of simulation results, written one simulation at a time as they complete.
+    The metrics of each simulation are a single .npy file, which can be memory-mapped, with
+    their raw samples if any in a .npz file aside, and a SQLite index keeps track of runs (seed and parameters) and of their completed
+    simulations with a summary of their totals.
+    Simulations of a run are reproducible from the run's seed and their index, see `spawn_seeds`.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{self.path / 'index.db'}", echo=False)
+        metadata.create_all(self.engine)
+        self._add_seed_columns()
+
+    def create_run(self, seed: Seed, params: Dict[str, Any], simulations_number: int, periods: int) -> RunId:
+        """
+        Registers a new run and returns its id. The seed is stored as the entropy, spawn key and
+        pool size of its `SeedSequence`, so a run created with a sequence built from `None`, or
+        spawned from another one, can still be reproduced, see `seed_sequence`.
+        """
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        run_id = uuid.uuid4().hex
+        (self.path / run_id).mkdir()
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                runs.insert().values(
+                    run_id=run_id,
+                    seed=str(seed_sequence.entropy),
+                    spawn_key=json.dumps(list(seed_sequence.spawn_key)),
+                    pool_size=seed_sequence.pool_size,
+                    params=json.dumps(params, sort_keys=True, default=str),
+                    simulations_number=simulations_number,
+                    periods=periods,
+                )
+            )
+
+        return run_id
+
+    def run(self, run_id: RunId) -> Dict[str, Any]:
+        with self.engine.connect() as connection:
+            row = connection.execute(select(runs).where(runs.c.run_id == run_id)).one()
+        return {
+            **row._mapping,
+            "seed": int(row.seed),
+            "params": json.loads(row.params),
+            "spawn_key": tuple(json.loads(row.spawn_key or "[]")),
+            "pool_size": row.pool_size or DEFAULT_POOL_SIZE,
+        }
+
+    def seed_sequence(self, run_id: RunId) -> np.random.SeedSequence:
+        """
+        Returns the seed sequence the run was created with, as yet unspawned.
+        """
+        run = self.run(run_id)
+        return np.random.SeedSequence(run["seed"], spawn_key=run["spawn_key"], pool_size=run["pool_size"])
+
+    def _add_seed_columns(self) -> None:
+        """
+        Indexes created before runs stored the spawn key and pool size of their seed lack
+        these columns, which are added empty: such runs were created with the defaults.
+        """
+        with self.engine.begin() as connection:
+            existing = {column["name"] for column in inspect(connection).get_columns(runs.name)}
+            for column in (runs.c.spawn_key, runs.c.pool_size):
+                if column.name not in existing:
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {runs.name} ADD COLUMN {column.name} {column.type.compile(self.engine.dialect)}"
+                    )
+
+    def runs(self) -> List[RunId]:
+        with self.engine.connect() as connection:
+            return list(connection.execute(select(runs.c.run_id)).scalars())
+
+    def write(self, run_id: RunId, index: int, metrics: Metrics) -> None:
+        """
+        Writes the metrics of a completed simulation. Files are written aside and moved in
+        place before being indexed, so a crash never leaves a partial simulation behind.
+        """
+        path = self.path / run_id / f"{index}.npy"
+        if metrics.samples:
+            write_samples(self.path / run_id / f"{index}{SAMPLES_SUFFIX}", metrics.samples)
+        temporary_path = path.with_suffix(".tmp")
+        with open(temporary_path, "wb") as file:
+            np.save(file, np.stack([metrics.sums, metrics.counts, metrics.mins, metrics.maxs]))
+        os.replace(temporary_path, path)
+
+        summary = {metric.value: float(metrics.sum(metric).sum()) for metric in Metric}
+        with self.engine.begin() as connection:
+            connection.execute(
+                simulations.insert().values(
+                    run_id=run_id,
+                    simulation=index,
+                    path=str(path.relative_to(self.path)),
+                    summary=json.dumps(summary),
+                    created_at=path.stat().st_mtime,
+                )
+            )
+
+    def writer(self, run_id: RunId) -> Callable[[int, Metrics], None]:
+        """
+        Returns a callback to be passed as `on_result` to `Palantir.run`.
+        """
+        return lambda index, metrics: self.write(run_id, index, metrics)
+
+    def completed(self, run_id: RunId) -> Set[int]:
+        """
+        Indexes of the simulations of the run already stored, to be skipped when resuming it.
+        """
+        with self.engine.connect() as connection:
+            return set(
+                connection.execute(select(simulations.c.simulation).where(simulations.c.run_id == run_id)).scalars()
+            )
+
+    def count(self, run_id: RunId) -> int:
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(simulations).where(simulations.c.run_id == run_id)
+            ).scalar()
+
+    def summaries(self, run_id: RunId) -> Dict[int, Dict[Metric, float]]:
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(simulations.c.simulation, simulations.c.summary)
+                .where(simulations.c.run_id == run_id)
+                .order_by(simulations.c.simulation)
+            )
+            return {
+                row.simulation: {Metric(metric): total for metric, total in json.loads(row.summary).items()}
+                for row in rows
+            }
+
+    def load(self, run_id: RunId, index: int) -> Metrics:
+        """
+        Returns the metrics of a simulation backed by a read-only memory map, so only the
+        parts that are actually used are read from disk.
+        """
+        array = np.load(self.path / run_id / f"{index}.npy", mmap_mode="r")
+        samples_path = self.path / run_id / f"{index}{SAMPLES_SUFFIX}"
+        return Metrics(
+            sums=array[SUMS],
+            counts=array[COUNTS],
+            mins=array[MINS],
+            maxs=array[MAXS],
+            samples=read_samples(samples_path) if samples_path.exists() else None,
+        )
+
+    def iter_metrics(self, run_id: RunId, indexes: Optional[Sequence[int]] = None) -> Iterator[Metrics]:
+        for index in sorted(self.completed(run_id)) if indexes is None else indexes:
+            yield self.load(run_id, index)
+
+    def timeseries(
+        self,
+        run_id: RunId,
+        metric: Metric,
+        aggregator: MetricsAggregator = MetricsAggregatorSum(),
+        indexes: Optional[Sequence[int]] = None,
+    ) -> np.ndarray:
+        """
+        Returns a (simulations x periods) array with the timeseries of a single metric across
+        the stored simulations of the run, reading only that metric's rows from each file.
+        """
+        return np.stack([aggregator.timeseries(metrics, metric) for metrics in self.iter_metrics(run_id, indexes)])
+
+
+def write_samples(path: Path, samples: Dict[Metric, Dict[Timestamp, List[float]]]) -> None:
+    arrays = {}
+    for metric, samples_by_tick in samples.items():
+        arrays[f"{metric.value}.ticks"] = np.array(
+            [t for t, values in samples_by_tick.items() for _ in values], dtype=np.int64
+        )
+        arrays[f"{metric.value}.values"] = np.array(
+            [value for values in samples_by_tick.values() for value in values], dtype=np.float64
+        )
+    temporary_path = path.with_suffix(".tmp")
+    with open(temporary_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporary_path, path)
+
+
+def read_samples(path: Path) -> Dict[Metric, Dict[Timestamp, List[float]]]:
+    samples: Dict[Metric, Dict[Timestamp, List[float]]] = {}
+    with np.load(path) as arrays:
+        for name in arrays.files:
+            metric, kind = name.rsplit(".", 1)
+            if kind == "ticks":
+                samples_by_tick = samples.setdefault(Metric(metric), {})
+                for t, value in zip(arrays[name].tolist(), arrays[f"{metric}.values"].tolist()):
+                    samples_by_tick.setdefault(t, []).append(value)
+    return samples
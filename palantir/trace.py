@@ -0,0 +1,309 @@
+import logging
+import os
+import struct
+from collections import deque
+from enum import IntEnum
+from typing import BinaryIO, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from palantir.types import Account, Currency, Timestamp
+
+
+class EventType(IntEnum):
+    OPENED = 0
+    CLOSED = 1
+    LIQUIDATED = 2
+    FAILED = 3
+
+
+class Event(NamedTuple):
+    """
+    Something that happened to a position. The amount is the principal for opened and
+    failed positions, and the trader's P&L for closed and liquidated ones.
+    Failed positions were never opened and have position id -1.
+    """
+    type: EventType
+    time: Timestamp
+    position_id: int
+    owner: Account
+    owed_token: Currency
+    held_token: Currency
+    amount: float
+
+
+class TraceSink:
+    def write(self, event: Event) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class Tracer:
+    """
+    Sends the events of the enabled types to its sinks.
+    The `opened`, `closed`, `liquidated` and `failed` flags tell whether events of each type
+    are wanted, and callers check them before building an event, so disabled events cost a
+    single attribute lookup. Without sinks every type is disabled.
+    """
+    opened: bool
+    closed: bool
+    liquidated: bool
+    failed: bool
+
+    def __init__(self, sinks: Sequence[TraceSink] = (), enabled: Iterable[EventType] = tuple(EventType)):
+        self.sinks = list(sinks)
+        enabled = set(enabled) if self.sinks else set()
+        self.opened = EventType.OPENED in enabled
+        self.closed = EventType.CLOSED in enabled
+        self.liquidated = EventType.LIQUIDATED in enabled
+        self.failed = EventType.FAILED in enabled
+
+    def emit(self, event: Event) -> None:
+        for sink in self.sinks:
+            sink.write(event)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+# Traces nothing, the default of simulations that are not being inspected
+NULL_TRACER = Tracer()
+
+
+class RingBufferSink(TraceSink):
+    """
+    Keeps the last `capacity` events in memory.
+    """
+    events: Deque[Event]
+
+    def __init__(self, capacity: int = 10000):
+        self.events = deque(maxlen=capacity)
+
+    def write(self, event: Event) -> None:
+        self.events.append(event)
+
+
+class LoggingSink(TraceSink):
+    """
+    Logs events, which are only formatted if the logger is enabled for the level.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("palantir.trace")
+        self.level = level
+
+    def write(self, event: Event) -> None:
+        self.logger.log(self.level, "%s", event)
+
+
+# Binary event files, traces and position journals, start with a 16 bytes header: magic bytes
+# identifying the format, the layout version and the size of a record (u4 each, little-endian),
+# followed by fixed-size records without padding. Their first fields are always the event type
+# (u1), time (i8), position id (i8), and the owner, owed token and held token (3 x u4) as indexes
+# in the file's symbols, which are appended one per line to a UTF-8 text file next to it. Symbols
+# are flushed before the first record referring to them, so that written records can always be
+# resolved, and cannot contain newlines.
+HEADER = struct.Struct("<8sII")
+
+
+class RecordFormat(NamedTuple):
+    magic: bytes
+    version: int
+    record: struct.Struct
+    dtype: np.dtype
+
+
+# Formats readable with `read_records`, by magic bytes
+FORMATS: Dict[bytes, RecordFormat] = {}
+
+
+def register_format(record_format: RecordFormat) -> RecordFormat:
+    assert record_format.record.size == record_format.dtype.itemsize, "Records and their dtype must match"
+    FORMATS[record_format.magic] = record_format
+    return record_format
+
+
+class RecordFile:
+    """
+    Appends records of a format to a file, and interns the strings they refer to as symbols.
+    Opening an existing file appends to it, after checking its header and dropping the partial
+    record and symbol a crashed writer may have left at their end, unless `append` is False.
+    Records are buffered, call `flush` or `close` before reading a file still being written.
+    """
+    file: BinaryIO
+
+    def __init__(self, path: str, record_format: RecordFormat, append: bool = True):
+        self.path = path
+        self.format = record_format
+        record_size = record_format.record.size
+
+        self.file = open(path, "r+b" if append and os.path.exists(path) else "w+b")
+        size = self.file.seek(0, os.SEEK_END)
+        if size < HEADER.size:
+            self.file.truncate(0)
+            self.file.write(HEADER.pack(record_format.magic, record_format.version, record_size))
+        else:
+            self.file.seek(0)
+            try:
+                assert _read_format(path, self.file.read(HEADER.size)) == record_format, f"{path} has another format"
+            except AssertionError:
+                self.file.close()
+                raise
+            end = HEADER.size + (size - HEADER.size) // record_size * record_size
+            self.file.truncate(end)
+            self.file.seek(end)
+
+        symbols = read_symbols(path) if append else []
+        self._symbols: Dict[str, int] = {symbol: index for index, symbol in enumerate(symbols)}
+        self._symbols_file = open(symbols_path(path), "a" if append else "w", encoding="utf-8", newline="\n")
+        self._symbols_file.truncate(sum(len(symbol.encode()) + 1 for symbol in symbols))
+        self._new_symbols = False
+
+    def __enter__(self) -> "RecordFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, *fields) -> None:
+        if self._new_symbols:
+            self._symbols_file.flush()
+            self._new_symbols = False
+        self.file.write(self.format.record.pack(*fields))
+
+    def symbol(self, value: str) -> int:
+        symbol = self._symbols.get(value)
+        if symbol is None:
+            assert "\n" not in value, f"Symbols cannot contain newlines: {value!r}"
+            symbol = self._symbols[value] = len(self._symbols)
+            self._symbols_file.write(f"{value}\n")
+            self._new_symbols = True
+        return symbol
+
+    def flush(self) -> None:
+        self._symbols_file.flush()
+        self.file.flush()
+
+    def close(self) -> None:
+        self._symbols_file.close()
+        self.file.close()
+
+
+def symbols_path(path: str) -> str:
+    return f"{path}.symbols"
+
+
+def read_symbols(path: str) -> List[str]:
+    """
+    Returns the symbols of a file, leaving out a last one whose newline was not written yet.
+    """
+    if not os.path.exists(symbols_path(path)):
+        return []
+    with open(symbols_path(path), encoding="utf-8", newline="\n") as file:
+        return file.read().split("\n")[:-1]
+
+
+def _read_format(path: str, header: bytes) -> RecordFormat:
+    magic, version, record_size = HEADER.unpack(header)
+    record_format = FORMATS.get(magic)
+    assert record_format is not None, f"{path} is not a known event file"
+    assert (
+        version == record_format.version and record_size == record_format.record.size
+    ), f"Unsupported layout in {path}"
+    return record_format
+
+
+def read_records(path: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Memory-maps the records of a trace or a journal into a read-only structured array, with
+    the dtype of its format, and returns it with the symbols its owner and token fields refer
+    to. A record being written when the file was read is left out.
+    """
+    with open(path, "rb") as file:
+        record_format = _read_format(path, file.read(HEADER.size))
+
+    records_number = (os.path.getsize(path) - HEADER.size) // record_format.record.size
+    if records_number == 0:
+        return np.empty(0, dtype=record_format.dtype), read_symbols(path)
+
+    records = np.memmap(path, dtype=record_format.dtype, mode="r", offset=HEADER.size, shape=(records_number,))
+    return records, read_symbols(path)
+
+
+# Records of a binary trace: the common fields and the amount of the event (f8)
+TRACE_FORMAT = register_format(
+    RecordFormat(
+        magic=b"PALTRACE",
+        version=1,
+        record=struct.Struct("<BqqIIId"),
+        dtype=np.dtype(
+            [
+                ("type", "u1"),
+                ("time", "<i8"),
+                ("position_id", "<i8"),
+                ("owner", "<u4"),
+                ("owed_token", "<u4"),
+                ("held_token", "<u4"),
+                ("amount", "<f8"),
+            ]
+        ),
+    )
+)
+
+
+class BinaryFileSink(TraceSink):
+    """
+    Writes events to a new file as fixed-size binary records, see `TRACE_FORMAT`, to be read
+    with `read_trace`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = RecordFile(path, TRACE_FORMAT, append=False)
+
+    def write(self, event: Event) -> None:
+        self._file.write(
+            event.type,
+            event.time,
+            event.position_id,
+            self._file.symbol(event.owner),
+            self._file.symbol(event.owed_token),
+            self._file.symbol(event.held_token),
+            event.amount,
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_trace(path: str) -> Tuple[np.ndarray, List[str]]:
+    records, symbols = read_records(path)
+    assert records.dtype == TRACE_FORMAT.dtype, f"{path} is not a trace"
+    return records, symbols
+
+
+def trace_events(records: np.ndarray, symbols: List[str]) -> List[Event]:
+    """
+    Returns the events of the records of a trace or of a journal. The amount of journal events
+    is the principal of opened positions and the trader's P&L of closed ones, as in traces.
+    """
+    if "trader_pl" in records.dtype.names:
+        amounts = np.where(records["type"] == EventType.OPENED, records["principal"], records["trader_pl"])
+    else:
+        amounts = records["amount"]
+
+    return [
+        Event(
+            type=EventType(record["type"]),
+            time=int(record["time"]),
+            position_id=int(record["position_id"]),
+            owner=Account(symbols[record["owner"]]),
+            owed_token=Currency(symbols[record["owed_token"]]),
+            held_token=Currency(symbols[record["held_token"]]),
+            amount=float(amount),
+        )
+        for record, amount in zip(records, amounts)
+    ]
@@ -1,8 +1,8 @@
-import random
-from typing import Callable, Dict, Set
+from typing import Callable, Dict, Optional, Set
 
 from palantir.ithil import Ithil
 from palantir.oracle import PriceOracle
+from palantir.randomness import RandomStream
 from palantir.types import (
     Account,
     Currency,
@@ -21,6 +21,7 @@ class Trader:
     ithil: Ithil
     liquidity: Dict[Currency, float]
     open_position_probability: float
+    random_stream: RandomStream
 
     def __init__(
         self,
@@ -31,6 +32,7 @@ class Trader:
         calculate_collateral_usd: Callable[[PriceOracle, Currency], float],
         calculate_leverage: Callable[[], float],
         liquidity: Dict[Currency, float],
+        random_stream: Optional[RandomStream] = None,
     ):
         self.account = account
         self.calculate_collateral_usd = calculate_collateral_usd
@@ -39,45 +41,55 @@ class Trader:
         self.close_position_probability = close_position_probability
         self.ithil = ithil
         self.liquidity = liquidity
+        self.random_stream = random_stream if random_stream is not None else RandomStream()
 
     def trade(self) -> None:
         if self._want_open_position():
-            tokens = set(self.ithil.vaults.keys())
-            src_token = random.choice(tuple(tokens))
-            dst_token = random.choice(tuple(tokens - {src_token}))
-            collateral = self.calculate_collateral_usd(self.ithil.price_oracle, src_token)
-            principal = self.calculate_leverage() * collateral
-            if self._can_open_position(src_token, collateral):
-                position_id = self.ithil.open_position(
-                    trader=self.account,
-                    src_token=src_token,
-                    dst_token=dst_token,
-                    collateral_token=src_token,  # XXX for now always use src_token as collateral
-                    collateral=collateral,
-                    principal=principal,
-                    max_slippage_percent=10,  # XXX use a fixed 10% slippage limit
-                )
+            self.open_position()
         for position_id in self.active_positions:
             if self._want_close_position():
-                position = self.ithil.positions[position_id]
-                trader_pl, _ = self.ithil.close_position(position_id)
-                self.liquidity[position.owed_token] += trader_pl
+                self.close_position(position_id)
+
+    def open_position(self) -> Optional[PositionId]:
+        """
+        Opens a position on a random pair of tokens, if the trader has enough liquidity.
+        """
+        # Sorted, so that choices do not depend on string hashing across processes
+        tokens = sorted(self.ithil.vaults.keys())
+        src_token = self.random_stream.choice(tokens)
+        dst_token = self.random_stream.choice([token for token in tokens if token != src_token])
+        collateral = self.calculate_collateral_usd(self.ithil.price_oracle, src_token)
+        principal = self.calculate_leverage() * collateral
+        if not self._can_open_position(src_token, collateral):
+            return None
+
+        return self.ithil.open_position(
+            trader=self.account,
+            src_token=src_token,
+            dst_token=dst_token,
+            collateral_token=src_token,  # XXX for now always use src_token as collateral
+            collateral=collateral,
+            principal=principal,
+            max_slippage_percent=10,  # XXX use a fixed 10% slippage limit
+        )
+
+    def close_position(self, position_id: PositionId) -> None:
+        position = self.ithil.positions[position_id]
+        trader_pl, _ = self.ithil.close_position(position_id)
+        self.liquidity[position.owed_token] += trader_pl
 
     @property
     def active_positions(self) -> Set[PositionId]:
-        return {
-            position_id
-            for position_id in self.ithil.active_positions
-            if self.ithil.positions[position_id].owner == self.account
-        }
+        # A copy, so that positions can be closed while iterating over it
+        return set(self.ithil.positions_by_owner(self.account))
 
     def _can_open_position(self, currency: Currency, amount: float) -> bool:
         return self.liquidity[currency] >= amount
 
     def _want_open_position(self) -> bool:
-        r = random.random()
+        r = self.random_stream.random()
         return r < self.open_position_probability
 
     def _want_close_position(self) -> bool:
-        r = random.random()
+        r = self.random_stream.random()
         return r < self.close_position_probability
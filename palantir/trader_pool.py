@@ -0,0 +1,150 @@
+from typing import Callable, Sequence, Set, Union
+
+import numpy as np
+
+from palantir.ithil import Ithil
+from palantir.randomness import RandomStream
+from palantir.types import Account, Currency, Position, PositionId
+
+
+# Draws one amount for each of the given trader indexes, so that strategies can depend on
+# per-trader parameters, e.g. `lambda generator, traders: generator.uniform(1.0, max_leverage[traders])`
+DrawForTraders = Callable[[np.random.Generator, np.ndarray], np.ndarray]
+
+
+class TraderPool:
+    """
+    A population of traders behaving like `Trader`s, stored as arrays instead of one object
+    per trader: liquidity is a (traders x tokens) matrix and probabilities are per trader.
+    Every tick the decisions, tokens, collaterals and leverages of the whole population are
+    drawn at once, and only the resulting orders are sent to Ithil, in one batch to open
+    positions and one batch to close them.
+    Within a tick every trader opens before any position is closed, instead of each trader
+    opening and closing in turn, which does not change the distribution of the decisions.
+    """
+    accounts: Sequence[Account]
+    ithil: Ithil
+    liquidity: np.ndarray
+    tokens: Sequence[Currency]
+
+    def __init__(
+        self,
+        accounts: Sequence[Account],
+        ithil: Ithil,
+        liquidity: np.ndarray,
+        open_position_probability: Union[float, np.ndarray],
+        close_position_probability: Union[float, np.ndarray],
+        draw_collateral_usd: DrawForTraders,
+        draw_leverage: DrawForTraders,
+        random_stream: RandomStream,
+    ):
+        """
+        - accounts: the account of each trader.
+        - liquidity: initial liquidity of each trader per token, with tokens in the order of
+        `tokens`, the sorted tokens of Ithil's vaults. A single row is used for every trader.
+        - open_position_probability, close_position_probability: per tick, either one for
+        every trader or one per trader.
+        - draw_collateral_usd, draw_leverage: draw the collateral value in USD and the leverage
+        of the positions opened by the given traders.
+        """
+        self.accounts = accounts
+        self.ithil = ithil
+        # Sorted, as in `Trader`, so that choices do not depend on string hashing across processes
+        self.tokens = sorted(ithil.vaults.keys())
+        traders = len(accounts)
+        self.liquidity = np.array(np.broadcast_to(liquidity, (traders, len(self.tokens))), dtype=np.float64)
+        self.open_position_probability = np.broadcast_to(
+            np.asarray(open_position_probability, dtype=np.float64), (traders,)
+        )
+        self.close_position_probability = np.broadcast_to(
+            np.asarray(close_position_probability, dtype=np.float64), (traders,)
+        )
+        self.draw_collateral_usd = draw_collateral_usd
+        self.draw_leverage = draw_leverage
+        self.random_stream = random_stream
+
+        self._token_columns = ithil.price_oracle.columns(self.tokens)
+        self._trader_index = {account: index for index, account in enumerate(accounts)}
+        self._token_index = {token: index for index, token in enumerate(self.tokens)}
+
+        # Open positions of the pool, with the index of their trader and owed token
+        self._position_ids = np.zeros(0, dtype=np.int64)
+        self._position_traders = np.zeros(0, dtype=np.intp)
+        self._position_owed = np.zeros(0, dtype=np.intp)
+        self._liquidated: Set[PositionId] = set()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    @property
+    def open_positions(self) -> int:
+        return len(self._position_ids) - len(self._liquidated)
+
+    def trade(self) -> None:
+        self._open_positions()
+        self._close_positions()
+
+    def liquidated(self, position: Position, trader_pl: float) -> None:
+        """
+        Credits the P&L of a position liquidated by Ithil to its trader.
+        """
+        self.liquidity[self._trader_index[position.owner], self._token_index[position.owed_token]] += trader_pl
+        self._liquidated.add(PositionId(position.id))
+
+    def _open_positions(self) -> None:
+        generator = self.random_stream.generator
+        tokens = len(self.tokens)
+
+        traders = np.flatnonzero(generator.random(len(self)) < self.open_position_probability)
+        if len(traders) == 0:
+            return
+
+        src = generator.integers(0, tokens, len(traders))
+        dst = (src + generator.integers(1, tokens, len(traders))) % tokens
+        prices = self.ithil.price_oracle.get_prices(self._token_columns)
+        collateral = self.draw_collateral_usd(generator, traders) / prices[src]
+        principal = self.draw_leverage(generator, traders) * collateral
+
+        can_open = self.liquidity[traders, src] >= collateral
+        traders, src, dst, collateral, principal = (
+            traders[can_open], src[can_open], dst[can_open], collateral[can_open], principal[can_open]
+        )
+        if len(traders) == 0:
+            return
+
+        src_tokens = [self.tokens[token] for token in src.tolist()]
+        position_ids = self.ithil.open_positions(
+            traders=[self.accounts[trader] for trader in traders.tolist()],
+            src_tokens=src_tokens,
+            dst_tokens=[self.tokens[token] for token in dst.tolist()],
+            collateral_tokens=src_tokens,  # XXX for now always use src_token as collateral
+            collaterals=collateral,
+            principals=principal,
+            max_slippage_percent=10,  # XXX use a fixed 10% slippage limit
+        )
+
+        opened = np.array([position_id is not None for position_id in position_ids], dtype=bool)
+        opened_ids = np.array([position_id for position_id in position_ids if position_id is not None], dtype=np.int64)
+        self._position_ids = np.concatenate([self._position_ids, opened_ids])
+        self._position_traders = np.concatenate([self._position_traders, traders[opened]])
+        self._position_owed = np.concatenate([self._position_owed, src[opened]])
+
+    def _close_positions(self) -> None:
+        keep = np.ones(len(self._position_ids), dtype=bool)
+        if self._liquidated:
+            keep &= ~np.isin(self._position_ids, np.fromiter(self._liquidated, dtype=np.int64))
+            self._liquidated.clear()
+
+        closing = keep & (
+            self.random_stream.generator.random(len(self._position_ids))
+            < self.close_position_probability[self._position_traders]
+        )
+        if closing.any():
+            results = self.ithil.close_positions(self._position_ids[closing].tolist())
+            trader_pl = np.fromiter((pl for pl, _ in results), dtype=np.float64, count=len(results))
+            np.add.at(self.liquidity, (self._position_traders[closing], self._position_owed[closing]), trader_pl)
+            keep &= ~closing
+
+        self._position_ids = self._position_ids[keep]
+        self._position_traders = self._position_traders[keep]
+        self._position_owed = self._position_owed[keep]
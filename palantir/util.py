@@ -1,15 +1,19 @@
 import logging
 import time
-from typing import Iterable, List, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import names
+import numpy as np
 
 from palantir.constants import SECONDS_IN_AN_HOUR
 from palantir.crawlers.coingecko import (
-    coin_ids,
+    ChartRequest,
+    coin_id_set,
+    crawl_market_charts,
     market_chart_range,
 )
-from palantir.db import drop_all, init_db, Quote
+from palantir.crawlers.http import TokenBucket
+from palantir.db import db_url, quote_coverage, read_quotes, upsert_quotes
 from palantir.types import (
     Currency,
     Timestamp,
@@ -23,11 +27,11 @@ class Percent:
         return self.percentage * total / 100.0
 
 
-def download_price_data(token: Currency, hours: int) -> None:
+def download_price_data(token: Currency, hours: int, url: Optional[str] = None) -> None:
     VS_CURRENCY = Currency("usd")
     logging.info(f"Download {hours} price points for {token}")
-    valid_coin_ids = list(coin_ids())
-    valid_coin_ids_msg = f"Coin should be one of {valid_coin_ids}"
+    valid_coin_ids = coin_id_set()
+    valid_coin_ids_msg = f"{token} is not a CoinGecko coin id"
 
     assert token in valid_coin_ids, valid_coin_ids_msg
 
@@ -39,32 +43,76 @@ def download_price_data(token: Currency, hours: int) -> None:
         to_timestamp=now,
     )
 
-    quotes = [
-        Quote(coin=token, vs_currency=VS_CURRENCY, timestamp=timestamp, price=price)
-        for timestamp, price in prices
-    ]
+    upsert_quotes(token, VS_CURRENCY, prices, url)
+
+
+def missing_ranges(
+    timestamps: np.ndarray, start: Timestamp, end: Timestamp, interval: int = SECONDS_IN_AN_HOUR
+) -> List[Tuple[Timestamp, Timestamp]]:
+    """
+    Returns the ranges of [start, end), in seconds, not covered by quotes at `timestamps`,
+    which are in milliseconds as stored from CoinGecko. Quotes are expected every `interval`
+    seconds, and a range is missing where two consecutive quotes, or a quote and the start or
+    end of the window, are more than two intervals apart.
+    """
+    seconds = np.asarray(timestamps, dtype=np.int64) // 1000
+    points = np.concatenate([[start], seconds[(seconds >= start) & (seconds < end)], [end]])
+    gaps = np.flatnonzero(np.diff(points) > 2 * interval)
+    return [(Timestamp(points[gap]), Timestamp(points[gap + 1])) for gap in gaps]
+
+
+def sync_price_data(
+    tokens: Iterable[Currency],
+    hours: int,
+    url: Optional[str] = None,
+    now: Optional[Timestamp] = None,
+    base_url: Optional[str] = None,
+    limiter: Optional[TokenBucket] = None,
+) -> Dict[Currency, int]:
+    """
+    Downloads only the quotes missing from the db in the last `hours` hours of every token,
+    all tokens at once, and upserts them as they arrive. An interrupted or failed sync keeps
+    what was downloaded, and the next one only downloads what is still missing.
+    Returns the number of quotes written per token.
+    """
+    VS_CURRENCY = Currency("usd")
+    tokens = list(tokens)
+    valid_coin_ids = coin_id_set(base_url)
+    for token in tokens:
+        assert token in valid_coin_ids, f"{token} is not a CoinGecko coin id"
+
+    end = Timestamp(time.time()) if now is None else now
+    start = end - (hours + 1) * SECONDS_IN_AN_HOUR
+
+    chart_requests = []
+    for token in tokens:
+        timestamps, _ = read_quotes(token, VS_CURRENCY, start=start * 1000, end=end * 1000, url=url)
+        for from_timestamp, to_timestamp in missing_ranges(timestamps, start, end):
+            logging.info(f"Download missing {token} prices from {from_timestamp} to {to_timestamp}")
+            chart_requests.append(ChartRequest(token, VS_CURRENCY, from_timestamp, to_timestamp))
 
-    db = init_db()
+    written = {token: 0 for token in tokens}
 
-    for quote in quotes:
-        db.add(quote)
+    def on_chunk(chunk: ChartRequest, prices: List[Tuple[Timestamp, float]]) -> None:
+        written[chunk.coin_id] += upsert_quotes(chunk.coin_id, chunk.vs_currency, prices, url)
 
-    db.commit()
+    crawl_market_charts(chart_requests, on_chunk, base_url=base_url, limiter=limiter)
 
+    return written
 
-def init_price_db(tokens: Iterable[Currency], hours: int):
-    db = init_db()
 
-    if not all(
-        db.query(Quote).filter(Quote.coin == token).count() >= hours for token in tokens
-    ):
-        db.close()
-        drop_all()
-        db = init_db()
-        for token in tokens:
-            download_price_data(token, hours)
+def init_price_db(tokens: Iterable[Currency], hours: int, url: Optional[str] = None) -> str:
+    """
+    Makes sure the db has at least `hours` quotes of every token and returns its url.
+    Quotes already stored are kept and only the missing ones are downloaded.
+    """
+    tokens = list(tokens)
+    coverage = quote_coverage(tokens, url=url)
 
-    return db
+    if not all(coverage[token].count >= hours for token in tokens):
+        sync_price_data(tokens, hours, url)
+
+    return db_url(url)
 
 
 def make_trader_names(n: int) -> Set[str]:
@@ -75,8 +123,3 @@ def make_trader_names(n: int) -> Set[str]:
 
     return trader_names
 
-
-def read_quotes_from_db(db, token: Currency, hours: int) -> List[Quote]:
-    return list(
-        db.query(Quote).filter(Quote.coin == token).order_by(Quote.timestamp).all()
-    )[-hours:]
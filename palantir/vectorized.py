@@ -0,0 +1,422 @@
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from palantir.clock import Clock
+from palantir.constants import RISK_FACTOR_PERCENT
+from palantir.metrics import METRIC_INDEX, Metric, Metrics
+from palantir.oracle import PriceOracle
+from palantir.randomness import RandomStream
+from palantir.types import Currency
+
+
+# Vectorized counterparts of the Ithil and Trader callables, working on arrays of positions
+DrawAmounts = Callable[[np.random.Generator, int], np.ndarray]
+PositionsFunction = Callable[[np.ndarray, np.ndarray], np.ndarray]
+SplitFees = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+EVENT_METRICS = [
+    Metric.POSITION_OPENED,
+    Metric.POSITION_CLOSED,
+    Metric.TRADE_FAILED,
+    Metric.INSUFFICIENT_LIQUIDITY,
+]
+
+
+class VectorizedMetrics:
+    """
+    Metrics of all the paths of a vectorized simulation, stored as (paths x periods) arrays.
+    Indexing by path returns the same `Metrics` a `MetricsLogger` would have recorded.
+    """
+    events: Dict[Metric, np.ndarray]
+    values: Dict[Metric, np.ndarray]
+
+    def __init__(self, events: Dict[Metric, np.ndarray], values: Dict[Metric, np.ndarray]):
+        self.events = events
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(next(iter(self.events.values())))
+
+    def __getitem__(self, path: int) -> Metrics:
+        periods = len(next(iter(self.events.values()))[path])
+        metrics = Metrics.empty(periods)
+        for metric, counts in self.events.items():
+            # Every event is logged as a sample of 1.0
+            index = METRIC_INDEX[metric]
+            metrics.sums[index] = counts[path]
+            metrics.counts[index] = counts[path]
+            metrics.mins[index] = np.where(counts[path] > 0, 1.0, np.inf)
+            metrics.maxs[index] = np.where(counts[path] > 0, 1.0, -np.inf)
+        for metric, values in self.values.items():
+            index = METRIC_INDEX[metric]
+            metrics.sums[index] = values[path]
+            metrics.counts[index] = 1
+            metrics.mins[index] = values[path]
+            metrics.maxs[index] = values[path]
+        return metrics
+
+
+class VectorizedSimulation:
+    """
+    Runs many independent paths of the same scenario in lockstep, one NumPy array
+    operation at a time instead of one Python object graph per simulation.
+    Vaults, insurance and governance pools are (paths x currencies) arrays, traders'
+    liquidity is (paths x traders x currencies), and open positions live in
+    (paths x traders x slots) arrays, so that opening, closing, interest and the
+    liquidation waterfall of `Ithil.close_position` are applied to all paths at once.
+
+    Each tick mirrors `Simulation.run`: every trader may open a position, then open
+    positions may be closed, then liquidatable positions are liquidated. Within a tick
+    positions are closed in (trader, slot) order, and insurance fees paid by closing
+    positions are credited to the insurance pool after the losses of that tick are repaid.
+    """
+    clock: Clock
+    governance_pool: np.ndarray
+    insurance_pool: np.ndarray
+    liquidity: np.ndarray
+    price_oracle: PriceOracle
+    vaults: np.ndarray
+
+    def __init__(
+        self,
+        clock: Clock,
+        price_oracle: PriceOracle,
+        paths: int,
+        random_stream: RandomStream,
+        vaults: Dict[Currency, float],
+        insurance_pool: Dict[Currency, float],
+        traders_liquidity: Sequence[Dict[Currency, float]],
+        open_position_probability: Union[float, Sequence[float]],
+        close_position_probability: Union[float, Sequence[float]],
+        draw_collateral_usd: DrawAmounts,
+        draw_leverage: DrawAmounts,
+        calculate_fees: PositionsFunction,
+        calculate_interest_rate: PositionsFunction,
+        calculate_liquidation_fee: PositionsFunction,
+        split_fees: SplitFees,
+        max_slippage_percent: float = 0.0,
+        slots_per_trader: int = 4,
+    ):
+        """
+        - paths: number of independent paths simulated at once.
+        - random_stream: source of all the randomness of every path.
+        - vaults, insurance_pool: initial liquidity per currency, the same for every path.
+        - traders_liquidity: initial liquidity per currency of each trader.
+        - open_position_probability, close_position_probability: per tick, either one for
+        every trader or one per trader.
+        - draw_collateral_usd, draw_leverage: draw `n` collateral values in USD and `n` leverages.
+        - calculate_fees, calculate_interest_rate, calculate_liquidation_fee: take arrays of
+        collaterals and principals, in the owed currency, and return an array.
+        - split_fees: splits an array of fees into (governance_fees, insurance_fees).
+        - max_slippage_percent: standard deviation of the gaussian slippage applied to every swap.
+        - slots_per_trader: initial room for open positions per trader, grown as needed.
+        """
+        self.clock = clock
+        self.price_oracle = price_oracle
+        self.paths = paths
+        self.random_stream = random_stream
+        self.draw_collateral_usd = draw_collateral_usd
+        self.draw_leverage = draw_leverage
+        self.calculate_fees = calculate_fees
+        self.calculate_interest_rate = calculate_interest_rate
+        self.calculate_liquidation_fee = calculate_liquidation_fee
+        self.split_fees = split_fees
+        self.max_slippage_percent = max_slippage_percent
+
+        self.currencies = price_oracle.currencies
+        traders = len(traders_liquidity)
+        self.traders = traders
+
+        self.vaults = self._per_path(vaults)
+        self.insurance_pool = self._per_path(insurance_pool)
+        self.governance_pool = np.zeros((paths, len(self.currencies)))
+        self.liquidity = np.array(
+            [[liquidity.get(currency, 0.0) for currency in self.currencies] for liquidity in traders_liquidity],
+            dtype=np.float64,
+        )[np.newaxis].repeat(paths, axis=0)
+
+        self.open_position_probability = np.broadcast_to(
+            np.asarray(open_position_probability, dtype=np.float64), (traders,)
+        )
+        self.close_position_probability = np.broadcast_to(
+            np.asarray(close_position_probability, dtype=np.float64), (traders,)
+        )
+
+        shape = (paths, traders, slots_per_trader)
+        self._active = np.zeros(shape, dtype=bool)
+        self._owed = np.zeros(shape, dtype=np.intp)
+        self._held = np.zeros(shape, dtype=np.intp)
+        self._collateral = np.zeros(shape)
+        self._principal = np.zeros(shape)
+        self._allowance = np.zeros(shape)
+        self._interest_rate = np.zeros(shape)
+        self._fees = np.zeros(shape)
+        self._created_at = np.zeros(shape, dtype=np.int64)
+
+        periods = price_oracle.periods
+        self._events = {metric: np.zeros((paths, periods), dtype=np.int64) for metric in EVENT_METRICS}
+        self._values: Dict[Metric, np.ndarray] = {}
+        self._tracked_values: List[Tuple[Metric, np.ndarray, int]] = []
+        for metric, pool, currency in [
+            (Metric.INSURANCE_POOL_LIQUIDITY_DAI, self.insurance_pool, Currency("dai")),
+            (Metric.VAULT_LIQUIDITY_DAI, self.vaults, Currency("dai")),
+            (Metric.GOVERNANCE_FEES_ETHEREUM, self.governance_pool, Currency("ethereum")),
+        ]:
+            if currency in self.currencies:
+                self._values[metric] = np.zeros((paths, periods))
+                self._tracked_values.append((metric, pool, self.currencies.index(currency)))
+
+    @property
+    def open_positions(self) -> np.ndarray:
+        """
+        Number of open positions of each path.
+        """
+        return self._active.sum(axis=(1, 2))
+
+    def run(self) -> VectorizedMetrics:
+        while True:
+            t = self.clock.time
+            cross_rates = self.price_oracle.cross_rates()
+
+            for trader in range(self.traders):
+                self._open_positions(trader, cross_rates)
+
+            # Positions are addressed by their flat index in the (paths x traders x slots) arrays
+            positions = np.flatnonzero(self._active)
+            traders = positions // self._active.shape[2] % self.traders
+            closing = self.random_stream.generator.random(len(positions)) < self.close_position_probability[traders]
+            self._close_positions(positions[closing], cross_rates, liquidation=False)
+
+            positions = positions[~closing]
+            liquidating = self._liquidation_mask(positions, cross_rates)
+            self._close_positions(positions[liquidating], cross_rates, liquidation=True)
+
+            for metric, pool, column in self._tracked_values:
+                self._values[metric][:, t] = pool[:, column]
+
+            should_continue = self.clock.step()
+            if not should_continue:
+                break
+
+        return VectorizedMetrics(events=self._events, values=self._values)
+
+    def _per_path(self, liquidity: Dict[Currency, float]) -> np.ndarray:
+        return np.array(
+            [[liquidity.get(currency, 0.0) for currency in self.currencies]] * self.paths,
+            dtype=np.float64,
+        )
+
+    def _swap_rates(self, cross_rates: np.ndarray, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        rates = cross_rates[src, dst]
+        if self.max_slippage_percent == 0.0:
+            return rates
+        normals = self.random_stream.generator.standard_normal(rates.shape)
+        return rates + rates * self.max_slippage_percent / 100.0 * normals
+
+    def _open_positions(self, trader: int, cross_rates: np.ndarray) -> None:
+        t = self.clock.time
+        generator = self.random_stream.generator
+        currencies = len(self.currencies)
+
+        want = generator.random(self.paths) < self.open_position_probability[trader]
+        paths = np.flatnonzero(want)
+        if len(paths) == 0:
+            return
+
+        src = generator.integers(0, currencies, len(paths))
+        dst = (src + generator.integers(1, currencies, len(paths))) % currencies
+        collateral = self.draw_collateral_usd(generator, len(paths)) / self.price_oracle.prices_at(t)[src]
+        principal = self.draw_leverage(generator, len(paths)) * collateral
+
+        can_open = self.liquidity[paths, trader, src] >= collateral
+        paths, src, dst, collateral, principal = (
+            paths[can_open], src[can_open], dst[can_open], collateral[can_open], principal[can_open]
+        )
+
+        amount = principal * self._swap_rates(cross_rates, src, dst)
+
+        has_liquidity = self.vaults[paths, src] >= principal
+        failed = paths[~has_liquidity]
+        self._events[Metric.TRADE_FAILED][failed, t] += 1
+        self._events[Metric.INSUFFICIENT_LIQUIDITY][failed, t] += 1
+
+        paths, src, dst, collateral, principal, amount = (
+            paths[has_liquidity],
+            src[has_liquidity],
+            dst[has_liquidity],
+            collateral[has_liquidity],
+            principal[has_liquidity],
+            amount[has_liquidity],
+        )
+        if len(paths) == 0:
+            return
+
+        free = ~self._active[paths, trader, :]
+        if not free.any(axis=1).all():
+            self._grow_slots()
+            free = ~self._active[paths, trader, :]
+        slots = np.argmax(free, axis=1)
+
+        index = (paths, trader, slots)
+        self._active[index] = True
+        self._owed[index] = src
+        self._held[index] = dst
+        self._collateral[index] = collateral
+        self._principal[index] = principal
+        self._allowance[index] = amount
+        self._interest_rate[index] = self.calculate_interest_rate(collateral, principal)
+        self._fees[index] = self.calculate_fees(collateral, principal)
+        self._created_at[index] = t
+
+        self.vaults[paths, src] -= principal  # A trader opens at most one position per path and tick
+        self._events[Metric.POSITION_OPENED][paths, t] += 1
+
+    def _liquidation_mask(self, positions: np.ndarray, cross_rates: np.ndarray) -> np.ndarray:
+        rates = self._swap_rates(cross_rates, self._held.ravel()[positions], self._owed.ravel()[positions])
+        collateral = self._collateral.ravel()[positions]
+        current_value_in_owed_tokens = self._allowance.ravel()[positions] * rates
+
+        return (
+            self._principal.ravel()[positions] - current_value_in_owed_tokens
+            > collateral - (RISK_FACTOR_PERCENT * collateral / 100) - self._fees.ravel()[positions]
+        )
+
+    def _close_positions(self, positions: np.ndarray, cross_rates: np.ndarray, liquidation: bool) -> None:
+        """
+        Applies the waterfall of `Ithil.close_position` to every position in `positions`,
+        given as sorted flat indexes.
+        """
+        if len(positions) == 0:
+            return
+
+        t = self.clock.time
+        slots = self._active.shape[2]
+        paths = positions // (self.traders * slots)
+        traders = positions // slots % self.traders
+        owed = self._owed.ravel()[positions]
+        collateral = self._collateral.ravel()[positions]
+        principal = self._principal.ravel()[positions]
+
+        governance_fees, insurance_fees = self.split_fees(self._fees.ravel()[positions])
+        hours = t - self._created_at.ravel()[positions]
+        interest = principal * self._interest_rate.ravel()[positions] * (hours / (365 * 24))
+        liquidation_fee = (
+            self.calculate_liquidation_fee(collateral, principal) if liquidation else np.zeros_like(principal)
+        )
+
+        amount = self._allowance.ravel()[positions] * self._swap_rates(cross_rates, self._held.ravel()[positions], owed)
+        assert np.all(amount > 0.0), "Swap returned negative or null amount"
+
+        total_position_liquidity = amount + collateral
+
+        # 0. Return either the original principal to liquidity providers or all remaining amount
+        liquidity_pool_amount = np.minimum(principal, total_position_liquidity)
+        remaining_position_liquidity = total_position_liquidity - liquidity_pool_amount
+
+        # 2. Pay interest rate to liquidity pool
+        interest_amount = np.minimum(interest, remaining_position_liquidity)
+        remaining_position_liquidity = remaining_position_liquidity - interest_amount
+
+        # 3. Pay insurance pool fees
+        insurance_fees_amount = np.minimum(insurance_fees, remaining_position_liquidity)
+        remaining_position_liquidity = remaining_position_liquidity - insurance_fees_amount
+
+        # 4. Pay governance fees
+        governance_fees_amount = np.minimum(governance_fees, remaining_position_liquidity)
+        remaining_position_liquidity = remaining_position_liquidity - governance_fees_amount
+
+        # 5. Pay liquidation fees from collateral if any
+        liquidation_fee_from_collateral = np.minimum(remaining_position_liquidity, liquidation_fee)
+        remaining_position_liquidity = remaining_position_liquidity - liquidation_fee_from_collateral
+
+        # 1. and 6. Pay missing liquidity and missing liquidation fees from the insurance pool
+        insurance_amount, liquidation_fee_from_insurance = self._draw_from_insurance_pool(
+            paths,
+            owed,
+            principal - liquidity_pool_amount,
+            liquidation_fee - liquidation_fee_from_collateral,
+        )
+
+        # 8. Calculate trader's P&L based on remaining liquidity
+        trader_pl = remaining_position_liquidity - collateral
+
+        currencies = len(self.currencies)
+        pool_index = paths * currencies + owed
+        size = self.paths * currencies
+        self.vaults += np.bincount(
+            pool_index, weights=liquidity_pool_amount + insurance_amount + interest_amount, minlength=size
+        ).reshape(self.vaults.shape)
+        self.insurance_pool += np.bincount(pool_index, weights=insurance_fees_amount, minlength=size).reshape(
+            self.insurance_pool.shape
+        )
+        self.governance_pool += np.bincount(pool_index, weights=governance_fees_amount, minlength=size).reshape(
+            self.governance_pool.shape
+        )
+        self.liquidity += np.bincount(
+            (paths * self.traders + traders) * currencies + owed,
+            weights=trader_pl,
+            minlength=self.liquidity.size,
+        ).reshape(self.liquidity.shape)
+
+        self._active.ravel()[positions] = False
+        self._events[Metric.POSITION_CLOSED][:, t] += np.bincount(paths, minlength=self.paths)
+
+    def _draw_from_insurance_pool(
+        self,
+        paths: np.ndarray,
+        owed: np.ndarray,
+        missing_liquidity: np.ndarray,
+        missing_liquidation_fee: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Repays each position's missing liquidity, then its missing liquidation fee, from the
+        insurance pool of its path and owed currency, one position after the other.
+        Positions must be sorted by path. The sequential draws are computed all at once
+        from the cumulative amount requested before each position.
+        """
+        # Interleave the two requests of each position, in the order they are paid
+        requested = np.column_stack([missing_liquidity, missing_liquidation_fee]).ravel()
+        request_paths = np.repeat(paths, 2)
+        request_owed = np.repeat(owed, 2)
+        drawn = np.zeros_like(requested)
+
+        for currency in range(len(self.currencies)):
+            selected = np.flatnonzero(request_owed == currency)
+            if len(selected) == 0:
+                continue
+
+            amounts = requested[selected]
+            amount_paths = request_paths[selected]
+            requested_before = np.cumsum(amounts) - amounts
+
+            # Restart the cumulative sum at the first request of every path
+            first = np.ones(len(selected), dtype=bool)
+            first[1:] = amount_paths[1:] != amount_paths[:-1]
+            starts = np.flatnonzero(first)
+            requested_before -= np.repeat(requested_before[starts], np.diff(np.append(starts, len(selected))))
+
+            available = self.insurance_pool[amount_paths, currency] - requested_before
+            drawn[selected] = np.minimum(np.maximum(available, 0.0), amounts)
+
+            self.insurance_pool[:, currency] -= np.bincount(
+                amount_paths, weights=drawn[selected], minlength=self.paths
+            )
+
+        drawn = drawn.reshape(-1, 2)
+        return drawn[:, 0], drawn[:, 1]
+
+    def _grow_slots(self) -> None:
+        def grow(array: np.ndarray) -> np.ndarray:
+            return np.concatenate([array, np.zeros_like(array)], axis=2)
+
+        self._active = grow(self._active)
+        self._owed = grow(self._owed)
+        self._held = grow(self._held)
+        self._collateral = grow(self._collateral)
+        self._principal = grow(self._principal)
+        self._allowance = grow(self._allowance)
+        self._interest_rate = grow(self._interest_rate)
+        self._fees = grow(self._fees)
+        self._created_at = grow(self._created_at)
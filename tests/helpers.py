@@ -0,0 +1,31 @@
+from typing import Any, Dict, Sequence
+
+from palantir.clock import Clock
+from palantir.constants import NO_SLIPPAGE
+from palantir.ithil import Ithil
+from palantir.metrics import MetricsLogger
+from palantir.oracle import PriceOracle
+from palantir.types import Currency
+
+
+def make_ithil(prices: Dict[Currency, Sequence[float]], vaults: Dict[Currency, float], **overrides: Any) -> Ithil:
+    """
+    Returns an Ithil with its own clock of as many ticks as prices, trading at the given prices
+    without slippage, fees nor interests and with an empty insurance pool. Any other argument
+    of `Ithil` but the clock can be given as a keyword to override these defaults.
+    """
+    clock = Clock(len(next(iter(prices.values()))))
+    arguments = dict(
+        apply_slippage=NO_SLIPPAGE,
+        calculate_fees=lambda _: 0.0,
+        calculate_interest_rate=lambda _src_token, _dst_token, _collateral, _principal: 0.0,
+        calculate_liquidation_fee=lambda _: 0.0,
+        clock=clock,
+        insurance_pool={token: 0.0 for token in prices},
+        metrics_logger=MetricsLogger(clock),
+        price_oracle=PriceOracle.from_arrays(clock=clock, prices=prices),
+        split_fees=lambda fees: (fees / 2.0, fees / 2.0),
+        vaults=vaults,
+    )
+    arguments.update(overrides)
+    return Ithil(**arguments)
@@ -0,0 +1,81 @@
+import logging
+import os
+
+import numpy as np
+
+from palantir.alignment import (
+    FFILL,
+    HOURLY,
+    LINEAR,
+    load_aligned_prices,
+    make_grid,
+    resample,
+)
+from palantir.clock import Clock
+from palantir.db import upsert_quotes
+from palantir.oracle import PriceOracle
+from palantir.types import Currency
+
+
+HOUR = 3600 * 1000
+
+
+def test_resample_fills_and_flags_gaps():
+    timestamps = np.array([1, 2, 6]) * HOUR
+    prices = np.array([10.0, 20.0, 60.0])
+    grid = make_grid(0, 7 * HOUR, HOURLY)
+
+    filled, gaps = resample(timestamps, prices, grid, FFILL, max_gap=2 * HOUR)
+    assert list(filled) == [10.0, 10.0, 20.0, 20.0, 20.0, 20.0, 60.0, 60.0]
+    assert list(gaps) == [False, False, False, False, False, True, False, False]
+
+    interpolated, _ = resample(timestamps, prices, grid, LINEAR, max_gap=2 * HOUR)
+    assert list(interpolated) == [10.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 60.0]
+
+
+def test_tokens_are_aligned_on_the_same_grid(tmp_path):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, dai = Currency("bitcoin"), Currency("dai")
+    # Quotes a few minutes off the hour, on different minutes for each token
+    upsert_quotes(bitcoin, Currency("usd"), [(t * HOUR + 60_000, 100.0 + t) for t in range(10)], url)
+    upsert_quotes(dai, Currency("usd"), [(t * HOUR - 120_000, 1.0) for t in range(1, 12)], url)
+    cache_dir = str(tmp_path / "cache")
+
+    aligned = load_aligned_prices([bitcoin, dai], periods=4, url=url, cache_dir=cache_dir)
+
+    assert list(aligned.timestamps) == [6 * HOUR, 7 * HOUR, 8 * HOUR, 9 * HOUR]
+    assert aligned.currencies == [bitcoin, dai]
+    assert list(aligned.prices[:, 0]) == [105.0, 106.0, 107.0, 108.0]
+    assert list(aligned.prices[:, 1]) == [1.0] * 4
+    assert not aligned.gaps.any()
+
+    # Cached until new quotes are stored
+    [cached] = os.listdir(cache_dir)
+    assert np.array_equal(load_aligned_prices([bitcoin, dai], periods=4, url=url, cache_dir=cache_dir).prices, aligned.prices)
+
+    upsert_quotes(bitcoin, Currency("usd"), [(10 * HOUR, 110.0)], url)
+    extended = load_aligned_prices([bitcoin, dai], periods=4, url=url, cache_dir=cache_dir)
+    assert list(extended.timestamps) == [7 * HOUR, 8 * HOUR, 9 * HOUR, 10 * HOUR]
+    assert len(os.listdir(cache_dir)) == 2
+
+    # Replacing stored prices invalidates the cache too
+    upsert_quotes(bitcoin, Currency("usd"), [(8 * HOUR + 60_000, 200.0)], url)
+    corrected = load_aligned_prices([bitcoin, dai], periods=4, url=url, cache_dir=cache_dir)
+    assert list(corrected.prices[:, 0]) == [106.0, 107.0, 200.0, 110.0]
+    assert len(os.listdir(cache_dir)) == 3
+
+
+def test_gaps_are_logged_and_kept_by_the_oracle(tmp_path, caplog):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, dai = Currency("bitcoin"), Currency("dai")
+    upsert_quotes(bitcoin, Currency("usd"), [(t * HOUR, 100.0 + t) for t in range(10)], url)
+    # DAI is only quoted from the 6th hour on
+    upsert_quotes(dai, Currency("usd"), [(t * HOUR, 1.0) for t in range(6, 10)], url)
+
+    with caplog.at_level(logging.WARNING):
+        oracle = PriceOracle.from_db(clock=Clock(8), db=url, tokens=[bitcoin, dai], hours=8)
+
+    assert list(oracle.gaps[:, 0]) == [False] * 8
+    assert list(oracle.gaps[:, 1]) == [True] * 2 + [False] * 6
+    assert "dai has no quotes for 2 of the 8 aligned prices" in caplog.text
+    assert "bitcoin" not in caplog.text
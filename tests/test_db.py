@@ -0,0 +1,84 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from palantir.db import (
+    get_engine,
+    init_db,
+    quote_coverage,
+    quotes,
+    read_quotes,
+    upsert_quotes,
+    upsert_statement,
+    Quote,
+    QuoteCoverage,
+)
+from palantir.types import Currency
+
+
+def test_quotes_are_upserted_in_bulk(tmp_path):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, usd = Currency("bitcoin"), Currency("usd")
+
+    assert upsert_quotes(bitcoin, usd, [(1, 10.0), (2, 20.0)], url) == 2
+    assert upsert_quotes(bitcoin, usd, [(2, 21.0), (3, 30.0)], url) == 2
+    upsert_quotes(Currency("ethereum"), usd, [(1, 1.0)], url)
+
+    with get_engine(url).connect() as connection:
+        rows = connection.execute(
+            select(quotes.c.timestamp, quotes.c.price).where(quotes.c.coin == bitcoin).order_by(quotes.c.timestamp)
+        ).fetchall()
+        journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+    assert [tuple(row) for row in rows] == [(1, 10.0), (2, 21.0), (3, 30.0)]
+    assert journal_mode == "wal"
+    assert get_engine(url) is get_engine(url)
+
+
+def test_quotes_are_upserted_only_into_databases_supporting_it():
+    statement = str(upsert_statement("postgresql").compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (coin, vs_currency, timestamp) DO UPDATE SET price = excluded.price" in statement
+
+    with pytest.raises(AssertionError):
+        upsert_statement("mysql")
+
+
+def test_existing_duplicates_are_removed(tmp_path):
+    path = tmp_path / "legacy.db"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE quotes (id INTEGER PRIMARY KEY AUTOINCREMENT, coin VARCHAR, vs_currency VARCHAR, timestamp INTEGER, price FLOAT)"
+    )
+    connection.executemany(
+        "INSERT INTO quotes (coin, vs_currency, timestamp, price) VALUES (?, ?, ?, ?)",
+        [("dai", "usd", 1, 1.0), ("dai", "usd", 1, 1.1), ("dai", "usd", 2, 1.0)],
+    )
+    connection.commit()
+    connection.close()
+
+    db = init_db(f"sqlite:///{path}")
+
+    assert [(quote.timestamp, quote.price) for quote in db.query(Quote).order_by(Quote.timestamp)] == [(1, 1.0), (2, 1.0)]
+
+
+def test_quotes_are_read_in_windows(tmp_path):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, dai = Currency("bitcoin"), Currency("dai")
+    upsert_quotes(bitcoin, Currency("usd"), [(t, 100.0 + t) for t in range(10)], url)
+    upsert_quotes(bitcoin, Currency("eur"), [(t, 0.0) for t in range(20)], url)
+
+    timestamps, prices = read_quotes(bitcoin, last=3, url=url)
+    assert timestamps.dtype == np.int64 and list(timestamps) == [7, 8, 9]
+    assert list(prices) == [107.0, 108.0, 109.0]
+
+    assert list(read_quotes(bitcoin, start=2, end=5, url=url)[0]) == [2, 3, 4]
+    assert list(read_quotes(bitcoin, start=2, end=5, last=2, url=url)[0]) == [3, 4]
+    assert len(read_quotes(dai, url=url)[0]) == 0
+
+    assert quote_coverage([bitcoin, dai], url=url) == {
+        bitcoin: QuoteCoverage(10, 0, 9, 1045.0),
+        dai: QuoteCoverage(0, None, None),
+    }
@@ -1,8 +1,12 @@
+import random
 from typing import List
 
+import pytest
+
 from palantir.clock import Clock
 from palantir.constants import (
     GAUSS_RANDOM_SLIPPAGE,
+    NO_SLIPPAGE,
 )
 from palantir.db import Quote
 from palantir.ithil import Ithil
@@ -22,9 +26,6 @@ NO_FEES = lambda _: 0.0
 NO_INTEREST = lambda _src_token, _dst_token, _collateral, _principal: 0.0
 
 
-NO_SLIPPAGE = lambda price: price
-
-
 def make_test_quotes_from_prices(prices: List[Price]) -> List[Quote]:
     return [
         Quote(id=0, coin='', vs_currency='usd', timestamp=0, price=price)
@@ -507,3 +508,189 @@ def test_trade_zero_fees_zero_interest_with_loss_and_liquidation():
 
     assert trader_pl == -(Percent(80).of(COLLATERAL) + LIQUIDATION_FEE)
     assert liquidation_pl == LIQUIDATION_FEE == 1.0
+
+
+def test_open_positions_are_indexed_until_closed():
+    """
+    Two traders open positions on different pairs.
+    Active positions and the owner and token indexes reflect every open and close.
+    """
+    quotes = {
+        Currency("dai"): make_test_quotes_from_prices([1.0, 1.0]),
+        Currency("ethereum"): make_test_quotes_from_prices([4000, 4000]),
+    }
+    periods = len(list(quotes.values())[0])
+    clock = Clock(periods)
+    metrics_logger = MetricsLogger(clock)
+    ithil = Ithil(
+        apply_slippage=NO_SLIPPAGE,
+        calculate_fees=NO_FEES,
+        calculate_interest_rate=NO_INTEREST,
+        calculate_liquidation_fee=lambda _: 0.0,
+        clock=clock,
+        insurance_pool={
+            Currency("dai"): 0.0,
+            Currency("ethereum"): 0.0,
+        },
+        metrics_logger=metrics_logger,
+        price_oracle=PriceOracle(
+            clock=clock,
+            quotes=quotes,
+        ),
+        split_fees=lambda fees: (0.0, fees),
+        vaults={
+            Currency("dai"): 750000.0,
+            Currency("ethereum"): 300.0,
+        },
+    )
+
+    alice_position_id = ithil.open_position(
+        trader=Account("alice"),
+        src_token=Currency("dai"),
+        dst_token=Currency("ethereum"),
+        collateral_token=Currency("dai"),
+        collateral=100.0,
+        principal=1000.0,
+        max_slippage_percent=10,
+    )
+    bob_position_id = ithil.open_position(
+        trader=Account("bob"),
+        src_token=Currency("ethereum"),
+        dst_token=Currency("dai"),
+        collateral_token=Currency("ethereum"),
+        collateral=0.1,
+        principal=1.0,
+        max_slippage_percent=10,
+    )
+
+    assert set(ithil.active_positions) == {alice_position_id, bob_position_id}
+    assert set(ithil.positions_by_owner(Account("alice"))) == {alice_position_id}
+    assert set(ithil.positions_by_owed_token(Currency("ethereum"))) == {bob_position_id}
+    assert set(ithil.positions_by_held_token(Currency("ethereum"))) == {alice_position_id}
+
+    ithil.close_position(alice_position_id)
+
+    assert set(ithil.active_positions) == {bob_position_id}
+    assert alice_position_id in ithil.positions
+    assert alice_position_id in ithil.closed_positions
+    assert len(ithil.positions_by_owner(Account("alice"))) == 0
+    assert len(ithil.positions_by_held_token(Currency("ethereum"))) == 0
+    assert ithil.can_liquidate_position(alice_position_id) == False
+
+    # The view follows closes, while snapshots can be iterated as positions are closed
+    view = ithil.active_positions_view
+    for position_id in ithil.active_positions:
+        ithil.close_position(position_id)
+    assert len(view) == 0
+
+
+@pytest.mark.parametrize("apply_slippage", [NO_SLIPPAGE, lambda price: price * 0.99])
+def test_batch_liquidation_matches_scalar_check_with_deterministic_slippage(apply_slippage):
+    """
+    Traders open many random positions on every pair, then prices move.
+    The batch liquidation check agrees exactly with the scalar one on every position,
+    both through the liquidation price index and through the full sweep.
+    """
+    rng = random.Random(42)
+    quotes = {
+        Currency("bitcoin"): make_test_quotes_from_prices([40000.0, 36000.0]),
+        Currency("dai"): make_test_quotes_from_prices([1.0, 1.0]),
+        Currency("ethereum"): make_test_quotes_from_prices([4000.0, 4500.0]),
+    }
+    tokens = list(quotes.keys())
+    periods = len(list(quotes.values())[0])
+    clock = Clock(periods)
+    metrics_logger = MetricsLogger(clock)
+    ithil = Ithil(
+        apply_slippage=apply_slippage,
+        calculate_fees=lambda position: position.collateral / 100.0,
+        calculate_interest_rate=NO_INTEREST,
+        calculate_liquidation_fee=lambda _: 0.0,
+        clock=clock,
+        insurance_pool={token: 0.0 for token in tokens},
+        metrics_logger=metrics_logger,
+        price_oracle=PriceOracle(
+            clock=clock,
+            quotes=quotes,
+        ),
+        split_fees=lambda fees: (0.0, fees),
+        vaults={token: 1e12 for token in tokens},
+    )
+
+    for n in range(500):
+        src_token, dst_token = rng.sample(tokens, 2)
+        collateral = rng.uniform(1.0, 100.0)
+        ithil.open_position(
+            trader=Account(f"trader-{n % 7}"),
+            src_token=src_token,
+            dst_token=dst_token,
+            collateral_token=src_token,
+            collateral=collateral,
+            principal=collateral * rng.uniform(1.0, 10.0),
+            max_slippage_percent=10,
+        )
+
+    clock.step()
+
+    expected = [
+        position_id
+        for position_id in sorted(ithil.active_positions)
+        if ithil.can_liquidate_position(position_id)
+    ]
+
+    assert 0 < len(expected) < len(ithil.active_positions)
+    assert ithil.liquidatable_positions() == expected
+
+    liquidated = ithil.liquidate_positions()
+
+    assert sorted(liquidated) == expected
+    assert ithil.liquidatable_positions() == []
+    assert not any(position_id in ithil.active_positions for position_id in expected)
+
+
+def test_batches_of_positions_match_positions_opened_and_closed_one_by_one():
+    periods = 3
+    tokens = [Currency("dai"), Currency("ethereum")]
+    traders = [Account(f"0x{n}") for n in range(4)]
+    src_tokens = [tokens[n % 2] for n in range(4)]
+    dst_tokens = [tokens[1 - n % 2] for n in range(4)]
+    collaterals = [100.0, 0.05, 200.0, 0.1]
+    principals = [1000.0, 0.5, 900000.0, 0.2]  # The third one exceeds the DAI vault
+
+    def make_ithil() -> Ithil:
+        clock = Clock(periods)
+        return Ithil(
+            apply_slippage=NO_SLIPPAGE,
+            calculate_fees=lambda position: position.collateral / 100.0,
+            calculate_interest_rate=lambda _src_token, _dst_token, _collateral, _principal: 0.1,
+            calculate_liquidation_fee=lambda _: 0.0,
+            clock=clock,
+            insurance_pool={token: 10.0 for token in tokens},
+            metrics_logger=MetricsLogger(clock),
+            price_oracle=PriceOracle.from_arrays(
+                clock=clock,
+                prices={Currency("dai"): [1.0] * periods, Currency("ethereum"): [4000.0, 4400.0, 3000.0]},
+            ),
+            split_fees=lambda fees: (fees / 2.0, fees / 2.0),
+            vaults={Currency("dai"): 750000.0, Currency("ethereum"): 300.0},
+        )
+
+    one_by_one = make_ithil()
+    ids = [
+        one_by_one.open_position(trader, src, dst, src, collateral, principal, 10)
+        for trader, src, dst, collateral, principal in zip(traders, src_tokens, dst_tokens, collaterals, principals)
+    ]
+    batch = make_ithil()
+    batch_ids = batch.open_positions(traders, src_tokens, dst_tokens, src_tokens, collaterals, principals, 10)
+
+    assert batch_ids == ids == [0, 1, None, 2]
+    assert batch.positions == one_by_one.positions
+
+    one_by_one.clock.step()
+    batch.clock.step()
+    results = [one_by_one.close_position(position_id) for position_id in [2, 0]]
+    assert batch.close_positions([2, 0]) == results
+    assert batch.vaults == one_by_one.vaults
+    assert batch.insurance_pool == one_by_one.insurance_pool
+    assert dict(batch.governance_pool) == dict(one_by_one.governance_pool)
+    assert list(batch.active_positions) == [1]
@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+import pytest
+
+from palantir.ithil import Ithil
+from palantir.journal import MAGIC, RECORD, VERSION, PositionJournal, read_journal
+from palantir.trace import HEADER, NULL_TRACER, BinaryFileSink, EventType, Tracer, read_records, trace_events
+from palantir.types import Account, Currency
+from tests import helpers
+
+
+def make_ithil(journal: PositionJournal, tracer: Tracer = NULL_TRACER) -> Ithil:
+    return helpers.make_ithil(
+        prices={Currency("dai"): [1.0, 1.0], Currency("ethereum"): [4000.0, 3600.0]},
+        vaults={Currency("dai"): 2000.0, Currency("ethereum"): 0.0},
+        calculate_fees=lambda _: 10.0,
+        calculate_liquidation_fee=lambda _: 5.0,
+        insurance_pool={Currency("dai"): 50.0},
+        journal=journal,
+        tracer=tracer,
+    )
+
+
+def test_journal_records_the_lifecycle_of_positions(tmp_path):
+    path = str(tmp_path / "positions.journal")
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+
+    with PositionJournal(path) as journal:
+        ithil = make_ithil(journal)
+        first = ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        second = ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        trader_pl, _ = ithil.close_position(first)
+        ithil.clock.step()
+        (liquidated_pl, liquidation_pl), = ithil.liquidate_positions().values()
+
+    # Reopening a journal appends to it
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 10.0, 100.0, 0.0)
+
+    records, symbols = read_journal(path)
+
+    assert isinstance(records, np.memmap)
+    assert list(records["type"]) == [EventType.OPENED, EventType.OPENED, EventType.CLOSED, EventType.LIQUIDATED, EventType.OPENED]
+    assert list(records["position_id"]) == [first, second, first, second, 0]
+    assert list(records["time"]) == [0, 0, 0, 1, 0]
+    assert symbols == [trader, dai, ethereum]
+    assert {symbols[index] for index in records["owed_token"]} == {dai}
+    assert records["price"][0] == 1.0 / 4000.0
+    assert records["price"][3] == 3600.0
+
+    opened = records[records["type"] == EventType.OPENED]
+    assert np.isnan(opened["trader_pl"]).all()
+
+    closed, liquidated = records[2], records[3]
+    assert closed["trader_pl"] == trader_pl
+    assert closed["liquidity_pool_amount"] == 1000.0
+    assert closed["insurance_fees_amount"] == closed["governance_fees_amount"] == 5.0
+
+    # 900 DAI of the 1000 DAI principal are recovered after the drop, plus 100 DAI of collateral
+    assert liquidated["amount"] == 900.0
+    assert liquidated["liquidity_pool_amount"] == 1000.0
+    assert liquidated["insurance_amount"] == 0.0
+    assert liquidated["liquidation_pl"] == liquidation_pl == 5.0
+    assert liquidated["trader_pl"] == liquidated_pl
+
+
+def test_reopening_a_journal_drops_a_partial_last_record(tmp_path):
+    path = str(tmp_path / "positions.journal")
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 10.0, 100.0, 0.0)
+
+    # A writer crashed halfway through the second record
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - RECORD.size // 2)
+
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 20.0, 200.0, 0.0)
+
+    records, _ = read_journal(path)
+    assert list(records["collateral"]) == [100.0, 20.0]
+    assert os.path.getsize(path) == HEADER.size + 2 * RECORD.size
+
+
+def test_journals_with_another_layout_are_not_appended_to(tmp_path):
+    path = str(tmp_path / "positions.journal")
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION + 1, RECORD.size))
+
+    with pytest.raises(AssertionError):
+        PositionJournal(path)
+
+
+def test_traces_and_journals_of_the_same_events_read_alike(tmp_path):
+    journal_path = str(tmp_path / "positions.journal")
+    trace_path = str(tmp_path / "positions.trace")
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+
+    tracer = Tracer([BinaryFileSink(trace_path)], enabled=[EventType.OPENED, EventType.CLOSED, EventType.LIQUIDATED])
+    with PositionJournal(journal_path) as journal:
+        ithil = make_ithil(journal, tracer)
+        first = ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        ithil.close_position(first)
+        ithil.clock.step()
+        ithil.liquidate_positions()
+    tracer.close()
+
+    assert trace_events(*read_records(journal_path)) == trace_events(*read_records(trace_path))
+    assert len(read_records(trace_path)[0]) == 4
+
+
+def test_symbols_are_on_disk_before_the_records_using_them(tmp_path):
+    path = str(tmp_path / "positions.journal")
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+        journal._file.file.flush()
+
+        # Records flushed without the journal being flushed resolve against the symbols on disk
+        records, symbols = read_journal(path)
+        assert symbols == [trader, dai, ethereum]
+        assert {symbols[index] for index in records["owner"]} == {trader}
+
+        with pytest.raises(AssertionError):
+            journal._file.symbol("0xabcd\n0xef01")
+
+
+def test_reopening_a_journal_drops_a_partial_last_symbol(tmp_path):
+    path = str(tmp_path / "positions.journal")
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+
+    # A writer crashed halfway through a new symbol
+    with open(f"{path}.symbols", "a") as file:
+        file.write("0xef")
+
+    with PositionJournal(path) as journal:
+        make_ithil(journal).open_position(Account("0xef01"), dai, ethereum, dai, 10.0, 100.0, 0.0)
+
+    records, symbols = read_journal(path)
+    assert symbols == [trader, dai, ethereum, "0xef01"]
+    assert [symbols[index] for index in records["owner"]] == [trader, "0xef01"]
@@ -0,0 +1,88 @@
+from typing import List
+
+import numpy as np
+import pytest
+
+from palantir.clock import Clock
+from palantir.metrics import (
+    Metric,
+    MetricsAggregator,
+    MetricsAggregatorAvg,
+    MetricsAggregatorMax,
+    MetricsAggregatorMin,
+    MetricsAggregatorSum,
+    MetricsLogger,
+    make_timeseries,
+)
+
+
+def test_timeseries_aggregate_samples_per_tick():
+    clock = Clock(3)
+    metrics_logger = MetricsLogger(clock, keep_samples=[Metric.VAULT_LIQUIDITY_DAI])
+
+    for sample in [3.0, -1.0, 4.0]:
+        metrics_logger.log(Metric.VAULT_LIQUIDITY_DAI, sample)
+    metrics_logger.log(Metric.POSITION_OPENED)
+    clock.step()
+    clock.step()
+    metrics_logger.log(Metric.VAULT_LIQUIDITY_DAI, 2.0)
+
+    metrics = metrics_logger.metrics
+
+    def timeseries(aggregator):
+        return list(make_timeseries(metrics, Metric.VAULT_LIQUIDITY_DAI, aggregator, 3))
+
+    assert timeseries(MetricsAggregatorSum()) == [6.0, 0.0, 2.0]
+    assert timeseries(MetricsAggregatorAvg()) == [2.0, 0.0, 2.0]
+    assert timeseries(MetricsAggregatorMax()) == [4.0, 0.0, 2.0]
+    assert timeseries(MetricsAggregatorMin()) == [-1.0, 0.0, 2.0]
+    assert list(make_timeseries(metrics, Metric.VAULT_LIQUIDITY_DAI, MetricsAggregatorSum(), 5)) == [6.0, 0.0, 2.0, 0.0, 0.0]
+
+    assert Metric.POSITION_OPENED in metrics
+    assert Metric.TRADE_FAILED not in metrics
+    assert list(metrics.count(Metric.POSITION_OPENED)) == [1, 0, 0]
+
+    assert metrics.samples == {Metric.VAULT_LIQUIDITY_DAI: {0: [3.0, -1.0, 4.0], 2: [2.0]}}
+
+
+def test_aggregators_agree_with_raw_samples():
+    rng = np.random.default_rng(0)
+    clock = Clock(20)
+    metrics_logger = MetricsLogger(clock, keep_samples=[Metric.TRADE_FAILED])
+
+    while True:
+        for sample in rng.normal(size=rng.integers(1, 5)):
+            metrics_logger.log(Metric.TRADE_FAILED, float(sample))
+        if not clock.step():
+            break
+
+    metrics = metrics_logger.metrics
+    samples = metrics.samples[Metric.TRADE_FAILED]
+
+    for aggregator in [MetricsAggregatorSum(), MetricsAggregatorAvg(), MetricsAggregatorMax(), MetricsAggregatorMin()]:
+        assert np.allclose(
+            make_timeseries(metrics, Metric.TRADE_FAILED, aggregator, 20),
+            [aggregator.aggregate(samples[t]) for t in range(20)],
+        )
+
+
+class MetricsAggregatorMedian(MetricsAggregator):
+    def aggregate(self, samples: List[float]) -> float:
+        return float(np.median(samples))
+
+
+def test_aggregators_without_timeseries_aggregate_the_kept_samples():
+    clock = Clock(3)
+    metrics_logger = MetricsLogger(clock, keep_samples=[Metric.VAULT_LIQUIDITY_DAI])
+    for sample in [3.0, -1.0, 4.0]:
+        metrics_logger.log(Metric.VAULT_LIQUIDITY_DAI, sample)
+        metrics_logger.log(Metric.TRADE_FAILED, sample)
+    clock.step()
+    metrics_logger.log(Metric.VAULT_LIQUIDITY_DAI, 2.0)
+    metrics = metrics_logger.metrics
+
+    median = MetricsAggregatorMedian()
+    assert list(make_timeseries(metrics, Metric.VAULT_LIQUIDITY_DAI, median, 4)) == [3.0, 2.0, 0.0, 0.0]
+    assert list(make_timeseries(metrics, Metric.POSITION_OPENED, median, 3)) == [0.0, 0.0, 0.0]
+    with pytest.raises(AssertionError, match="keep_samples"):
+        make_timeseries(metrics, Metric.TRADE_FAILED, median, 3)
@@ -0,0 +1,101 @@
+import pickle
+
+import numpy as np
+
+from palantir.clock import Clock
+from palantir.db import Quote, upsert_quotes
+from palantir.oracle import PriceOracle
+from palantir.types import Currency
+
+
+PRICES = {
+    Currency("bitcoin"): [40000.0, 41000.0, 39000.0],
+    Currency("dai"): [1.0, 1.0, 0.99],
+    Currency("ethereum"): [4000.0, 4100.0, 3900.0],
+}
+
+
+def test_constructors_agree():
+    clock = Clock(3)
+    quotes = {
+        token: [
+            Quote(id=0, coin=token, vs_currency="usd", timestamp=t, price=price)
+            for t, price in enumerate(prices)
+        ]
+        for token, prices in PRICES.items()
+    }
+
+    from_quotes = PriceOracle(clock=clock, quotes=quotes)
+    from_arrays = PriceOracle.from_arrays(clock=clock, prices=PRICES)
+
+    assert from_quotes.currencies == from_arrays.currencies == list(PRICES.keys())
+    assert np.array_equal(from_quotes.prices, from_arrays.prices)
+    assert from_quotes.prices.shape == (3, 3)
+
+
+def test_prices_follow_the_clock():
+    clock = Clock(3)
+    oracle = PriceOracle.from_arrays(clock=clock, prices=PRICES)
+
+    assert oracle.get_price(Currency("bitcoin")) == 40000.0
+    assert isinstance(oracle.get_price(Currency("bitcoin")), float)
+
+    clock.step()
+
+    columns = oracle.columns([Currency("ethereum"), Currency("dai")])
+    out = np.empty(2)
+    assert oracle.get_prices(columns, out=out) is out
+    assert list(out) == [4100.0, 1.0]
+    assert list(oracle.get_prices([Currency("bitcoin")])) == [41000.0]
+    assert list(oracle.prices_at(2)) == [39000.0, 0.99, 3900.0]
+
+
+def test_save_load_and_pickle(tmp_path):
+    clock = Clock(3)
+    oracle = PriceOracle.from_arrays(clock=clock, prices=PRICES)
+
+    path = str(tmp_path / "prices.npz")
+    oracle.save(path)
+    loaded = PriceOracle.from_file(clock=clock, path=path)
+
+    assert loaded.currencies == oracle.currencies
+    assert np.array_equal(loaded.prices, oracle.prices)
+
+    matrix_path = str(tmp_path / "prices.npy")
+    np.save(matrix_path, oracle.prices)
+    mapped = PriceOracle.from_file(clock=clock, path=matrix_path, currencies=oracle.currencies, mmap_mode="r")
+
+    assert mapped.get_price(Currency("dai")) == 1.0
+
+    unpickled = pickle.loads(pickle.dumps(oracle))
+
+    assert unpickled.get_price(Currency("ethereum")) == 4000.0
+
+
+def test_cross_rates_are_recomputed_when_the_clock_advances():
+    clock = Clock(3)
+    oracle = PriceOracle.from_arrays(clock=clock, prices=PRICES)
+
+    bitcoin, dai, ethereum = oracle.currencies
+
+    assert oracle.get_rate(bitcoin, ethereum) == 40000.0 / 4000.0
+    assert oracle.get_rate(ethereum, dai) == 4000.0 / 1.0
+    assert np.all(np.diag(oracle.cross_rates()) == 1.0)
+
+    clock.step()
+    clock.step()
+
+    assert oracle.get_rate(ethereum, dai) == 3900.0 / 0.99
+    assert oracle.cross_rates()[oracle.column(dai), oracle.column(bitcoin)] == 0.99 / 39000.0
+
+
+def test_oracle_reads_the_last_quotes_from_db(tmp_path):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    hour = 3600 * 1000
+    for token, prices in PRICES.items():
+        upsert_quotes(token, Currency("usd"), [(0, 0.0)] + [(t * hour, price) for t, price in enumerate(prices, start=1)], url)
+
+    oracle = PriceOracle.from_db(clock=Clock(3), db=url, tokens=list(PRICES), hours=3)
+
+    assert oracle.currencies == list(PRICES)
+    assert np.array_equal(oracle.prices, np.column_stack(list(PRICES.values())))
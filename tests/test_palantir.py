@@ -0,0 +1,110 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+from palantir.clock import Clock
+from palantir.metrics import Metric
+from palantir.oracle import PriceOracle
+from palantir.palantir import Palantir
+from palantir.randomness import RandomStream
+from palantir.reducers import MetricsReducer
+from palantir.shared import SharedPrices, SharedPricesHandle, attach_prices
+from palantir.simulation import Simulation
+from palantir.trader import Trader
+from palantir.types import Account, Currency
+from tests.helpers import make_ithil
+
+
+PERIODS = 50
+TOKENS = [Currency("dai"), Currency("ethereum")]
+
+
+def build_simulation(random_stream: RandomStream) -> Simulation:
+    ithil = make_ithil(
+        prices={
+            Currency("dai"): [1.0] * PERIODS,
+            Currency("ethereum"): [4000.0 + 10.0 * t for t in range(PERIODS)],
+        },
+        vaults={Currency("dai"): 750000.0, Currency("ethereum"): 300.0},
+    )
+    traders = [
+        Trader(
+            account=Account(f"trader-{n}"),
+            open_position_probability=0.2,
+            close_position_probability=0.1,
+            ithil=ithil,
+            calculate_collateral_usd=lambda oracle, token: random_stream.uniform(10.0, 100.0) / oracle.get_price(token),
+            calculate_leverage=lambda: random_stream.uniform(1.0, 10.0),
+            liquidity={Currency("dai"): 1000.0, Currency("ethereum"): 1.0},
+            random_stream=random_stream,
+        )
+        for n in range(5)
+    ]
+    return Simulation(clock=ithil.clock, ithil=ithil, traders=traders)
+
+
+def test_seeded_runs_are_reproducible_across_workers():
+    in_process = Palantir(build_simulation, simulations_number=6, seed=1, workers=0).run()
+    in_workers = Palantir(build_simulation, simulations_number=6, seed=1, workers=2, chunksize=2).run()
+
+    assert in_process == in_workers
+    assert in_process[0] != in_process[1]
+
+
+def test_results_are_streamed_with_a_callback():
+    completed = []
+    palantir = Palantir(build_simulation, simulations_number=4, seed=2, workers=2)
+
+    streamed = dict(palantir.run_iter(on_result=lambda index, metrics: completed.append(index)))
+
+    assert sorted(completed) == sorted(streamed) == [0, 1, 2, 3]
+
+
+def build_simulation_on_shared_prices(handle: SharedPricesHandle, random_stream: RandomStream) -> Simulation:
+    simulation = build_simulation(random_stream)
+    simulation.ithil.price_oracle = PriceOracle.from_shared(clock=simulation.clock, handle=handle)
+    return simulation
+
+
+def test_workers_attach_to_shared_prices():
+    prices = PriceOracle.from_arrays(
+        clock=Clock(PERIODS),
+        prices={
+            Currency("dai"): [1.0] * PERIODS,
+            Currency("ethereum"): [4000.0 + 10.0 * t for t in range(PERIODS)],
+        },
+    )
+    expected = Palantir(build_simulation, simulations_number=4, seed=3, workers=0).run()
+
+    with SharedPrices(prices.currencies, prices.prices) as shared_prices:
+        metrics = Palantir(
+            partial(build_simulation_on_shared_prices, shared_prices.handle),
+            simulations_number=4,
+            seed=3,
+            workers=2,
+        ).run()
+
+    assert metrics == expected
+
+    with pytest.raises(FileNotFoundError):
+        attach_prices(shared_prices.handle)
+
+
+def test_reduced_runs_match_collected_runs():
+    collected = Palantir(build_simulation, simulations_number=8, seed=4, workers=0).run()
+    reduced = Palantir(build_simulation, simulations_number=8, seed=4, workers=2).reduce(
+        partial(MetricsReducer, PERIODS)
+    )
+
+    opened = np.stack([metrics.sum(Metric.POSITION_OPENED) for metrics in collected])
+    assert reduced.count == 8
+    np.testing.assert_allclose(reduced.average(Metric.POSITION_OPENED), opened.mean(axis=0))
+    np.testing.assert_array_equal(reduced.max(Metric.POSITION_OPENED), opened.max(axis=0))
+
+
+def test_skipped_simulations_keep_their_seeds():
+    full = Palantir(build_simulation, simulations_number=4, seed=5, workers=0).run()
+    resumed = Palantir(build_simulation, simulations_number=4, seed=5, workers=0).run(skip={0, 2})
+
+    assert resumed == [None, full[1], None, full[3]]
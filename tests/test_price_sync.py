@@ -0,0 +1,213 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+from palantir.constants import SECONDS_IN_A_DAY, SECONDS_IN_AN_HOUR
+from palantir.crawlers import coingecko
+from palantir.crawlers.coingecko import CrawlError, coin_list
+from palantir.crawlers.http import TokenBucket
+from palantir.db import quote_coverage, read_quotes
+from palantir.types import Currency
+from palantir.util import missing_ranges, sync_price_data
+
+
+NOW = 1_700_000_000 - 1_700_000_000 % SECONDS_IN_AN_HOUR
+
+
+def no_rate_limit() -> TokenBucket:
+    return TokenBucket(rate=1e6, capacity=1e6)
+
+
+class CoinGeckoStub(BaseHTTPRequestHandler):
+    """
+    Serves prices for any coin, hourly or every 5 minutes for ranges shorter than 2 days as
+    CoinGecko does, and records the ranges requested.
+    Requests for the (coin, from) chunks in `failures` fail with the given statuses first.
+    """
+    coins = ["bitcoin", "ethereum"]
+    requests: List[Tuple[str, int, int]] = []
+    failures: Dict[Tuple[str, int], List[int]] = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/coins/list":
+            self.requests.append(("list", 0, 0))
+            body = [{"id": coin, "symbol": coin[:3], "name": coin.title()} for coin in self.coins]
+        else:
+            coin = url.path.split("/")[2]
+            query = parse_qs(url.query)
+            start, end = int(query["from"][0]), int(query["to"][0])
+            self.requests.append((coin, start, end))
+            statuses = self.failures.get((coin, start))
+            if statuses:
+                self.send_response(statuses.pop(0))
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            interval = SECONDS_IN_AN_HOUR if end - start >= 2 * SECONDS_IN_A_DAY else 5 * 60
+            first = -(-start // interval) * interval
+            body = {"prices": [[t * 1000, t / SECONDS_IN_AN_HOUR] for t in range(first, end + 1, interval)]}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def coingecko_url(tmp_path, monkeypatch):
+    CoinGeckoStub.requests = []
+    CoinGeckoStub.failures = {}
+    monkeypatch.setattr(coingecko, "COIN_LIST_CACHE_PATH", str(tmp_path / "coins.json"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CoinGeckoStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_missing_ranges():
+    hour = SECONDS_IN_AN_HOUR
+    stored = np.array([2, 3, 4, 8, 9]) * hour * 1000
+
+    assert missing_ranges(stored, 0, 10 * hour) == [(4 * hour, 8 * hour)]
+    assert missing_ranges(stored, -5 * hour, 15 * hour) == [(-5 * hour, 2 * hour), (4 * hour, 8 * hour), (9 * hour, 15 * hour)]
+    assert missing_ranges(np.array([], dtype=np.int64), 0, hour) == []
+    assert missing_ranges(np.array([], dtype=np.int64), 0, 10 * hour) == [(0, 10 * hour)]
+
+
+def test_only_missing_quotes_are_downloaded(tmp_path, coingecko_url):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, ethereum = Currency("bitcoin"), Currency("ethereum")
+
+    written = sync_price_data([bitcoin], hours=48, url=url, now=NOW, base_url=coingecko_url, limiter=no_rate_limit())
+    assert written == {bitcoin: 50}
+    assert CoinGeckoStub.requests == [("list", 0, 0), ("bitcoin", NOW - 49 * SECONDS_IN_AN_HOUR, NOW)]
+
+    # A day later, with a new token and a longer horizon
+    CoinGeckoStub.requests = []
+    later = NOW + 24 * SECONDS_IN_AN_HOUR
+    sync_price_data([bitcoin, ethereum], hours=96, url=url, now=later, base_url=coingecko_url, limiter=no_rate_limit())
+
+    # Gaps shorter than 2 days are downloaded from earlier on, to get hourly prices
+    assert sorted(CoinGeckoStub.requests) == [
+        ("bitcoin", NOW - 97 * SECONDS_IN_AN_HOUR, NOW - 49 * SECONDS_IN_AN_HOUR),
+        ("bitcoin", later - 48 * SECONDS_IN_AN_HOUR, later),
+        ("ethereum", later - 97 * SECONDS_IN_AN_HOUR, later),
+    ]
+
+    timestamps, prices = read_quotes(bitcoin, url=url)
+    assert np.array_equal(np.diff(timestamps), np.full(121, SECONDS_IN_AN_HOUR * 1000))
+    assert timestamps[0] == (NOW - 97 * SECONDS_IN_AN_HOUR) * 1000
+    assert timestamps[-1] == later * 1000
+
+    # Nothing is missing anymore
+    CoinGeckoStub.requests = []
+    assert sync_price_data(
+        [bitcoin, ethereum], hours=96, url=url, now=later, base_url=coingecko_url, limiter=no_rate_limit()
+    ) == {bitcoin: 0, ethereum: 0}
+    assert CoinGeckoStub.requests == []
+
+
+def test_gaps_shorter_than_a_day_are_downloaded_hourly(tmp_path, coingecko_url):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin = Currency("bitcoin")
+    sync_price_data([bitcoin], hours=48, url=url, now=NOW, base_url=coingecko_url, limiter=no_rate_limit())
+
+    # Three hours later only three quotes are missing, but they are downloaded hourly
+    CoinGeckoStub.requests = []
+    later = NOW + 3 * SECONDS_IN_AN_HOUR
+    sync_price_data([bitcoin], hours=48, url=url, now=later, base_url=coingecko_url, limiter=no_rate_limit())
+
+    [(_, from_timestamp, to_timestamp)] = CoinGeckoStub.requests
+    assert to_timestamp - from_timestamp >= 2 * SECONDS_IN_A_DAY
+    timestamps, _ = read_quotes(bitcoin, url=url)
+    assert np.array_equal(np.diff(timestamps), np.full(len(timestamps) - 1, SECONDS_IN_AN_HOUR * 1000))
+    assert quote_coverage([bitcoin], url=url)[bitcoin].count == 53
+    assert timestamps[-1] == later * 1000
+
+
+def test_failed_chunks_are_retried_or_resumed(tmp_path, coingecko_url):
+    url = f"sqlite:///{tmp_path / 'quotes.db'}"
+    bitcoin, ethereum = Currency("bitcoin"), Currency("ethereum")
+    hours = 70 * 24
+    start = NOW - (hours + 1) * SECONDS_IN_AN_HOUR
+    second_chunk = start + 30 * SECONDS_IN_A_DAY
+
+    # Transient errors are retried, a missing chunk fails the crawl after the other chunks are stored
+    CoinGeckoStub.failures = {("bitcoin", start): [429, 503], ("ethereum", second_chunk): [404]}
+    with pytest.raises(CrawlError) as error:
+        sync_price_data([bitcoin, ethereum], hours=hours, url=url, now=NOW, base_url=coingecko_url, limiter=no_rate_limit())
+
+    assert [chunk.coin_id for chunk in error.value.failed] == [ethereum]
+    assert CoinGeckoStub.requests.count(("bitcoin", start, second_chunk)) == 3
+    assert len(read_quotes(bitcoin, url=url)[0]) == hours + 2
+
+    # Resuming only downloads the chunk that failed
+    CoinGeckoStub.requests = []
+    sync_price_data([bitcoin, ethereum], hours=hours, url=url, now=NOW, base_url=coingecko_url, limiter=no_rate_limit())
+
+    [(coin, from_timestamp, to_timestamp)] = CoinGeckoStub.requests
+    assert coin == "ethereum" and second_chunk - SECONDS_IN_AN_HOUR <= from_timestamp < to_timestamp <= second_chunk + 30 * SECONDS_IN_A_DAY + SECONDS_IN_AN_HOUR
+    assert np.array_equal(read_quotes(ethereum, url=url)[0], read_quotes(bitcoin, url=url)[0])
+
+
+def test_token_bucket_limits_the_rate():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = TokenBucket(rate=2.0, capacity=2.0, clock=lambda: now[0], sleep=sleep)
+    for _ in range(6):
+        limiter.acquire()
+
+    assert waits == [0.5, 0.5, 0.5, 0.5]
+    assert now[0] == 2.0
+
+
+def test_coin_list_is_cached_until_it_expires(tmp_path, coingecko_url):
+    cache_path = str(tmp_path / "coins.json")
+
+    coins = coin_list(coingecko_url, cache_path, ttl=60.0, now=1000.0)
+    assert coins["bitcoin"] == {"id": "bitcoin", "symbol": "bit", "name": "Bitcoin"}
+
+    # Fresh lists are read from the cache, also by another process
+    coingecko._coin_lists.clear()
+    assert coin_list(coingecko_url, cache_path, ttl=60.0, now=1059.0) == coins
+    assert CoinGeckoStub.requests == [("list", 0, 0)]
+
+    CoinGeckoStub.coins = ["bitcoin", "ethereum", "dai"]
+    try:
+        assert "dai" in coin_list(coingecko_url, cache_path, ttl=60.0, now=1060.0)
+    finally:
+        CoinGeckoStub.coins = ["bitcoin", "ethereum"]
+    assert len(CoinGeckoStub.requests) == 2
+
+
+def test_expired_coin_list_is_used_offline(tmp_path, coingecko_url):
+    cache_path = str(tmp_path / "coins.json")
+    coin_list(coingecko_url, cache_path, ttl=60.0, now=1000.0)
+    coingecko._coin_lists.clear()
+
+    # Nothing listens on the port of a closed server
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        offline_url = f"http://127.0.0.1:{closed.getsockname()[1]}"
+
+    assert set(coin_list(offline_url, cache_path, ttl=60.0, now=5000.0)) == {"bitcoin", "ethereum"}
@@ -0,0 +1,33 @@
+import numpy as np
+
+from palantir.randomness import GaussianSlippage, RandomStream, make_random_streams
+
+
+def test_streams_are_reproducible():
+    a = RandomStream(42, block_size=16)
+    b = RandomStream(42, block_size=16)
+
+    samples_a = [(a.random(), a.gauss(), a.choice("abc")) for _ in range(100)]
+    samples_b = [(b.random(), b.gauss(), b.choice("abc")) for _ in range(100)]
+
+    assert samples_a == samples_b
+    assert all(0.0 <= r < 1.0 for r, _, _ in samples_a)
+
+
+def test_spawned_streams_are_independent_and_reproducible():
+    streams = make_random_streams(7, 3)
+    first_draws = [stream.random() for stream in streams]
+
+    assert len(set(first_draws)) == 3
+    assert first_draws == [stream.random() for stream in make_random_streams(7, 3)]
+
+
+def test_gaussian_slippage():
+    slippage = GaussianSlippage(RandomStream(0), max_slippage_percent=1.0)
+
+    prices = np.full(100000, 2000.0)
+    slipped = slippage.apply_many(prices)
+
+    assert abs(slipped.mean() - 2000.0) < 1.0
+    assert abs(slipped.std() - 20.0) < 1.0
+    assert slippage(2000.0) != 2000.0
@@ -0,0 +1,79 @@
+import numpy as np
+
+from palantir.metrics import Metric, Metrics, METRIC_INDEX, MetricsAggregatorMax
+from palantir.reducers import MetricsReducer, QuantileSketch
+
+
+PERIODS = 20
+
+
+def random_metrics(generator: np.random.Generator) -> Metrics:
+    metrics = Metrics.empty(PERIODS)
+    metrics.sums[:] = generator.normal(100.0, 10.0, metrics.sums.shape)
+    metrics.counts[:] = 1
+    metrics.mins[:] = metrics.sums
+    metrics.maxs[:] = metrics.sums
+    return metrics
+
+
+def test_merged_reducers_match_a_single_pass():
+    generator = np.random.default_rng(0)
+    simulations = [random_metrics(generator) for _ in range(50)]
+    sums = np.stack([metrics.sums for metrics in simulations])
+
+    merged = MetricsReducer(PERIODS)
+    for batch in (simulations[:7], simulations[7:30], simulations[30:]):
+        reducer = MetricsReducer(PERIODS)
+        for metrics in batch:
+            reducer.add(metrics)
+        merged.merge(reducer)
+
+    row = METRIC_INDEX[Metric.POSITION_OPENED]
+    assert merged.count == 50
+    np.testing.assert_allclose(merged.average(Metric.POSITION_OPENED), sums[:, row].mean(axis=0))
+    np.testing.assert_allclose(merged.variance(Metric.POSITION_OPENED), sums[:, row].var(axis=0, ddof=1))
+    np.testing.assert_array_equal(merged.min(Metric.POSITION_OPENED), sums[:, row].min(axis=0))
+    np.testing.assert_array_equal(merged.max(Metric.POSITION_OPENED), sums[:, row].max(axis=0))
+
+
+def test_reducer_uses_the_metric_aggregator():
+    metrics = Metrics.empty(PERIODS)
+    metrics.sums[METRIC_INDEX[Metric.TRADE_FAILED]] = 10.0
+    metrics.maxs[METRIC_INDEX[Metric.TRADE_FAILED]] = 4.0
+    metrics.counts[METRIC_INDEX[Metric.TRADE_FAILED]] = 3
+
+    reducer = MetricsReducer(PERIODS, aggregators={Metric.TRADE_FAILED: MetricsAggregatorMax()})
+    reducer.add(metrics)
+
+    np.testing.assert_array_equal(reducer.average(Metric.TRADE_FAILED), np.full(PERIODS, 4.0))
+
+
+def test_quantile_sketch_is_accurate_with_bounded_memory():
+    generator = np.random.default_rng(1)
+    values = generator.uniform(0.0, 1.0, (20000, 3))
+
+    sketches = [QuantileSketch((3,), k=128) for _ in range(4)]
+    for n, row in enumerate(values):
+        sketches[n % 4].add(row)
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+
+    assert sketch.count == len(values)
+    assert sketch.nbytes < values.nbytes / 10
+    for q in (0.05, 0.5, 0.95):
+        np.testing.assert_allclose(sketch.quantile(q), np.quantile(values, q, axis=0), atol=0.03)
+
+
+def test_reducers_seeded_differently_make_different_errors():
+    generator = np.random.default_rng(2)
+    simulations = [random_metrics(generator) for _ in range(200)]
+
+    def percentiles(seed) -> np.ndarray:
+        reducer = MetricsReducer(PERIODS, quantile_metrics=[Metric.POSITION_OPENED], sketch_size=8, seed=seed)
+        for metrics in simulations:
+            reducer.add(metrics)
+        return reducer.percentile_bands(Metric.POSITION_OPENED)
+
+    np.testing.assert_array_equal(percentiles(np.random.SeedSequence(1)), percentiles(np.random.SeedSequence(1)))
+    assert not np.array_equal(percentiles(np.random.SeedSequence(1)), percentiles(np.random.SeedSequence(2)))
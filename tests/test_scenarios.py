@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from palantir.clock import Clock
+from palantir.oracle import PriceOracle
+from palantir.scenarios import (
+    GBM,
+    JUMP_DIFFUSION,
+    REGIME_SWITCHING,
+    BlockBootstrap,
+    MarketModel,
+    calibrate,
+    generate_paths,
+)
+from palantir.types import Currency
+
+
+CURRENCIES = [Currency("bitcoin"), Currency("ethereum"), Currency("dai")]
+
+
+def make_history(periods: int = 20000) -> np.ndarray:
+    generator = np.random.default_rng(0)
+    correlation = np.array([[1.0, 0.8, 0.0], [0.8, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    normals = generator.standard_normal((periods, 3)) @ np.linalg.cholesky(correlation).T
+    log_returns = np.array([1e-4, 2e-4, 0.0]) + np.array([0.01, 0.015, 0.0005]) * normals
+    log_returns[::1000, 0] -= 0.2  # A crash every 1000 ticks
+    return np.array([40000.0, 3000.0, 1.0]) * np.exp(np.cumsum(log_returns, axis=0))
+
+
+def test_calibration_recovers_the_parameters(tmp_path):
+    model = calibrate(CURRENCIES, make_history())
+
+    np.testing.assert_allclose(model.volatility, [0.01, 0.015, 0.0005], rtol=0.05)
+    np.testing.assert_allclose(model.correlation[0, 1], 0.8, atol=0.02)
+    np.testing.assert_allclose(model.jump_intensity[0], 1e-3, rtol=0.1)
+    np.testing.assert_allclose(model.jump_mean[0], -0.2, atol=0.03)
+    assert model.jump_intensity[2] < 1e-3
+    assert (model.regime_volatility[1] > model.regime_volatility[0]).all()
+
+    model.save(str(tmp_path / "model.npz"))
+    loaded = MarketModel.load(str(tmp_path / "model.npz"))
+    assert loaded.currencies == CURRENCIES
+    np.testing.assert_array_equal(loaded.regime_transitions, model.regime_transitions)
+
+
+def test_calibration_leaves_out_filled_in_prices():
+    history = make_history()
+    gaps = np.zeros(history.shape, dtype=bool)
+    # Bitcoin is only quoted for the last half, before it the first quote is back-filled
+    gaps[:10000, 0] = True
+    history[:10000, 0] = history[10000, 0]
+
+    model = calibrate(CURRENCIES, history, gaps=gaps)
+
+    np.testing.assert_allclose(model.volatility, [0.01, 0.015, 0.0005], rtol=0.05)
+    np.testing.assert_allclose(model.jump_intensity[0], 1e-3, rtol=0.2)
+    np.testing.assert_allclose(model.correlation[0, 1], 0.8, atol=0.02)
+    assert calibrate(CURRENCIES, history).volatility[0] < 0.008
+
+
+@pytest.mark.parametrize("kind", [GBM, JUMP_DIFFUSION, REGIME_SWITCHING])
+def test_generated_paths_follow_the_model(kind):
+    model = calibrate(CURRENCIES, make_history())
+
+    paths = generate_paths(model, kind, paths=200, periods=500, generator=np.random.default_rng(1))
+
+    assert paths.shape == (200, 500, 3)
+    np.testing.assert_array_equal(paths[:, 0], np.broadcast_to(model.initial_prices, (200, 3)))
+    log_returns = np.diff(np.log(paths), axis=1).reshape(-1, 3)
+    np.testing.assert_allclose(log_returns.std(axis=0), model.volatility, rtol=0.25)
+    assert np.corrcoef(log_returns[:, 0], log_returns[:, 1])[0, 1] > 0.6
+
+    oracle = PriceOracle.from_matrix(clock=Clock(500), currencies=model.currencies, prices=paths[3])
+    assert np.shares_memory(oracle.prices, paths)
+
+    initial = generate_paths(model, kind, paths=2, periods=1, generator=np.random.default_rng(1))
+    np.testing.assert_array_equal(initial, np.broadcast_to(model.initial_prices, (2, 1, 3)))
+
+
+def test_bootstrap_resamples_whole_rows_of_historical_returns():
+    history = make_history(5000)
+    bootstrap = BlockBootstrap(CURRENCIES, history, mean_block_length=24.0)
+
+    indices = bootstrap.indices(np.random.default_rng(1), paths=100, steps=1000)
+    assert indices.min() >= 0 and indices.max() < 4999
+    # Blocks are runs of consecutive ticks, wrapping around the end of the history
+    new_blocks = np.diff(indices, axis=1) % 4999 != 1
+    np.testing.assert_allclose(1.0 / new_blocks.mean(), 24.0, rtol=0.1)
+
+    path = bootstrap.path(np.random.default_rng(2), periods=1000)
+    np.testing.assert_array_equal(path[0], history[0])
+    log_returns = np.diff(np.log(path), axis=0)
+    historical = np.diff(np.log(history), axis=0)
+    # Every tick moves all the currencies together as they did at some historical tick
+    matches = (np.abs(log_returns[:, None, :] - historical[None, :, :]) < 1e-9).all(axis=2)
+    assert matches.any(axis=1).all()
+
+    np.testing.assert_array_equal(bootstrap.path(np.random.default_rng(2), periods=1), history[:1])
+
+
+def test_bootstrap_paths_are_lazy_distinct_and_reproducible():
+    bootstrap = BlockBootstrap(CURRENCIES, make_history(5000))
+
+    paths = bootstrap.iter_paths(np.random.default_rng(3), paths=250, periods=100, chunk_size=100)
+    first = next(paths)
+    rest = list(paths)
+    assert first.shape == (100, 3) and len(rest) == 249
+    assert not np.array_equal(first, rest[0])
+
+    again = list(bootstrap.iter_paths(np.random.default_rng(3), paths=250, periods=100, chunk_size=100))
+    np.testing.assert_array_equal(np.stack([first] + rest), np.stack(again))
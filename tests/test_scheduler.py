@@ -0,0 +1,84 @@
+import numpy as np
+
+from palantir.metrics import Metric
+from palantir.randomness import RandomStream
+from palantir.scheduler import EventScheduler
+from palantir.simulation import Simulation
+from palantir.trader import Trader
+from palantir.types import Account, Currency
+from tests.helpers import make_ithil
+
+
+TOKENS = [Currency("dai"), Currency("ethereum")]
+
+
+def build_simulation(
+    periods: int,
+    traders_number: int,
+    random_stream: RandomStream,
+    open_position_probability: float = 0.05,
+    close_position_probability: float = 0.1,
+    event_driven: bool = False,
+) -> Simulation:
+    ithil = make_ithil(
+        prices={Currency("dai"): [1.0] * periods, Currency("ethereum"): [4000.0] * periods},
+        vaults={Currency("dai"): 1e12, Currency("ethereum"): 1e9},
+    )
+    traders = [
+        Trader(
+            account=Account(f"trader-{n}"),
+            open_position_probability=open_position_probability,
+            close_position_probability=close_position_probability,
+            ithil=ithil,
+            calculate_collateral_usd=lambda oracle, token: 100.0 / oracle.get_price(token),
+            calculate_leverage=lambda: 2.0,
+            liquidity={Currency("dai"): 1e9, Currency("ethereum"): 1e6},
+            random_stream=random_stream,
+        )
+        for n in range(traders_number)
+    ]
+    return Simulation(clock=ithil.clock, ithil=ithil, traders=traders, event_driven=event_driven)
+
+
+def test_geometric_delays():
+    random_stream = RandomStream(0)
+
+    delays = np.array([random_stream.geometric(0.1) for _ in range(50000)])
+
+    assert delays.min() == 1
+    np.testing.assert_allclose(delays.mean(), 10.0, rtol=0.03)
+    np.testing.assert_allclose((delays == 1).mean(), 0.1, rtol=0.05)
+    assert random_stream.geometric(1.0) == 1
+
+
+def test_event_driven_simulation_trades_like_the_per_tick_one():
+    opened = {}
+    closed = {}
+    for event_driven in (False, True):
+        simulation = build_simulation(200, 100, RandomStream(1), event_driven=event_driven)
+        metrics = simulation.run()
+        opened[event_driven] = metrics.count(Metric.POSITION_OPENED).sum()
+        closed[event_driven] = metrics.count(Metric.POSITION_CLOSED).sum()
+
+    # 100 traders opening with probability 0.05 for 200 ticks
+    np.testing.assert_allclose(opened[True], 1000.0, rtol=0.1)
+    np.testing.assert_allclose(opened[True], opened[False], rtol=0.1)
+    np.testing.assert_allclose(closed[True], closed[False], rtol=0.1)
+
+
+def test_positions_closed_before_their_event_are_skipped():
+    simulation = build_simulation(
+        20, 3, RandomStream(2), open_position_probability=1.0, close_position_probability=1e-9
+    )
+    scheduler = EventScheduler(simulation.clock, simulation.ithil, simulation.traders)
+
+    scheduler.run_due()
+    assert len(simulation.ithil.active_positions) == 3
+    for trader in simulation.traders:
+        for position_id in trader.active_positions:
+            trader.close_position(position_id)
+
+    while simulation.clock.step():
+        scheduler.run_due()
+
+    assert len(simulation.ithil.active_positions) == 3 * 19
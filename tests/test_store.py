@@ -0,0 +1,94 @@
+import sqlite3
+
+import numpy as np
+
+from palantir.metrics import Metric, MetricsAggregatorMax, MetricsLogger
+from palantir.clock import Clock
+from palantir.store import ResultStore
+
+
+PERIODS = 10
+
+
+def make_metrics(scale: float, keep_samples=()):
+    clock = Clock(PERIODS)
+    metrics_logger = MetricsLogger(clock, keep_samples)
+    while True:
+        metrics_logger.log(Metric.POSITION_OPENED, scale * clock.time)
+        metrics_logger.log(Metric.POSITION_OPENED, 1.0)
+        if not clock.step():
+            break
+    return metrics_logger.metrics
+
+
+def test_results_are_written_and_queried_lazily(tmp_path):
+    store = ResultStore(str(tmp_path))
+    run_id = store.create_run(seed=7, params={"traders": 10}, simulations_number=3, periods=PERIODS)
+    write = store.writer(run_id)
+
+    for index in [2, 0]:
+        write(index, make_metrics(float(index)))
+
+    assert store.runs() == [run_id]
+    assert store.run(run_id)["params"] == {"traders": 10}
+    assert store.run(run_id)["seed"] == 7
+    assert store.completed(run_id) == {0, 2}
+    assert store.count(run_id) == 2
+    assert store.summaries(run_id)[2][Metric.POSITION_OPENED] == 2.0 * sum(range(PERIODS)) + PERIODS
+
+    loaded = store.load(run_id, 2)
+    assert isinstance(loaded.sums, np.memmap)
+    assert loaded == make_metrics(2.0)
+
+    np.testing.assert_array_equal(
+        store.timeseries(run_id, Metric.POSITION_OPENED, MetricsAggregatorMax()),
+        [np.maximum(0.0, np.ones(PERIODS)), np.maximum(2.0 * np.arange(PERIODS), 1.0)],
+    )
+    assert not list(tmp_path.glob(f"{run_id}/*.tmp"))
+
+
+def test_runs_reproduce_their_seed_sequence(tmp_path):
+    store = ResultStore(str(tmp_path))
+    seed = np.random.SeedSequence(7, pool_size=8).spawn(2)[1]
+    run_id = store.create_run(seed=seed, params={}, simulations_number=2, periods=PERIODS)
+
+    seed_sequence = store.seed_sequence(run_id)
+    assert store.run(run_id)["spawn_key"] == (1,)
+    assert seed_sequence.pool_size == 8
+    np.testing.assert_array_equal(seed_sequence.generate_state(4), seed.generate_state(4))
+    np.testing.assert_array_equal(
+        seed_sequence.spawn(1)[0].generate_state(4), seed.spawn(1)[0].generate_state(4)
+    )
+
+
+def test_runs_stored_before_spawn_keys_use_the_defaults(tmp_path):
+    connection = sqlite3.connect(tmp_path / "index.db")
+    connection.execute(
+        "CREATE TABLE runs (run_id VARCHAR PRIMARY KEY, seed VARCHAR, params VARCHAR, simulations_number INTEGER, periods INTEGER)"
+    )
+    connection.execute("INSERT INTO runs VALUES ('legacy', '7', '{}', 2, 10)")
+    connection.commit()
+    connection.close()
+
+    store = ResultStore(str(tmp_path))
+
+    np.testing.assert_array_equal(
+        store.seed_sequence("legacy").generate_state(4), np.random.SeedSequence(7).generate_state(4)
+    )
+    assert store.run(store.create_run(seed=7, params={}, simulations_number=1, periods=PERIODS))["pool_size"] == 4
+
+
+def test_kept_samples_are_stored_aside(tmp_path):
+    store = ResultStore(str(tmp_path))
+    run_id = store.create_run(seed=7, params={}, simulations_number=2, periods=PERIODS)
+    metrics = make_metrics(3.0, keep_samples=[Metric.POSITION_OPENED, Metric.POSITION_CLOSED])
+
+    store.write(run_id, 0, metrics)
+    store.write(run_id, 1, make_metrics(3.0))
+
+    loaded = store.load(run_id, 0)
+    assert loaded.samples[Metric.POSITION_OPENED][4] == [12.0, 1.0]
+    assert loaded.samples[Metric.POSITION_CLOSED] == {}
+    assert loaded == metrics
+    assert store.load(run_id, 1).samples == {}
+    assert not list(tmp_path.glob(f"{run_id}/*.tmp"))
@@ -0,0 +1,66 @@
+import logging
+
+from palantir.ithil import Ithil
+from palantir.trace import (
+    BinaryFileSink,
+    Event,
+    EventType,
+    LoggingSink,
+    RingBufferSink,
+    Tracer,
+    read_trace,
+    trace_events,
+)
+from palantir.types import Account, Currency
+from tests import helpers
+
+
+def make_ithil(tracer: Tracer) -> Ithil:
+    return helpers.make_ithil(
+        prices={Currency("dai"): [1.0, 1.0], Currency("ethereum"): [4000.0, 2000.0]},
+        vaults={Currency("dai"): 2000.0, Currency("ethereum"): 0.0},
+        tracer=tracer,
+    )
+
+
+def trade(ithil: Ithil) -> None:
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+    first = ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+    second = ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+    ithil.open_position(trader, dai, ethereum, dai, 100.0, 1000.0, 0.0)
+    ithil.close_position(first)
+    ithil.clock.step()
+    ithil.liquidate_positions()
+    assert second not in ithil.active_positions
+
+
+def test_events_are_sent_to_every_sink(tmp_path):
+    ring_buffer = RingBufferSink(capacity=3)
+    path = str(tmp_path / "trace.bin")
+    tracer = Tracer([ring_buffer, BinaryFileSink(path)])
+
+    trade(make_ithil(tracer))
+    tracer.close()
+
+    trader = Account("0xabcd")
+    dai, ethereum = Currency("dai"), Currency("ethereum")
+    expected = [
+        Event(EventType.OPENED, 0, 0, trader, dai, ethereum, 1000.0),
+        Event(EventType.OPENED, 0, 1, trader, dai, ethereum, 1000.0),
+        Event(EventType.FAILED, 0, -1, trader, dai, ethereum, 1000.0),
+        Event(EventType.CLOSED, 0, 0, trader, dai, ethereum, 0.0),
+        Event(EventType.LIQUIDATED, 1, 1, trader, dai, ethereum, -100.0),
+    ]
+    assert list(ring_buffer.events) == expected[-3:]
+    assert trace_events(*read_trace(path)) == expected
+
+
+def test_disabled_events_are_not_traced(caplog):
+    tracer = Tracer([LoggingSink()], enabled=[EventType.LIQUIDATED])
+
+    with caplog.at_level(logging.INFO, logger="palantir.trace"):
+        trade(make_ithil(tracer))
+
+    assert [record.args[0].type for record in caplog.records] == [EventType.LIQUIDATED]
+    assert not Tracer(enabled=list(EventType)).opened
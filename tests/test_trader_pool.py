@@ -0,0 +1,94 @@
+import numpy as np
+
+from palantir.ithil import Ithil
+from palantir.metrics import Metric
+from palantir.randomness import RandomStream
+from palantir.simulation import Simulation
+from palantir.trace import NULL_TRACER, EventType, RingBufferSink, Tracer
+from palantir.trader import Trader
+from palantir.trader_pool import TraderPool
+from palantir.types import Account, Currency
+from tests import helpers
+
+
+TOKENS = [Currency("dai"), Currency("ethereum")]
+TRADERS = 200
+LIQUIDITY = {Currency("dai"): 1e6, Currency("ethereum"): 1e3}
+
+
+def make_ithil(ethereum_prices, tracer: Tracer = NULL_TRACER) -> Ithil:
+    return helpers.make_ithil(
+        prices={Currency("dai"): [1.0] * len(ethereum_prices), Currency("ethereum"): list(ethereum_prices)},
+        vaults={Currency("dai"): 1e12, Currency("ethereum"): 1e9},
+        tracer=tracer,
+    )
+
+
+def make_pool(ithil: Ithil, random_stream: RandomStream) -> TraderPool:
+    return TraderPool(
+        accounts=[Account(f"trader-{n}") for n in range(TRADERS)],
+        ithil=ithil,
+        liquidity=np.array([LIQUIDITY[token] for token in sorted(LIQUIDITY)]),
+        open_position_probability=0.05,
+        close_position_probability=np.linspace(0.05, 0.15, TRADERS),
+        draw_collateral_usd=lambda generator, traders: np.full(len(traders), 100.0),
+        draw_leverage=lambda generator, traders: generator.uniform(1.0, 5.0, len(traders)),
+        random_stream=random_stream,
+    )
+
+
+def test_pool_trades_like_trader_objects():
+    ethereum_prices = 4000.0 * np.exp(np.cumsum(np.random.default_rng(0).normal(0.0, 0.005, 300)))
+
+    pool_ithil = make_ithil(ethereum_prices)
+    pool = make_pool(pool_ithil, RandomStream(1))
+    pool_metrics = Simulation(clock=pool_ithil.clock, ithil=pool_ithil, traders=[], trader_pool=pool).run()
+
+    ithil = make_ithil(ethereum_prices)
+    random_stream = RandomStream(2)
+    traders = [
+        Trader(
+            account=Account(f"trader-{n}"),
+            open_position_probability=0.05,
+            close_position_probability=close_position_probability,
+            ithil=ithil,
+            calculate_collateral_usd=lambda oracle, token: 100.0 / oracle.get_price(token),
+            calculate_leverage=lambda: random_stream.uniform(1.0, 5.0),
+            liquidity=dict(LIQUIDITY),
+            random_stream=random_stream,
+        )
+        for n, close_position_probability in enumerate(np.linspace(0.05, 0.15, TRADERS))
+    ]
+    metrics = Simulation(clock=ithil.clock, ithil=ithil, traders=traders).run()
+
+    for metric in (Metric.POSITION_OPENED, Metric.POSITION_CLOSED):
+        np.testing.assert_allclose(pool_metrics.count(metric).sum(), metrics.count(metric).sum(), rtol=0.1)
+    assert pool.open_positions == len(pool_ithil.active_positions)
+    np.testing.assert_allclose(pool.open_positions, len(ithil.active_positions), rtol=0.3)
+
+
+def test_pool_is_credited_with_closed_and_liquidated_positions():
+    # Ethereum crashes, so that positions holding it are liquidated
+    sink = RingBufferSink()
+    ithil = make_ithil([4000.0] * 10 + [1000.0] * 10, Tracer([sink], [EventType.CLOSED, EventType.LIQUIDATED]))
+    pool = make_pool(ithil, RandomStream(3))
+
+    Simulation(clock=ithil.clock, ithil=ithil, traders=[], trader_pool=pool).run()
+
+    assert {event.type for event in sink.events} == {EventType.CLOSED, EventType.LIQUIDATED}
+    assert pool.open_positions == len(ithil.active_positions)
+    # The amount of closing events is the trader's P&L
+    expected = np.broadcast_to([LIQUIDITY[token] for token in pool.tokens], (TRADERS, 2)).copy()
+    for event in sink.events:
+        expected[int(event.owner.split("-")[1]), pool.tokens.index(event.owed_token)] += event.amount
+    np.testing.assert_allclose(pool.liquidity, expected)
+
+
+def test_positions_of_unknown_accounts_are_liquidated_without_a_pool():
+    ithil = make_ithil([4000.0] * 2 + [1000.0] * 2)
+    dai, ethereum = TOKENS
+    position_id = ithil.open_position(Account("0xabcd"), dai, ethereum, dai, 100.0, 1000.0, 0.0)
+
+    Simulation(clock=ithil.clock, ithil=ithil, traders=[]).run()
+
+    assert position_id not in ithil.active_positions
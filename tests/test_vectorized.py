@@ -0,0 +1,156 @@
+import numpy as np
+
+from palantir.clock import Clock
+from palantir.metrics import Metric, MetricsAggregatorAvg, MetricsAggregatorSum, make_timeseries
+from palantir.oracle import PriceOracle
+from palantir.randomness import RandomStream
+from palantir.simulation import Simulation
+from palantir.trader import Trader
+from palantir.types import Account, Currency
+from palantir.vectorized import VectorizedSimulation
+from tests.helpers import make_ithil
+
+
+DAI = Currency("dai")
+ETHEREUM = Currency("ethereum")
+
+
+def make_simulation(
+    ethereum_prices,
+    paths,
+    traders,
+    insurance_liquidity,
+    close_position_probability=0.0,
+    seed=0,
+    dai_vault=750000.0,
+) -> VectorizedSimulation:
+    """
+    Traders only hold DAI, so they can only borrow DAI to buy ETH,
+    with a collateral of 100 DAI and a leverage of x10.
+    """
+    clock = Clock(len(ethereum_prices))
+    price_oracle = PriceOracle.from_arrays(
+        clock=clock,
+        prices={
+            DAI: [1.0] * len(ethereum_prices),
+            ETHEREUM: ethereum_prices,
+        },
+    )
+    return VectorizedSimulation(
+        clock=clock,
+        price_oracle=price_oracle,
+        paths=paths,
+        random_stream=RandomStream(seed),
+        vaults={DAI: dai_vault, ETHEREUM: 300.0},
+        insurance_pool={DAI: insurance_liquidity},
+        traders_liquidity=[{DAI: 1000.0}] * traders,
+        open_position_probability=1.0,
+        close_position_probability=close_position_probability,
+        draw_collateral_usd=lambda generator, n: np.full(n, 100.0),
+        draw_leverage=lambda generator, n: np.full(n, 10.0),
+        calculate_fees=lambda collateral, principal: np.zeros_like(collateral),
+        calculate_interest_rate=lambda collateral, principal: np.zeros_like(collateral),
+        calculate_liquidation_fee=lambda collateral, principal: np.zeros_like(collateral),
+        split_fees=lambda fees: (fees / 2.0, fees / 2.0),
+    )
+
+
+def test_liquidation_repaid_by_insurance_on_every_path():
+    """
+    ETH loses 50% at the second tick: positions opened at the first tick are
+    liquidated and the missing 400 DAI of each are repaid by the insurance pool.
+    """
+    simulation = make_simulation([4000.0, 2000.0], paths=200, traders=1, insurance_liquidity=1000.0)
+
+    metrics = simulation.run()
+
+    opened_first = metrics.events[Metric.POSITION_OPENED][:, 0] == 1
+    assert 0 < opened_first.sum() < 200
+    assert np.array_equal(metrics.events[Metric.POSITION_CLOSED][:, 1], opened_first.astype(int))
+    assert np.array_equal(simulation.insurance_pool[:, 0], np.where(opened_first, 600.0, 1000.0))
+    assert np.array_equal(simulation.liquidity[:, 0, 0], np.where(opened_first, 900.0, 1000.0))
+    assert np.array_equal(
+        metrics.values[Metric.INSURANCE_POOL_LIQUIDITY_DAI][:, 1],
+        simulation.insurance_pool[:, 0],
+    )
+
+
+def test_insurance_pool_is_drawn_sequentially_within_a_path():
+    """
+    Three traders are liquidated at the same tick but the insurance pool
+    only covers 500 of the missing DAI of each path.
+    """
+    simulation = make_simulation([4000.0, 2000.0], paths=500, traders=3, insurance_liquidity=500.0)
+
+    metrics = simulation.run()
+
+    liquidated = metrics.events[Metric.POSITION_CLOSED][:, 1]
+    assert set(liquidated) == {0, 1, 2, 3}
+    assert np.allclose(simulation.insurance_pool[:, 0], np.maximum(500.0 - 400.0 * liquidated, 0.0))
+    assert np.all(simulation.insurance_pool >= 0.0)
+
+
+def test_paths_expose_the_same_metrics_as_a_simulation():
+    prices = list(4000.0 * np.exp(np.cumsum(np.random.default_rng(1).normal(0.0, 0.02, 200))))
+
+    first = make_simulation(prices, paths=20, traders=5, insurance_liquidity=0.0, close_position_probability=0.1)
+    second = make_simulation(prices, paths=20, traders=5, insurance_liquidity=0.0, close_position_probability=0.1)
+    metrics, same_metrics = first.run(), second.run()
+
+    assert len(metrics) == 20
+    for path in range(20):
+        assert metrics[path] == same_metrics[path]
+
+    opened = make_timeseries(metrics[3], Metric.POSITION_OPENED, MetricsAggregatorSum(), len(prices))
+    assert np.array_equal(opened, metrics.events[Metric.POSITION_OPENED][3])
+    vault = make_timeseries(metrics[3], Metric.VAULT_LIQUIDITY_DAI, MetricsAggregatorAvg(), len(prices))
+    assert np.array_equal(vault, metrics.values[Metric.VAULT_LIQUIDITY_DAI][3])
+
+
+def test_paths_end_like_a_simulation_when_the_outcome_is_deterministic():
+    """
+    Traders only hold DAI and always try to open, the DAI vault can lend the principal of ten
+    positions and positions are never closed. With prices fixed until ETH loses 50% at the
+    last tick, all ten positions are liquidated, whatever the order in which they were opened.
+    """
+    periods = 40
+    ethereum_prices = [4000.0] * (periods - 1) + [2000.0]
+
+    vectorized = make_simulation(ethereum_prices, paths=10, traders=4, insurance_liquidity=1000.0, dai_vault=10000.0)
+    vectorized_metrics = vectorized.run()
+
+    ithil = make_ithil(
+        prices={DAI: [1.0] * periods, ETHEREUM: ethereum_prices},
+        vaults={DAI: 10000.0, ETHEREUM: 300.0},
+        insurance_pool={DAI: 1000.0, ETHEREUM: 0.0},
+    )
+    random_stream = RandomStream(0)
+    traders = [
+        Trader(
+            account=Account(f"trader-{n}"),
+            open_position_probability=1.0,
+            close_position_probability=0.0,
+            ithil=ithil,
+            calculate_collateral_usd=lambda oracle, token: 100.0 / oracle.get_price(token),
+            calculate_leverage=lambda: 10.0,
+            liquidity={DAI: 1000.0, ETHEREUM: 0.0},
+            random_stream=random_stream,
+        )
+        for n in range(4)
+    ]
+    metrics = Simulation(clock=ithil.clock, ithil=ithil, traders=traders).run()
+
+    assert metrics.count(Metric.POSITION_OPENED).sum() == 10
+    opened = vectorized_metrics.events[Metric.POSITION_OPENED].sum(axis=1)
+    closed = vectorized_metrics.events[Metric.POSITION_CLOSED]
+    assert np.array_equal(opened, np.full(10, metrics.count(Metric.POSITION_OPENED).sum()))
+    assert np.array_equal(closed.sum(axis=1), np.full(10, metrics.count(Metric.POSITION_CLOSED).sum()))
+    # Every position is closed by the liquidation at the last tick
+    assert np.array_equal(closed[:, -1], np.full(10, metrics.count(Metric.POSITION_CLOSED)[-1]))
+    assert len(ithil.active_positions) == 0 and not vectorized.open_positions.any()
+
+    for column, currency in enumerate(vectorized.currencies):
+        assert np.array_equal(vectorized.vaults[:, column], np.full(10, ithil.vaults[currency]))
+        assert np.array_equal(vectorized.insurance_pool[:, column], np.full(10, ithil.insurance_pool[currency]))
+    # Each liquidation repays 600 DAI and the insurance pool the missing 400 DAI of the first two and a half
+    assert ithil.vaults[DAI] == 10 * 600.0 + 1000.0